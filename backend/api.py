@@ -3,6 +3,8 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+import settings
+from app import dependencies
 from app.repository import connection
 from app.routers import main_router
 from app.service.exception_handlers.exception_handlers import custom_exception_handler
@@ -32,7 +34,10 @@ def create_app() -> FastAPI:
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     connection.init_defaults()
+    await connection.warm_up(settings.DB_POOL_WARMUP_SIZE)
+    dependencies.init()
     yield
+    await dependencies.close()
 
 
 app = create_app()
@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+from typing import Dict
+from typing import Generic
+from typing import Hashable
+from typing import Optional
+from typing import Tuple
+from typing import TypeVar
+
+V = TypeVar("V")
+
+# Stats of every named cache in this process, exported by the metrics router
+_registry: Dict[str, "CacheStats"] = {}
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class TtlLruCache(Generic[V]):
+    """
+    Bounded in-process cache, evicts the least recently used entry once
+    max_size is reached and treats entries older than ttl_seconds as missing.
+    With size_of, it also evicts until the approximate size of all entries is
+    below max_bytes
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: float,
+        max_bytes: Optional[int] = None,
+        size_of: Optional[Callable[[V], int]] = None,
+    ):
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+        if (max_bytes is None) != (size_of is None):
+            raise ValueError("max_bytes and size_of must be set together")
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.bytes = 0
+        self.stats = CacheStats()
+        self._entries: OrderedDict[Hashable, Tuple[float, V, int]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self.delete(key)
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        self.delete(key)
+        size = self.size_of(value) if self.size_of else 0
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value, size)
+        self.bytes += size
+        while len(self._entries) > self.max_size or (
+            self.max_bytes is not None and self.bytes > self.max_bytes
+        ):
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+
+    def delete(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def register_stats(name: str, stats: CacheStats) -> None:
+    _registry[name] = stats
+
+
+def get_all_stats() -> Dict[str, CacheStats]:
+    return dict(_registry)
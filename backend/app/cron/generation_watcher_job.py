@@ -0,0 +1,106 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict
+from uuid import UUID
+
+from app import api_logger
+from app.domain.generation import get_generation_result_use_case
+from app.domain.generation.entities import GenerationOutput
+from app.repository.chat_repository import ChatRepository
+from app.repository.cloud_storage_repository import CloudStorageRepository
+from app.repository.generation_repository import GenerationRepository
+from app.repository.wavespeed_repository import WavespeedRepository
+
+# Generations older than this are abandoned
+MAX_GENERATION_AGE_SECONDS = 3600
+
+MIN_POLL_INTERVAL_SECONDS = 1.0
+MAX_POLL_INTERVAL_SECONDS = 15.0
+POLL_INTERVAL_BACKOFF = 1.5
+
+MAX_CONCURRENT_POLLS = 10
+
+logger = api_logger.get()
+
+
+@dataclass
+class _PollSchedule:
+    next_poll_at: float
+    interval: float
+
+
+# Survives between runs so every generation keeps its own adaptive interval
+_schedules: Dict[UUID, _PollSchedule] = {}
+
+
+async def execute(
+    generation_repository: GenerationRepository,
+    chat_repository: ChatRepository,
+    cloud_storage_repository: CloudStorageRepository,
+    wavespeed_repository: WavespeedRepository,
+) -> None:
+    pending = await generation_repository.get_pending(MAX_GENERATION_AGE_SECONDS)
+    pending_ids = {generation.id for generation in pending}
+    for generation_id in list(_schedules):
+        if generation_id not in pending_ids:
+            del _schedules[generation_id]
+
+    now = time.monotonic()
+    due = [generation for generation in pending if _is_due(generation.id, now)]
+    if not due:
+        return
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_POLLS)
+
+    async def _poll_limited(generation: GenerationOutput) -> None:
+        async with semaphore:
+            await _poll(
+                generation,
+                generation_repository,
+                chat_repository,
+                cloud_storage_repository,
+                wavespeed_repository,
+            )
+
+    await asyncio.gather(*[_poll_limited(generation) for generation in due])
+
+
+def _is_due(generation_id: UUID, now: float) -> bool:
+    schedule = _schedules.get(generation_id)
+    if not schedule:
+        _schedules[generation_id] = _PollSchedule(
+            next_poll_at=now, interval=MIN_POLL_INTERVAL_SECONDS
+        )
+        return True
+    return schedule.next_poll_at <= now
+
+
+async def _poll(
+    generation: GenerationOutput,
+    generation_repository: GenerationRepository,
+    chat_repository: ChatRepository,
+    cloud_storage_repository: CloudStorageRepository,
+    wavespeed_repository: WavespeedRepository,
+) -> None:
+    try:
+        result = await get_generation_result_use_case.refresh(
+            generation,
+            generation_repository,
+            chat_repository,
+            cloud_storage_repository,
+            wavespeed_repository,
+        )
+        if result.status.is_finished:
+            logger.info(f"Generation {generation.id} finished: {result.status}")
+            _schedules.pop(generation.id, None)
+            return
+    except Exception:
+        logger.error(f"Failed to refresh generation {generation.id}", exc_info=True)
+
+    # Most generations finish in a few seconds, back off for the slow ones
+    schedule = _schedules[generation.id]
+    schedule.interval = min(
+        MAX_POLL_INTERVAL_SECONDS, schedule.interval * POLL_INTERVAL_BACKOFF
+    )
+    schedule.next_poll_at = time.monotonic() + schedule.interval
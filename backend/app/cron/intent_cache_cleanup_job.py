@@ -0,0 +1,16 @@
+import settings
+from app import api_logger
+from app.repository.intent_cache_repository import IntentCacheRepository
+
+logger = api_logger.get()
+
+
+async def execute(intent_cache_repository: IntentCacheRepository) -> None:
+    """
+    Deletes shared intent cache entries older than their TTL, every distinct
+    message adds a row otherwise
+    """
+    deleted = await intent_cache_repository.delete_expired(
+        settings.INTENT_CACHE_TTL_SECONDS
+    )
+    logger.debug(f"Deleted {deleted} expired intent cache entries")
@@ -0,0 +1,10 @@
+from app.domain.users.entities import MESSAGE_RATE_LIMIT_TIMEFRAMES
+from app.repository.chat_repository import ChatRepository
+
+
+async def execute(chat_repository: ChatRepository) -> None:
+    """
+    Deletes rate limit counters that no window reads anymore
+    """
+    max_hours = max(rate_limit.hours for rate_limit in MESSAGE_RATE_LIMIT_TIMEFRAMES)
+    await chat_repository.delete_expired_message_counts(max_hours)
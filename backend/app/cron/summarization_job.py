@@ -57,7 +57,7 @@ Updated Combined Memory:
 """
 
 SUMMARIZATION_MODEL = ModelSpec(
-    id=Model.DEFAULT_MODEL,
+    type=Model.DEFAULT_MODEL,
     config=ModelConfig(),
 )
 
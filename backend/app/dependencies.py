@@ -1,69 +1,237 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Dict
+from typing import Optional
+
+from psycopg.conninfo import make_conninfo
+
 import settings
+from app.cache import TtlLruCache
+from app.cache import register_stats
+from app.domain.chat.entities import Model
+from app.domain.users.entities import User
 from app.repository.chat_configuration_repository import ChatConfigurationRepository
+from app.repository.chat_repository import MESSAGE_OVERHEAD_BYTES
+from app.repository.chat_repository import CachedHistory
 from app.repository.chat_repository import ChatRepository
+from app.repository.chat_repository import get_history_size
 from app.repository.connection import get_session_provider
 from app.repository.connection import get_session_provider_read
 from app.repository.file_repository import FileRepository
+from app.repository.intent_cache_repository import IntentCacheRepository
 from app.repository.generation_repository import GenerationRepository
 from app.repository.cloud_storage_repository import CloudStorageRepository
+from app.repository.wavespeed_repository import WavespeedClientConfig
 from app.repository.wavespeed_repository import WavespeedRepository
+from app.repository.llm_hedging import HedgePolicy
 from app.repository.llm_repository import LlmRepository
+from app.repository.llm_router import ProviderRouter
 from app.repository.user_repository import UserRepository
 
 
-def get_file_repository() -> FileRepository:
-    return FileRepository(
-        get_session_provider(),
-        get_session_provider_read(),
+@dataclass
+class Container:
+    """
+    Long-lived repositories and clients shared by every request, so HTTP
+    connection pools and parsed credentials survive between requests
+    """
+
+    file_repository: Optional[FileRepository] = None
+    llm_repository: Optional[LlmRepository] = None
+    user_repository: Optional[UserRepository] = None
+    chat_repository: Optional[ChatRepository] = None
+    chat_configuration_repository: Optional[ChatConfigurationRepository] = None
+    generation_repository: Optional[GenerationRepository] = None
+    wavespeed_repository: Optional[WavespeedRepository] = None
+    cloud_storage_repository: Optional[CloudStorageRepository] = None
+    intent_cache_repository: Optional[IntentCacheRepository] = None
+    user_cache_listener: Optional[asyncio.Task] = None
+    chat_history_listener: Optional[asyncio.Task] = None
+
+
+_container = Container()
+
+
+def init() -> None:
+    """
+    Builds the shared clients up front, the database connections have to be
+    initialized before
+    """
+    get_file_repository()
+    get_llm_repository()
+    get_user_repository()
+    get_chat_repository()
+    get_chat_configuration_repository()
+    get_generation_repository()
+    get_wavespeed_repository()
+    get_intent_cache_repository()
+    if settings.USER_CACHE_NOTIFY:
+        _container.user_cache_listener = asyncio.create_task(
+            get_user_repository().listen_for_invalidations(_get_conninfo())
+        )
+    if settings.CHAT_HISTORY_CACHE_NOTIFY:
+        _container.chat_history_listener = asyncio.create_task(
+            get_chat_repository().listen_for_invalidations(_get_conninfo())
+        )
+    if settings.is_production():
+        # Needs credentials.json, local runs without it build it lazily
+        get_cloud_storage_repository()
+
+
+async def close() -> None:
+    global _container
+    container = _container
+    _container = Container()
+    if container.user_cache_listener:
+        container.user_cache_listener.cancel()
+    if container.chat_history_listener:
+        container.chat_history_listener.cancel()
+    if container.llm_repository:
+        await container.llm_repository.close()
+    if container.wavespeed_repository:
+        await container.wavespeed_repository.close()
+    if container.cloud_storage_repository:
+        await container.cloud_storage_repository.close()
+
+
+def _get_conninfo() -> str:
+    return make_conninfo(
+        host=settings.DB_HOST,
+        port=settings.DB_PORT,
+        dbname=settings.DB_DATABASE,
+        user=settings.DB_USER,
+        password=settings.DB_PASSWORD,
     )
 
 
+def get_file_repository() -> FileRepository:
+    if not _container.file_repository:
+        _container.file_repository = FileRepository(
+            get_session_provider(),
+            get_session_provider_read(),
+        )
+    return _container.file_repository
+
+
 def get_llm_repository() -> LlmRepository:
-    return LlmRepository(
-        api_key=settings.LLM_API_KEY,
-        search_api_key=settings.SERPAPI_API_KEY,
-        base_url=settings.LLM_BASE_URL,
-        fallback_api_key=settings.FALLBACK_LLM_API_KEY,
-        fallback_base_url=settings.FALLBACK_LLM_BASE_URL,
-    )
+    if not _container.llm_repository:
+        _container.llm_repository = LlmRepository(
+            api_key=settings.LLM_API_KEY,
+            search_api_key=settings.SERPAPI_API_KEY,
+            base_url=settings.LLM_BASE_URL,
+            fallback_api_key=settings.FALLBACK_LLM_API_KEY,
+            fallback_base_url=settings.FALLBACK_LLM_BASE_URL,
+            hedge_policies=_get_hedge_policies(),
+            extra_providers=settings.LLM_EXTRA_PROVIDERS,
+            router=ProviderRouter(
+                window=settings.LLM_CIRCUIT_WINDOW,
+                window_seconds=settings.LLM_CIRCUIT_WINDOW_SECONDS,
+                min_calls=settings.LLM_CIRCUIT_MIN_CALLS,
+                error_threshold=settings.LLM_CIRCUIT_ERROR_THRESHOLD,
+                open_seconds=settings.LLM_CIRCUIT_OPEN_SECONDS,
+            ),
+        )
+    return _container.llm_repository
+
+
+def _get_hedge_policies() -> Dict[Model, HedgePolicy]:
+    if not settings.LLM_HEDGING_ENABLED:
+        return {}
+    return {
+        model: HedgePolicy(
+            percentile=settings.LLM_HEDGE_PERCENTILE,
+            budget=model.hedge_budget,
+            initial_delay=settings.LLM_HEDGE_INITIAL_DELAY_SECONDS,
+            min_delay=settings.LLM_HEDGE_MIN_DELAY_SECONDS,
+            max_delay=model.first_token_timeout,
+        )
+        for model in Model
+        if model.hedge_budget > 0
+    }
 
 
 def get_user_repository() -> UserRepository:
-    return UserRepository(
-        get_session_provider(),
-        get_session_provider_read(),
-    )
+    if not _container.user_repository:
+        user_cache: TtlLruCache[User] = TtlLruCache(
+            settings.USER_CACHE_MAX_SIZE, settings.USER_CACHE_TTL_SECONDS
+        )
+        register_stats("user", user_cache.stats)
+        _container.user_repository = UserRepository(
+            get_session_provider(),
+            get_session_provider_read(),
+            cache=user_cache,
+            notify_invalidations=settings.USER_CACHE_NOTIFY,
+        )
+    return _container.user_repository
 
 
 def get_chat_repository() -> ChatRepository:
-    return ChatRepository(
-        get_session_provider(),
-        get_session_provider_read(),
-    )
+    if not _container.chat_repository:
+        history_cache: TtlLruCache[CachedHistory] = TtlLruCache(
+            settings.CHAT_HISTORY_CACHE_MAX_BYTES // MESSAGE_OVERHEAD_BYTES,
+            settings.CHAT_HISTORY_CACHE_TTL_SECONDS,
+            max_bytes=settings.CHAT_HISTORY_CACHE_MAX_BYTES,
+            size_of=get_history_size,
+        )
+        register_stats("chat_history", history_cache.stats)
+        _container.chat_repository = ChatRepository(
+            get_session_provider(),
+            get_session_provider_read(),
+            history_cache=history_cache,
+            history_cache_max_messages=settings.CHAT_HISTORY_WINDOW,
+            notify_invalidations=settings.CHAT_HISTORY_CACHE_NOTIFY,
+        )
+    return _container.chat_repository
 
 
 def get_chat_configuration_repository() -> ChatConfigurationRepository:
-    return ChatConfigurationRepository(
-        get_session_provider(),
-        get_session_provider_read(),
-    )
+    if not _container.chat_configuration_repository:
+        _container.chat_configuration_repository = ChatConfigurationRepository(
+            get_session_provider(),
+            get_session_provider_read(),
+        )
+    return _container.chat_configuration_repository
 
 
 def get_generation_repository() -> GenerationRepository:
-    return GenerationRepository(
-        get_session_provider(),
-        get_session_provider_read(),
-    )
+    if not _container.generation_repository:
+        _container.generation_repository = GenerationRepository(
+            get_session_provider(),
+            get_session_provider_read(),
+        )
+    return _container.generation_repository
 
 
 def get_wavespeed_repository() -> WavespeedRepository:
-    return WavespeedRepository(
-        settings.WAVESPEED_API_KEY,
-    )
+    if not _container.wavespeed_repository:
+        _container.wavespeed_repository = WavespeedRepository(
+            settings.WAVESPEED_API_KEY,
+            WavespeedClientConfig(
+                timeout=settings.WAVESPEED_TIMEOUT,
+                max_connections=settings.WAVESPEED_MAX_CONNECTIONS,
+                max_retries=settings.WAVESPEED_MAX_RETRIES,
+                http2=settings.WAVESPEED_HTTP2,
+            ),
+        )
+    return _container.wavespeed_repository
 
 
 def get_cloud_storage_repository() -> CloudStorageRepository:
-    return CloudStorageRepository(
-        settings.GCS_BUCKET,
-        settings.GOOGLE_CREDENTIALS,
-    )
+    if not _container.cloud_storage_repository:
+        _container.cloud_storage_repository = CloudStorageRepository(
+            settings.GCS_BUCKET,
+            settings.GOOGLE_CREDENTIALS,
+            settings.GCS_UPLOAD_CHUNK_SIZE,
+            max_upload_workers=settings.GCS_UPLOAD_MAX_WORKERS,
+            composite_upload_threshold=settings.GCS_COMPOSITE_UPLOAD_THRESHOLD,
+        )
+    return _container.cloud_storage_repository
+
+
+def get_intent_cache_repository() -> IntentCacheRepository:
+    if not _container.intent_cache_repository:
+        _container.intent_cache_repository = IntentCacheRepository(
+            get_session_provider(),
+            get_session_provider_read(),
+        )
+    return _container.intent_cache_repository
@@ -0,0 +1,98 @@
+import json
+from dataclasses import dataclass
+from dataclasses import replace
+from typing import List
+from typing import Optional
+
+from app import api_logger
+from app.domain.chat import token_counter
+from app.domain.chat.entities import ChatSummary
+from app.domain.chat.entities import Message
+from app.domain.chat.entities import Model
+from app.domain.llm_tools.tools_definition import SEARCH_TOOL_DEFINITION
+
+logger = api_logger.get()
+
+# Rough cost of an attached image, text tokenizers can't count them
+IMAGE_TOKENS = 1280
+# Once history overflows, fold it down to this share of what is left of the
+# budget so the summary isn't rewritten on every turn
+FOLDED_HISTORY_RATIO = 0.5
+
+
+@dataclass
+class LlmContext:
+    # System prompt first, the new turn last
+    messages: List[Message]
+    # Oldest history to fold into the chat summary, in order
+    to_fold: List[Message]
+    tokens: int
+
+
+def execute(
+    messages: List[Message],
+    summary: Optional[ChatSummary],
+    model: Model,
+    image_count: int = 0,
+    is_search_enabled: bool = False,
+) -> LlmContext:
+    """
+    Fits the system prompt, the chat summary, the new turn and as much of the
+    most recent history as the model's prompt budget allows. messages starts
+    with the system prompt, unsaved messages of the new turn come last
+    """
+    system_message = messages[0]
+    if summary:
+        system_message = replace(
+            system_message,
+            content=f"{system_message.content}\n\n"
+            f"Summary of the earlier conversation:\n{summary.summary}",
+        )
+    summarized_until = summary.summarized_until if summary else 0
+    history = [
+        m
+        for m in messages[1:]
+        if m.sequence_number is not None and m.sequence_number > summarized_until
+    ]
+    new_messages = [m for m in messages[1:] if m.sequence_number is None]
+
+    used = token_counter.count_message_tokens(system_message, model)
+    used += sum(token_counter.count_message_tokens(m, model) for m in new_messages)
+    used += image_count * IMAGE_TOKENS
+    if is_search_enabled:
+        used += token_counter.count_tokens(json.dumps(SEARCH_TOOL_DEFINITION), model)
+    if used > model.context_tokens:
+        logger.warning(
+            f"System prompt and new turn take {used} tokens, "
+            f"over the {model.context_tokens} token budget of {model.value}"
+        )
+
+    history_budget = model.context_tokens - used
+    keep_start = retain_start = len(history)
+    history_tokens = 0
+    for i in reversed(range(len(history))):
+        tokens = token_counter.count_message_tokens(history[i], model)
+        if history_tokens + tokens > history_budget:
+            break
+        history_tokens += tokens
+        keep_start = i
+        if history_tokens <= history_budget * FOLDED_HISTORY_RATIO:
+            retain_start = i
+
+    to_fold = []
+    if keep_start > 0:
+        # Never fold a tool call without its results
+        while retain_start < len(history) and history[retain_start].role == "tool":
+            retain_start += 1
+        to_fold = history[:retain_start]
+    kept = history[keep_start:]
+    # Tool results whose tool call didn't fit would be rejected by the LLM
+    while kept and kept[0].role == "tool":
+        history_tokens -= token_counter.count_message_tokens(kept[0], model)
+        kept = kept[1:]
+
+    return LlmContext(
+        messages=[system_message] + kept + new_messages,
+        to_fold=to_fold,
+        tokens=used + history_tokens,
+    )
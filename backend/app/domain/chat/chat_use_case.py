@@ -1,6 +1,9 @@
+import asyncio
 import json
-from copy import deepcopy
+from dataclasses import dataclass
+from dataclasses import replace
 from typing import AsyncGenerator
+from typing import Dict
 from typing import List
 from typing import Optional
 from uuid import UUID
@@ -8,14 +11,19 @@ from uuid import UUID
 from uuid_extensions import uuid7
 
 from app import api_logger
+from app.domain.chat import build_context_use_case
 from app.domain.chat import detect_intent_use_case
 from app.domain.chat import get_system_prompt_use_case
+from app.domain.chat import message_cache
+from app.domain.chat import summarize_chat_use_case
 from app.domain.chat.entities import Chat
 from app.domain.chat.entities import ChatInput
 from app.domain.chat.entities import ChatOutputChunk
+from app.domain.chat.entities import ChatSummary
 from app.domain.chat.entities import ChunkOutput
 from app.domain.chat.entities import ErrorChunk
 from app.domain.chat.entities import BackgroundChunk
+from app.domain.chat.entities import Image
 from app.domain.chat.entities import GenerationChunk
 from app.domain.chat.entities import Intent
 from app.domain.chat.entities import Message
@@ -32,6 +40,7 @@ from app.domain.generation import generate_image_use_case
 from app.domain.llm_tools.search import search_web
 from app.domain.llm_tools.tools_definition import SEARCH_TOOL_DEFINITION
 from app.domain.users import get_rate_limit_error_use_case
+from app.domain.users.entities import MessageQuota
 from app.domain.users.entities import User
 from app.repository.chat_configuration_repository import ChatConfigurationRepository
 from app.repository.chat_repository import ChatRepository
@@ -40,6 +49,7 @@ from app.repository.llm_repository import LlmRepository
 from app.repository.generation_repository import GenerationRepository
 from app.repository.wavespeed_repository import WavespeedRepository
 from app.service import error_responses
+from settings import CHAT_HISTORY_WINDOW
 from settings import SUPPORTED_MODELS
 from app.exceptions import LlmError
 
@@ -48,6 +58,17 @@ logger = api_logger.get()
 MAX_TITLE_LENGTH = 30
 
 
+@dataclass
+class _Preflight:
+    images: List[Image]
+    system_prompt: str
+    messages: List[Message]
+    summary: Optional[ChatSummary]
+    # Last sequence number older than the loaded history window, 0 if the
+    # window reaches back to the start of the chat
+    unloaded_until: int
+
+
 async def execute(
     chat_input: ChatInput,
     user: User,
@@ -57,46 +78,65 @@ async def execute(
     configuration_repository: ChatConfigurationRepository,
     generation_repository: GenerationRepository,
     wavespeed_repository: WavespeedRepository,
+    quotas: List[MessageQuota],
 ) -> AsyncGenerator[ChatOutputChunk, None]:
-    chat = await _get_chat(chat_input, user, chat_repository, configuration_repository)
-    if not chat:
-        yield ErrorChunk(
-            error=error_responses.NotFoundAPIError("chat_id not found.").to_message()
-        )
-        return
-
-    intent = await detect_intent_use_case.execute(chat_input.content, llm_repository)
-    images = await get_images(chat_input.attachment_ids, file_repository)
-    model_type = (
-        Model.THINK_MODEL
-        if chat_input.think_model
-        else Model.VLM_MODEL
-        if images
-        else Model.DEFAULT_MODEL
+    # Intent detection is a full LLM round-trip and only depends on the message
+    # content, so start it before anything else and let it overlap with the DB work
+    intent_task = asyncio.create_task(
+        detect_intent_use_case.execute(chat_input.content, llm_repository)
     )
-    model = ModelSpec(
-        type=model_type,
-        config=ModelConfig(),
-    )
-    if model.type.value not in SUPPORTED_MODELS:
-        yield ErrorChunk(
-            error=f"Unsupported model type, supported model types are {', '.join(SUPPORTED_MODELS.keys())}. But got {model.type.value}"
+    try:
+        chat = await _get_chat(
+            chat_input, user, chat_repository, configuration_repository
         )
-        return
-    if rate_limit_error := await get_rate_limit_error_use_case.execute(
-        user, chat_repository
-    ):
-        yield ErrorChunk(error=rate_limit_error)
-        return
-
-    yield NewChatOutput(
-        chat_id=chat.id,
-    )
+        if not chat:
+            yield ErrorChunk(
+                error=error_responses.NotFoundAPIError(
+                    "chat_id not found."
+                ).to_message()
+            )
+            return
+        if rate_limit_error := get_rate_limit_error_use_case.execute(quotas):
+            yield ErrorChunk(error=rate_limit_error)
+            return
 
-    system_prompt = await get_system_prompt_use_case.execute(
-        chat_input, user, configuration_repository
-    )
-    messages = await _get_existing_messages(chat, system_prompt, chat_repository)
+        preflight = await _run_preflight(
+            chat_input,
+            chat,
+            user,
+            chat_repository,
+            file_repository,
+            configuration_repository,
+        )
+        images = preflight.images
+        model_type = (
+            Model.THINK_MODEL
+            if chat_input.think_model
+            else Model.VLM_MODEL
+            if images
+            else Model.DEFAULT_MODEL
+        )
+        model = ModelSpec(
+            type=model_type,
+            config=ModelConfig(),
+        )
+        if model.type.value not in SUPPORTED_MODELS:
+            yield ErrorChunk(
+                error=f"Unsupported model type, supported model types are {', '.join(SUPPORTED_MODELS.keys())}. But got {model.type.value}"
+            )
+            return
+        yield NewChatOutput(
+            chat_id=chat.id,
+        )
+
+        intent = await intent_task
+    finally:
+        # Cancels the in-flight intent LLM call on every early return
+        if not intent_task.done():
+            intent_task.cancel()
+
+    system_prompt = preflight.system_prompt
+    messages = preflight.messages
     new_messages = await _get_new_messages(chat_input, chat, messages, system_prompt)
 
     match intent:
@@ -123,9 +163,21 @@ async def execute(
             if chat_input.think_model:
                 yield BackgroundChunk(background_processing="Thinking...")
 
-    llm_input_messages = [deepcopy(m) for m in messages]
-    llm_input_messages.extend([deepcopy(m) for m in new_messages])
-
+    context = build_context_use_case.execute(
+        messages + new_messages,
+        preflight.summary,
+        model.type,
+        len(images),
+        chat_input.is_search_enabled or False,
+    )
+    summarize_chat_use_case.schedule(
+        chat.id,
+        preflight.summary,
+        context.to_fold,
+        chat_repository,
+        llm_repository,
+        preflight.unloaded_until,
+    )
     llm_message = Message(
         id=uuid7(),
         chat_id=chat.id,
@@ -135,8 +187,7 @@ async def execute(
         attachment_ids=[],
     )
 
-    messages_to_llm = [m.to_llm_ready_dict() for m in llm_input_messages[:-1]]
-    messages_to_llm.append(llm_input_messages[-1].to_llm_ready_dict_with_images(images))
+    messages_to_llm = _get_messages_to_llm(context.messages, images)
 
     try:
         while True:
@@ -250,6 +301,16 @@ async def execute(
         )
 
 
+def _get_messages_to_llm(messages: List[Message], images: List[Image]) -> List[Dict]:
+    """
+    Payloads of the history are shared from the message cache, nothing on this
+    path copies or mutates them
+    """
+    messages_to_llm = [message_cache.get_llm_ready_dict(m) for m in messages[:-1]]
+    messages_to_llm.append(messages[-1].to_llm_ready_dict_with_images(images))
+    return messages_to_llm
+
+
 async def _get_new_messages(
     chat_input: ChatInput,
     chat: Chat,
@@ -315,12 +376,78 @@ async def _create_chat(
     )
 
 
-async def _get_existing_messages(
+async def _run_preflight(
+    chat_input: ChatInput,
+    chat: Chat,
+    user: User,
+    chat_repository: ChatRepository,
+    file_repository: FileRepository,
+    configuration_repository: ChatConfigurationRepository,
+) -> _Preflight:
+    """
+    Loads everything a chat turn needs before calling the LLM concurrently,
+    every repository call uses its own session so they don't block each other
+    """
+    images, system_prompt, messages, summary = await asyncio.gather(
+        get_images(chat_input.attachment_ids, file_repository),
+        get_system_prompt_use_case.execute(chat_input, user, configuration_repository),
+        _get_stored_messages(chat_input, chat, chat_repository),
+        _get_summary(chat_input, chat, chat_repository),
+    )
+    return _Preflight(
+        images=images,
+        system_prompt=system_prompt,
+        messages=_apply_system_prompt(chat, messages, system_prompt),
+        summary=summary,
+        unloaded_until=_get_unloaded_until(messages),
+    )
+
+
+def _get_unloaded_until(messages: List[Message]) -> int:
+    if len(messages) < CHAT_HISTORY_WINDOW:
+        return 0
+    return messages[0].sequence_number - 1
+
+
+async def _get_stored_messages(
+    chat_input: ChatInput,
     chat: Chat,
-    system_prompt: str,
     chat_repository: ChatRepository,
 ) -> List[Message]:
-    messages = await chat_repository.get_messages(chat.id)
-    if messages and messages[0].role == "system":
-        messages[0].content = system_prompt
-    return messages
+    if not chat_input.chat_id:
+        # Chat was just created, nothing to load
+        return []
+    # Only the newest messages go to the LLM, older ones are never loaded
+    return await chat_repository.get_latest_messages(chat.id, CHAT_HISTORY_WINDOW)
+
+
+async def _get_summary(
+    chat_input: ChatInput,
+    chat: Chat,
+    chat_repository: ChatRepository,
+) -> Optional[ChatSummary]:
+    if not chat_input.chat_id:
+        return None
+    return await chat_repository.get_summary(chat.id)
+
+
+def _apply_system_prompt(
+    chat: Chat, messages: List[Message], system_prompt: str
+) -> List[Message]:
+    if not messages:
+        return messages
+    if messages[0].role == "system":
+        # Messages may be shared through the history cache, don't modify them
+        return [replace(messages[0], content=system_prompt)] + messages[1:]
+    # The window cut off the stored system prompt, tool results whose tool
+    # call got cut off too would be rejected by the LLM
+    while messages and messages[0].role == "tool":
+        messages = messages[1:]
+    system_message = Message(
+        id=uuid7(),
+        chat_id=chat.id,
+        role="system",
+        content=system_prompt,
+        attachment_ids=[],
+    )
+    return [system_message] + messages
@@ -1,10 +1,23 @@
+from typing import Optional
+
+import settings
+from app import api_logger
+from app import dependencies
+from app.cache import register_stats
+from app.domain.chat import intent_classifier
+from app.domain.chat.intent_cache import IntentCache
 from app.domain.chat.entities import ChunkOutput
 from app.domain.chat.entities import Intent
 from app.domain.chat.entities import Model
 from app.domain.chat.entities import ModelConfig
 from app.domain.chat.entities import ModelSpec
+from app.exceptions import LlmError
 from app.repository.llm_repository import LlmRepository
-from app.dependencies import get_llm_repository
+
+logger = api_logger.get()
+
+_classifier = intent_classifier.get_default_classifier()
+_cache: Optional[IntentCache] = None
 
 PROMPT_TEMPLATE = """
 You are a helpful assistant that can detect the intent of a message. Respond only with the intent.
@@ -22,7 +35,33 @@ Return the intent as a string.
 async def execute(
     message: str,
     llm_repository: LlmRepository,
+    classifier: Optional[intent_classifier.IntentClassifier] = None,
+    threshold: float = settings.INTENT_CLASSIFIER_THRESHOLD,
+    cache: Optional[IntentCache] = None,
 ) -> Intent:
+    prediction = (classifier or _classifier).classify(message)
+    if prediction and prediction.confidence >= threshold:
+        return prediction.intent
+
+    cache = cache or _get_cache()
+    if intent := await cache.get(message):
+        return intent
+    logger.debug(f"Intent classifier not confident ({prediction}), asking the LLM")
+    try:
+        intent = await _detect_with_llm(message, llm_repository)
+    except LlmError as e:
+        logger.warning(f"Intent detection failed, using default: {e.message}")
+        return Intent.DEFAULT
+    if not intent:
+        return Intent.DEFAULT
+    await cache.set(message, intent)
+    return intent
+
+
+async def _detect_with_llm(
+    message: str,
+    llm_repository: LlmRepository,
+) -> Optional[Intent]:
     # get all enum values as a string
     intents = [intent.value for intent in Intent]
     prompt = PROMPT_TEMPLATE.format(intents="\n\t".join(intents), message=message)
@@ -37,11 +76,41 @@ async def execute(
         if isinstance(chunk, ChunkOutput) and chunk.content:
             response += chunk.content
 
-    intent = Intent(response)
+    intent = _parse_intent(response)
+    if not intent:
+        logger.warning(f"Could not parse intent from LLM response: {response!r}")
     return intent
 
 
+def _parse_intent(response: str) -> Optional[Intent]:
+    value = response.strip().strip("\"'`.").lower()
+    try:
+        return Intent(value)
+    except ValueError:
+        pass
+    # The model sometimes wraps the intent in a sentence
+    matches = [intent for intent in Intent if intent.value in value]
+    if len(matches) == 1:
+        return matches[0]
+    return None
+
+
+def _get_cache() -> IntentCache:
+    global _cache
+    if not _cache:
+        _cache = IntentCache(
+            settings.INTENT_CACHE_MAX_SIZE,
+            settings.INTENT_CACHE_TTL_SECONDS,
+            dependencies.get_intent_cache_repository()
+            if settings.INTENT_CACHE_SHARED
+            else None,
+        )
+        register_stats("intent", _cache.stats)
+        register_stats("intent_shared", _cache.shared_stats)
+    return _cache
+
+
 if __name__ == "__main__":
     import asyncio
 
-    asyncio.run(execute("Draw a monkey", get_llm_repository()))
+    asyncio.run(execute("Draw a monkey", dependencies.get_llm_repository()))
@@ -7,6 +7,7 @@ from typing import Dict
 from typing import List
 from typing import Literal
 from typing import Optional
+from typing import Tuple
 from uuid import UUID
 
 from settings import SUPPORTED_MODELS
@@ -21,6 +22,13 @@ class Chat:
     created_at: datetime
 
 
+@dataclass
+class ChatSummary:
+    summary: str
+    # Messages up to and including this one are folded into the summary
+    summarized_until: int
+
+
 @dataclass
 class ChatInput:
     chat_id: Optional[UUID]
@@ -121,7 +129,7 @@ class Image:
     base64_data: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Message:
     id: UUID
     chat_id: UUID
@@ -132,6 +140,7 @@ class Message:
     model: Optional[str] = None
     tool_call: Optional[ToolCall] = None
     tool_calls: Optional[List[ToolCall]] = None
+    sequence_number: Optional[int] = None
 
     def to_llm_ready_dict(self) -> Dict:
         content = [{"type": "text", "text": self.content}]
@@ -187,6 +196,8 @@ class ChatConfiguration(ChatConfigurationInput):
 class ChatDetails(Chat):
     messages: List[Message]
     configuration: Optional[ChatConfiguration]
+    # Set when older messages exist, fetch them with before_sequence_number
+    next_before_sequence_number: Optional[int] = None
 
 
 @dataclass
@@ -217,14 +228,16 @@ class Model(Enum):
         return self.value
 
     @property
-    def timeout(self) -> int:
-        if self == Model.DEFAULT_MODEL:
-            return 20
-        elif self == Model.THINK_MODEL:
-            return 20
-        elif self == Model.VLM_MODEL:
-            return 30
-        return 20
+    def first_token_timeout(self) -> float:
+        return SUPPORTED_MODELS[self.value]["first_token_timeout"]
+
+    @property
+    def idle_timeout(self) -> float:
+        return SUPPORTED_MODELS[self.value]["idle_timeout"]
+
+    @property
+    def total_timeout(self) -> float:
+        return SUPPORTED_MODELS[self.value]["total_timeout"]
 
     @property
     def primary_model(self) -> str:
@@ -234,6 +247,28 @@ class Model(Enum):
     def fallback_model(self) -> str:
         return SUPPORTED_MODELS[self.value]["fallback"]
 
+    @property
+    def tokenizer(self) -> str:
+        return SUPPORTED_MODELS[self.value]["tokenizer"]
+
+    @property
+    def context_tokens(self) -> int:
+        return SUPPORTED_MODELS[self.value]["context_tokens"]
+
+    @property
+    def providers(self) -> List[Tuple[str, str]]:
+        """
+        (provider, model id) pairs in order of preference
+        """
+        return [
+            ("primary", self.primary_model),
+            ("fallback", self.fallback_model),
+        ] + SUPPORTED_MODELS[self.value]["extra_providers"]
+
+    @property
+    def hedge_budget(self) -> float:
+        return SUPPORTED_MODELS[self.value]["hedge_budget"]
+
 
 @dataclass
 class ModelConfig:
@@ -257,6 +292,13 @@ class Intent(Enum):
         return self.value
 
 
+@dataclass
+class IntentPrediction:
+    intent: Intent
+    # 0..1, how sure the classifier is about the intent
+    confidence: float
+
+
 @dataclass
 class ChatConfigurationSummary(ChatConfiguration):
     user_profile_id: UUID
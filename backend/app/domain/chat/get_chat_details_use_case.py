@@ -1,10 +1,15 @@
+from typing import List
+from typing import Optional
 from uuid import UUID
 
 from app.domain.chat.entities import ChatDetails
+from app.domain.chat.entities import Message
 from app.domain.users.entities import User
 from app.repository.chat_configuration_repository import ChatConfigurationRepository
 from app.repository.chat_repository import ChatRepository
 from app.service import error_responses
+from settings import CHAT_HISTORY_MAX_PAGE_SIZE
+from settings import CHAT_HISTORY_PAGE_SIZE
 
 
 async def execute(
@@ -12,11 +17,28 @@ async def execute(
     user: User,
     chat_repository: ChatRepository,
     configuration_repository: ChatConfigurationRepository,
+    limit: Optional[int] = None,
+    before_sequence_number: Optional[int] = None,
 ) -> ChatDetails:
+    """
+    A page of the newest messages, or the whole history when the client
+    passes neither limit nor cursor, as it did before paging
+    """
     chat = await chat_repository.get(chat_id)
     if not chat:
         raise error_responses.NotFoundAPIError()
-    messages = await chat_repository.get_messages(chat.id)
+    next_before_sequence_number = None
+    if limit is None and before_sequence_number is None:
+        messages = await _get_all_messages(chat.id, chat_repository)
+    else:
+        limit = limit or CHAT_HISTORY_PAGE_SIZE
+        # One extra row tells if there is an older page
+        messages = await chat_repository.get_latest_messages(
+            chat.id, limit + 1, before_sequence_number
+        )
+        if len(messages) > limit:
+            messages = messages[1:]
+            next_before_sequence_number = messages[0].sequence_number
     configuration = None
     if chat.configuration_id:
         # None
@@ -31,4 +53,23 @@ async def execute(
         created_at=chat.created_at,
         messages=messages,
         configuration=configuration,
+        next_before_sequence_number=next_before_sequence_number,
     )
+
+
+async def _get_all_messages(
+    chat_id: UUID, chat_repository: ChatRepository
+) -> List[Message]:
+    """
+    Reads the history newest page first, each page is a bounded keyset query
+    """
+    messages: List[Message] = []
+    before_sequence_number = None
+    while True:
+        page = await chat_repository.get_latest_messages(
+            chat_id, CHAT_HISTORY_MAX_PAGE_SIZE, before_sequence_number
+        )
+        messages = page + messages
+        if len(page) < CHAT_HISTORY_MAX_PAGE_SIZE:
+            return messages
+        before_sequence_number = page[0].sequence_number
@@ -0,0 +1,75 @@
+import hashlib
+import re
+from typing import Optional
+
+from app import api_logger
+from app.cache import CacheStats
+from app.cache import TtlLruCache
+from app.domain.chat.entities import Intent
+from app.repository.intent_cache_repository import IntentCacheRepository
+
+logger = api_logger.get()
+
+
+class IntentCache:
+    """
+    Detected intents keyed by the normalized message, an in-process LRU tier in
+    front of an optional shared tier so other workers can reuse the result
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: int,
+        shared_repository: Optional[IntentCacheRepository] = None,
+    ):
+        self._local: TtlLruCache[Intent] = TtlLruCache(max_size, ttl_seconds)
+        self._shared_repository = shared_repository
+        self.ttl_seconds = ttl_seconds
+        self.shared_stats = CacheStats()
+
+    @property
+    def stats(self) -> CacheStats:
+        return self._local.stats
+
+    async def get(self, message: str) -> Optional[Intent]:
+        key = get_key(message)
+        if intent := self._local.get(key):
+            return intent
+        if not self._shared_repository:
+            return None
+        try:
+            value = await self._shared_repository.get(key, self.ttl_seconds)
+        except Exception:
+            logger.warning("Failed to read shared intent cache", exc_info=True)
+            return None
+        intent = _to_intent(value)
+        if not intent:
+            self.shared_stats.misses += 1
+            return None
+        self.shared_stats.hits += 1
+        self._local.set(key, intent)
+        return intent
+
+    async def set(self, message: str, intent: Intent) -> None:
+        key = get_key(message)
+        self._local.set(key, intent)
+        if not self._shared_repository:
+            return
+        try:
+            await self._shared_repository.upsert(key, intent.value)
+        except Exception:
+            logger.warning("Failed to write shared intent cache", exc_info=True)
+
+
+def get_key(message: str) -> str:
+    # "Draw a cat!" and "draw a  cat" should share an entry
+    normalized = " ".join(re.findall(r"\w+", message.lower()))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _to_intent(value: Optional[str]) -> Optional[Intent]:
+    try:
+        return Intent(value) if value else None
+    except ValueError:
+        return None
@@ -0,0 +1,205 @@
+import math
+import re
+from abc import ABC
+from abc import abstractmethod
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from app.domain.chat.entities import Intent
+from app.domain.chat.entities import IntentPrediction
+
+CREATE_VERBS = (
+    r"(draw|paint|sketch|illustrate|generate|create|make|render|design|produce|imagine)"
+)
+IMAGE_NOUNS = r"(image|images|picture|pictures|pic|photo|photos|drawing|painting|illustration|logo|portrait|artwork|art|wallpaper|sketch|icon|poster|meme|cartoon|comic)"
+# What a user shows to ask about, "the art of war" isn't an attachment
+SHOWN_NOUNS = r"(image|images|picture|pictures|pic|photo|photos|screenshot|drawing|painting|chart|diagram)"
+# "draw a conclusion" or "draw me a bath" isn't a request for an image
+FIGURATIVE_OBJECTS = r"(conclusions?|comparisons?|parallels?|distinctions?|lessons?|lines?|attention|inspiration|bath|breath|blanks?|curtains?|blood|fire|crowds?|lots|straws?|cards?|salary|pints?|water)"
+VIDEO_NOUNS = r"(video|videos|animation|animated|clip|gif|movie|film)"
+# The request starts with the verb, "write code to make a photo gallery" doesn't
+REQUEST_START = r"^\s*(please\s+)?((can|could|would|will)\s+you\s+(please\s+)?)?"
+# The verb, an article and at most two adjectives before the noun
+DIRECT_OBJECT = r"\s+(me\s+|us\s+)?(a|an|the|some|\d+)?\s*(\w+\s+){0,2}?"
+# What follows the noun when it's the object and not part of a compound like
+# "image classifier", "video player" or "picture-perfect"
+OBJECT_END = r"(?=\s*$|\s*[.!?,]|\s+(of|for|with|about|showing|depicting|where|that)\b)"
+# Software and how-to requests mention the same nouns, the LLM decides those
+TECHNICAL_TERMS = r"\b(apps?|application|component|classifier|generator|gallery|player|website|webpage|plugin|library|script|code|function|api|program|bot|dataset)\b"
+TOOLS = r"\bin\s+(figma|photoshop|illustrator|canva|gimp|blender|react|vue|python|javascript|typescript|css|html|unity|excel|powerpoint)\b"
+HOW_TO = r"^\s*how\s+(do|can|should|would|to)\b"
+
+
+class IntentClassifier(ABC):
+    @abstractmethod
+    def classify(self, message: str) -> Optional[IntentPrediction]:
+        """
+        Returns None when the classifier has no opinion about the message
+        """
+        pass
+
+
+@dataclass
+class IntentRule:
+    intent: Intent
+    pattern: str
+    confidence: float
+
+
+DEFAULT_RULES: List[IntentRule] = [
+    IntentRule(
+        intent=Intent.DEFAULT,
+        pattern=rf"{TECHNICAL_TERMS}|{TOOLS}|{HOW_TO}",
+        confidence=0.5,
+    ),
+    IntentRule(
+        intent=Intent.VIDEO_GENERATION,
+        pattern=rf"{REQUEST_START}{CREATE_VERBS}{DIRECT_OBJECT}{VIDEO_NOUNS}{OBJECT_END}",
+        confidence=0.9,
+    ),
+    IntentRule(
+        intent=Intent.IMAGE_GENERATION,
+        pattern=rf"{REQUEST_START}{CREATE_VERBS}{DIRECT_OBJECT}{IMAGE_NOUNS}{OBJECT_END}",
+        confidence=0.9,
+    ),
+    IntentRule(
+        intent=Intent.IMAGE_GENERATION,
+        pattern=rf"{REQUEST_START}(draw|paint|sketch|illustrate)\s+(me\s+|us\s+)?(a|an|the|some|my|our|\d+)\s+(?!{FIGURATIVE_OBJECTS}\b)",
+        confidence=0.9,
+    ),
+    IntentRule(
+        intent=Intent.IMAGE_COMPREHENSION,
+        pattern=rf"\b(what|describe|explain|identify|read|analy[sz]e|caption)\b.*\b(this|that|the|attached|my)\s+{SHOWN_NOUNS}\b",
+        confidence=0.85,
+    ),
+    IntentRule(
+        intent=Intent.IMAGE_COMPREHENSION,
+        pattern=r"\bwhat\s+(do|can)\s+you\s+see\b",
+        confidence=0.85,
+    ),
+    IntentRule(
+        intent=Intent.DEFAULT,
+        pattern=r"^\s*(hi|hello|hey|yo|thanks|thank you|ok|okay|cool|great|continue|go on|yes|no)\b[\s!.?]*$",
+        confidence=0.99,
+    ),
+]
+
+
+class RuleIntentClassifier(IntentClassifier):
+    """
+    Keyword and regex rules, the first matching rule wins
+    """
+
+    def __init__(self, rules: List[IntentRule]):
+        self._rules = [
+            (re.compile(rule.pattern, re.IGNORECASE | re.DOTALL), rule)
+            for rule in rules
+        ]
+
+    def classify(self, message: str) -> Optional[IntentPrediction]:
+        for pattern, rule in self._rules:
+            if pattern.search(message):
+                return IntentPrediction(intent=rule.intent, confidence=rule.confidence)
+        return None
+
+
+DEFAULT_EXAMPLES: Dict[Intent, List[str]] = {
+    Intent.DEFAULT: [
+        "what is the capital of france",
+        "help me write an email to my boss",
+        "explain how photosynthesis works",
+        "tell me a joke",
+        "how do i fix this python error",
+    ],
+    Intent.IMAGE_COMPREHENSION: [
+        "what is in this picture",
+        "describe the image i sent",
+        "what does the screenshot say",
+        "can you read the text in this photo",
+    ],
+    Intent.IMAGE_GENERATION: [
+        "draw a cat wearing a hat",
+        "generate an image of a sunset over the sea",
+        "make me a picture of a dragon",
+        "create a logo for my bakery",
+    ],
+    Intent.VIDEO_GENERATION: [
+        "make a video of a dog running on the beach",
+        "generate a short animation of a rocket launch",
+        "create a clip of waves crashing",
+    ],
+}
+
+
+class VectorIntentClassifier(IntentClassifier):
+    """
+    Small offline bag-of-words model, picks the intent whose example centroid
+    is closest to the message by cosine similarity
+    """
+
+    def __init__(self, examples: Dict[Intent, List[str]]):
+        self._centroids: Dict[Intent, Counter] = {}
+        self._norms: Dict[Intent, float] = {}
+        for intent, texts in examples.items():
+            centroid = Counter()
+            for text in texts:
+                centroid.update(_tokenize(text))
+            self._centroids[intent] = centroid
+            self._norms[intent] = _norm(centroid)
+
+    def classify(self, message: str) -> Optional[IntentPrediction]:
+        tokens = Counter(_tokenize(message))
+        message_norm = _norm(tokens)
+        if not message_norm:
+            return None
+        scores = {
+            intent: _dot(tokens, centroid) / (message_norm * self._norms[intent])
+            for intent, centroid in self._centroids.items()
+            if self._norms[intent]
+        }
+        total = sum(scores.values())
+        if not total:
+            return None
+        intent = max(scores, key=scores.get)
+        return IntentPrediction(intent=intent, confidence=scores[intent] / total)
+
+
+class ChainIntentClassifier(IntentClassifier):
+    """
+    Asks each classifier in order and returns the first answer
+    """
+
+    def __init__(self, classifiers: List[IntentClassifier]):
+        self._classifiers = classifiers
+
+    def classify(self, message: str) -> Optional[IntentPrediction]:
+        for classifier in self._classifiers:
+            if prediction := classifier.classify(message):
+                return prediction
+        return None
+
+
+def get_default_classifier() -> IntentClassifier:
+    return ChainIntentClassifier(
+        [
+            RuleIntentClassifier(DEFAULT_RULES),
+            VectorIntentClassifier(DEFAULT_EXAMPLES),
+        ]
+    )
+
+
+def _tokenize(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def _dot(a: Counter, b: Counter) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return float(sum(count * b[token] for token, count in a.items()))
+
+
+def _norm(vector: Counter) -> float:
+    return math.sqrt(sum(count * count for count in vector.values()))
@@ -0,0 +1,35 @@
+from typing import Dict
+
+import settings
+from app.cache import TtlLruCache
+from app.cache import register_stats
+from app.domain.chat.entities import Message
+
+# Stored messages never change, the TTL only bounds how long unused ones stay
+MESSAGE_CACHE_TTL_SECONDS = 86400
+
+# Token counts keyed by tokenizer and message id
+tokens: TtlLruCache[int] = TtlLruCache(
+    settings.MESSAGE_CACHE_MAX_SIZE, MESSAGE_CACHE_TTL_SECONDS
+)
+register_stats("message_tokens", tokens.stats)
+
+_llm_dicts: TtlLruCache[Dict] = TtlLruCache(
+    settings.MESSAGE_CACHE_MAX_SIZE, MESSAGE_CACHE_TTL_SECONDS
+)
+register_stats("message_llm_dicts", _llm_dicts.stats)
+
+
+def get_llm_ready_dict(message: Message) -> Dict:
+    """
+    Builds the LLM payload of a message once and shares it between turns,
+    callers must not modify it. System messages get the latest system prompt
+    written into them, so they are always rebuilt
+    """
+    if message.role == "system":
+        return message.to_llm_ready_dict()
+    llm_dict = _llm_dicts.get(message.id)
+    if llm_dict is None:
+        llm_dict = message.to_llm_ready_dict()
+        _llm_dicts.set(message.id, llm_dict)
+    return llm_dict
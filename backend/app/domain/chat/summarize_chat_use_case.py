@@ -0,0 +1,152 @@
+import asyncio
+from typing import Dict
+from typing import List
+from typing import Optional
+from uuid import UUID
+
+from app import api_logger
+from app.domain.chat import token_counter
+from app.domain.chat.entities import ChatSummary
+from app.domain.chat.entities import Message
+from app.domain.chat.entities import Model
+from app.domain.chat.entities import ModelConfig
+from app.domain.chat.entities import ModelSpec
+from app.repository.chat_repository import ChatRepository
+from app.repository.llm_repository import LlmRepository
+
+CHAT_SUMMARY_PROMPT = """
+You are maintaining a running summary of a conversation between a user and an AI assistant. The oldest messages no longer fit in the assistant's memory, so the summary is all it will know about them.
+
+Update the existing summary with the new messages. Keep facts about the user, decisions, open questions, names, numbers and anything the assistant promised. Leave out small talk. Keep it concise and write it as notes, not as a dialogue.
+
+---
+
+Existing Summary:
+{{summary}}
+
+New Messages:
+{{messages}}
+
+---
+
+Updated Summary:
+"""
+
+SUMMARY_MODEL = ModelSpec(
+    type=Model.DEFAULT_MODEL,
+    config=ModelConfig(),
+)
+# Share of the summary model's budget the folded messages may take per call
+FOLD_BUDGET_RATIO = 0.5
+# Messages older than the history window loaded per fold
+UNLOADED_BATCH_SIZE = 100
+
+logger = api_logger.get()
+
+# At most one fold per chat in this process, the next turn picks up the rest
+_in_flight: Dict[UUID, asyncio.Task] = {}
+
+
+def schedule(
+    chat_id: UUID,
+    summary: Optional[ChatSummary],
+    messages: List[Message],
+    chat_repository: ChatRepository,
+    llm_repository: LlmRepository,
+    unloaded_until: int = 0,
+) -> None:
+    """
+    Folds messages into the chat summary in the background, the turn that
+    overflowed the context doesn't wait for it. Messages up to unloaded_until
+    were left out of the prompt without being loaded, they are folded first
+    """
+    summarized_until = summary.summarized_until if summary else 0
+    if (not messages and unloaded_until <= summarized_until) or chat_id in _in_flight:
+        return
+    task = asyncio.create_task(
+        execute(
+            chat_id,
+            summary,
+            messages,
+            chat_repository,
+            llm_repository,
+            unloaded_until,
+        )
+    )
+    _in_flight[chat_id] = task
+    task.add_done_callback(lambda _: _in_flight.pop(chat_id, None))
+
+
+async def execute(
+    chat_id: UUID,
+    summary: Optional[ChatSummary],
+    messages: List[Message],
+    chat_repository: ChatRepository,
+    llm_repository: LlmRepository,
+    unloaded_until: int = 0,
+) -> Optional[ChatSummary]:
+    try:
+        messages = await _get_unsummarized_messages(
+            chat_id, summary, messages, chat_repository, unloaded_until
+        )
+    except Exception:
+        logger.error(f"Failed to load messages to summarize: {chat_id}", exc_info=True)
+        return None
+    budget = SUMMARY_MODEL.type.context_tokens * FOLD_BUDGET_RATIO
+    lines = []
+    summarized_until = None
+    for message in messages:
+        line = f"{message.role}: {message.content}"
+        # Tool calls and search results don't belong in the summary
+        if message.role in ("user", "assistant") and message.content:
+            budget -= token_counter.count_message_tokens(message, SUMMARY_MODEL.type)
+            if budget < 0 and lines:
+                break
+            lines.append(line)
+        summarized_until = message.sequence_number
+    if summarized_until is None:
+        return None
+    prompt = CHAT_SUMMARY_PROMPT.replace(
+        "{{summary}}", summary.summary if summary else "None yet."
+    ).replace("{{messages}}", "\n".join(lines))
+    try:
+        updated_summary = await llm_repository.completion_nostream(
+            [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": prompt},
+            ],
+            SUMMARY_MODEL,
+        )
+        if not updated_summary:
+            return None
+        chat_summary = ChatSummary(
+            summary=updated_summary, summarized_until=summarized_until
+        )
+        await chat_repository.upsert_summary(chat_id, chat_summary)
+        return chat_summary
+    except Exception:
+        logger.error(f"Failed to summarize chat: {chat_id}", exc_info=True)
+    return None
+
+
+async def _get_unsummarized_messages(
+    chat_id: UUID,
+    summary: Optional[ChatSummary],
+    messages: List[Message],
+    chat_repository: ChatRepository,
+    unloaded_until: int,
+) -> List[Message]:
+    """
+    Messages between the summary and the history window were never loaded,
+    without them the summary would skip part of the chat
+    """
+    summarized_until = summary.summarized_until if summary else 0
+    if unloaded_until <= summarized_until:
+        return messages
+    unloaded = await chat_repository.get_messages_after(
+        chat_id, summarized_until, unloaded_until, UNLOADED_BATCH_SIZE
+    )
+    if len(unloaded) == UNLOADED_BATCH_SIZE:
+        # More are left, the next turns fold them before the newer ones
+        return unloaded
+    return unloaded + messages
@@ -0,0 +1,61 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from tokenizers import Tokenizer
+
+import settings
+from app import api_logger
+from app.domain.chat import message_cache
+from app.domain.chat.entities import Message
+from app.domain.chat.entities import Model
+
+logger = api_logger.get()
+
+# Role markers and separators the chat template adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Used without a tokenizer file, overestimates so the budget still holds
+FALLBACK_BYTES_PER_TOKEN = 3
+
+
+@lru_cache
+def _get_tokenizer(name: str) -> Optional[Tokenizer]:
+    path = Path(settings.TOKENIZERS_DIR) / f"{name}.json"
+    try:
+        return Tokenizer.from_file(str(path))
+    except Exception:
+        # Cached, so this is logged once per tokenizer and process
+        logger.warning(
+            f"Tokenizer {path} not loaded, token counts of {name} are estimated "
+            "from the byte length"
+        )
+        return None
+
+
+def count_tokens(text: str, model: Model) -> int:
+    if not text:
+        return 0
+    tokenizer = _get_tokenizer(model.tokenizer)
+    if tokenizer is None:
+        return len(text.encode()) // FALLBACK_BYTES_PER_TOKEN + 1
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def count_message_tokens(message: Message, model: Model) -> int:
+    """
+    Counts are cached per tokenizer and message, except for system messages
+    which get the latest system prompt written into them
+    """
+    key = (model.tokenizer, message.id)
+    if message.role != "system":
+        count = message_cache.tokens.get(key)
+        if count is not None:
+            return count
+    text = message.content or ""
+    if message.tool_calls:
+        text += json.dumps([tc.to_serializable_dict() for tc in message.tool_calls])
+    count = count_tokens(text, model) + MESSAGE_OVERHEAD_TOKENS
+    if message.role != "system":
+        message_cache.tokens.set(key, count)
+    return count
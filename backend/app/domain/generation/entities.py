@@ -18,6 +18,10 @@ class GenerationStatus(Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+    @property
+    def is_finished(self) -> bool:
+        return self in (GenerationStatus.COMPLETED, GenerationStatus.FAILED)
+
 
 @dataclass
 class GenerationInput:
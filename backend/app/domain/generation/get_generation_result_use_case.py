@@ -1,11 +1,13 @@
+import asyncio
 import os
+from typing import Dict
 from uuid import UUID
 from urllib.parse import urlparse, unquote
 
-import httpx
 from uuid_extensions import uuid7
 
 import settings
+from app import api_logger
 from app.domain.chat.entities import Message
 from app.domain.generation.entities import GenerationOutput
 from app.domain.generation.entities import GenerationStatus
@@ -17,6 +19,11 @@ from app.service import error_responses
 
 IMAGES_FOLDER = "images"
 
+logger = api_logger.get()
+
+# Refreshes currently running in this process, concurrent callers share them
+_in_flight: Dict[UUID, asyncio.Task] = {}
+
 
 async def execute(
     generation_id: UUID,
@@ -28,36 +35,82 @@ async def execute(
     generation = await repository.get(generation_id)
     if not generation:
         raise error_responses.NotFoundAPIError("Generation not found")
+    return await refresh(
+        generation,
+        repository,
+        chat_repository,
+        cloud_storage_repository,
+        wavespeed_repository,
+    )
+
+
+async def refresh(
+    generation: GenerationOutput,
+    repository: GenerationRepository,
+    chat_repository: ChatRepository,
+    cloud_storage_repository: CloudStorageRepository,
+    wavespeed_repository: WavespeedRepository,
+) -> GenerationOutput:
+    """
+    Fetches the latest state of an already loaded generation from Wavespeed
+    and finalizes it once it has completed
+    """
     if generation.status == GenerationStatus.COMPLETED:
         return generation
-    response = await wavespeed_repository.get_result(generation.data["wavespeed_id"])
-    if response.status == "completed" and response.url:
-        response.url = await upload_to_gcp(response.url, cloud_storage_repository)
-        if generation.chat_id:
-            # add assistant chat message with image url
-            await chat_repository.insert_messages(
-                [
-                    Message(
-                        id=uuid7(),
-                        attachment_ids=[],
-                        chat_id=generation.chat_id,
-                        role="assistant",
-                        content="",
-                        image_url=response.url,
-                    )
-                ]
+    task = _in_flight.get(generation.id)
+    if not task:
+        task = asyncio.create_task(
+            _refresh(
+                generation,
+                repository,
+                chat_repository,
+                cloud_storage_repository,
+                wavespeed_repository,
             )
+        )
+        _in_flight[generation.id] = task
+        task.add_done_callback(lambda t: _forget(generation.id, t))
+    # A disconnecting caller must not cancel the refresh other callers wait on
+    return await asyncio.shield(task)
 
-    await repository.update(
-        generation_id, GenerationStatus(response.status), response.url
-    )
+
+def _forget(generation_id: UUID, task: asyncio.Task) -> None:
+    if _in_flight.get(generation_id) is task:
+        del _in_flight[generation_id]
+
+
+async def _refresh(
+    generation: GenerationOutput,
+    repository: GenerationRepository,
+    chat_repository: ChatRepository,
+    cloud_storage_repository: CloudStorageRepository,
+    wavespeed_repository: WavespeedRepository,
+) -> GenerationOutput:
+    generation_id = generation.id
+    response = await wavespeed_repository.get_result(generation.data["wavespeed_id"])
+    status = GenerationStatus(response.status)
+    if status == GenerationStatus.COMPLETED and response.url:
+        # Deterministic object name, a repeated upload overwrites the same blob
+        response.url = await upload_to_gcp(
+            response.url,
+            generation_id,
+            cloud_storage_repository,
+            wavespeed_repository,
+        )
+        # Only the caller that flips the status finalizes, across all processes
+        if await repository.complete(generation_id, response.url):
+            await _insert_message(generation, response.url, repository, chat_repository)
+        else:
+            logger.info(f"Generation {generation_id} was already finalized")
+    else:
+        await repository.update(generation_id, status, response.url)
     return GenerationOutput(
         id=generation_id,
         user_id=generation.user_id,
         chat_id=generation.chat_id,
         type=generation.type,
         prompt=generation.prompt,
-        status=GenerationStatus(response.status),
+        status=status,
         url=response.url,
         data=generation.data,
         created_at=generation.created_at,
@@ -65,25 +118,55 @@ async def execute(
     )
 
 
+async def _insert_message(
+    generation: GenerationOutput,
+    url: str,
+    repository: GenerationRepository,
+    chat_repository: ChatRepository,
+) -> None:
+    if not generation.chat_id:
+        return
+    try:
+        # add assistant chat message with image url
+        await chat_repository.insert_messages(
+            [
+                Message(
+                    id=uuid7(),
+                    attachment_ids=[],
+                    chat_id=generation.chat_id,
+                    role="assistant",
+                    content="",
+                    image_url=url,
+                )
+            ]
+        )
+    except Exception:
+        # Release the claim so the next refresh finalizes it again
+        await repository.reopen(generation.id)
+        raise
+
+
 async def upload_to_gcp(
-    download_url: str, cloud_storage_repository: CloudStorageRepository
+    download_url: str,
+    file_id: UUID,
+    cloud_storage_repository: CloudStorageRepository,
+    wavespeed_repository: WavespeedRepository,
 ) -> str:
     # don't reupload to GCP if we are in local environment
     parsed_url = urlparse(download_url)
     original_image_name = unquote(parsed_url.path.split("/")[-1])
-    new_image_name = await _generate_filename(original_image_name)
+    new_image_name = _generate_filename(file_id, original_image_name)
     if not settings.is_production():
         return download_url
 
-    async with httpx.AsyncClient() as session:
-        response = await session.get(download_url)
-        response.raise_for_status()
-        image_data = response.read()
-        return await cloud_storage_repository.upload_blob_to_gcs(
-            image_data, f"{IMAGES_FOLDER}/{new_image_name}"
+    async with wavespeed_repository.stream_output(download_url) as response:
+        return await cloud_storage_repository.upload_stream_to_gcs(
+            response.aiter_bytes(),
+            f"{IMAGES_FOLDER}/{new_image_name}",
+            response.headers.get("content-type"),
         )
 
 
-async def _generate_filename(original_filename: str) -> str:
+def _generate_filename(file_id: UUID, original_filename: str) -> str:
     _, extension = os.path.splitext(original_filename)
-    return f"{uuid7()}{extension}"
+    return f"{file_id}{extension}"
@@ -22,6 +22,32 @@ MESSAGE_RATE_LIMIT_TIMEFRAMES: List[MessageRateLimit] = [
 ]
 
 
+@dataclass(frozen=True)
+class MessageCountBucket:
+    """User messages sent in the hour starting at start"""
+
+    start: datetime
+    count: int
+
+
+@dataclass(frozen=True)
+class MessageQuota:
+    rate_limit: MessageRateLimit
+    limit: int
+    used: int
+    # When the oldest counted messages leave the window
+    reset_at: Optional[datetime]
+
+    @property
+    def remaining(self) -> int:
+        # used is counted before the request, one at the limit is still allowed
+        return max(0, self.limit + 1 - self.used)
+
+    @property
+    def is_exceeded(self) -> bool:
+        return not self.remaining
+
+
 class BillingPlan(str, Enum):
     FREE = "FREE"
 
@@ -32,7 +58,7 @@ class BillingPlan(str, Enum):
         return 0
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class User:
     uid: UUID
     email: Optional[str] = None
@@ -1,28 +1,57 @@
+from datetime import datetime
+from datetime import timedelta
+from typing import List
 from typing import Optional
 
 from app.domain.users.entities import MESSAGE_RATE_LIMIT_TIMEFRAMES
+from app.domain.users.entities import MessageCountBucket
+from app.domain.users.entities import MessageQuota
 from app.domain.users.entities import MessageRateLimit
 from app.domain.users.entities import User
 from app.repository.chat_repository import ChatRepository
+from app.repository.chat_repository import get_bucket_start
+from app.repository.utils import utcnow
 
 
-async def execute(
+def execute(quotas: List[MessageQuota]) -> Optional[str]:
+    for quota in quotas:
+        if quota.is_exceeded:
+            return f"Maximum message count exceeded for the {quota.rate_limit.unit}, the limit is {quota.limit} messages."
+    return None
+
+
+async def get_quotas(
     user: User,
     chat_repository: ChatRepository,
-) -> Optional[str]:
-    for rate_limit in MESSAGE_RATE_LIMIT_TIMEFRAMES:
-        if error := await _get_error(user, chat_repository, rate_limit):
-            return error
-    return None
+) -> List[MessageQuota]:
+    """
+    Remaining messages for every rate limit window, read from the hourly
+    counters with a single query
+    """
+    max_hours = max(rate_limit.hours for rate_limit in MESSAGE_RATE_LIMIT_TIMEFRAMES)
+    buckets = await chat_repository.get_user_message_counts(user.uid, max_hours)
+    now = utcnow()
+    return [
+        _get_quota(user, rate_limit, buckets, now)
+        for rate_limit in MESSAGE_RATE_LIMIT_TIMEFRAMES
+    ]
 
 
-async def _get_error(
-    user: User, chat_repository: ChatRepository, rate_limit: MessageRateLimit
-) -> Optional[str]:
-    user_message_count = await chat_repository.get_message_count_by_user(
-        user.uid, hours_back=rate_limit.hours
+def _get_quota(
+    user: User,
+    rate_limit: MessageRateLimit,
+    buckets: List[MessageCountBucket],
+    now: datetime,
+) -> MessageQuota:
+    # The bucket the window starts in is counted in full
+    window_start = get_bucket_start(now) - timedelta(hours=rate_limit.hours - 1)
+    counted = [bucket for bucket in buckets if bucket.start >= window_start]
+    return MessageQuota(
+        rate_limit=rate_limit,
+        limit=user.billing_plan.get_max_user_message_count(rate_limit),
+        used=sum(bucket.count for bucket in counted),
+        # The oldest counted bucket drops out of the window after this
+        reset_at=counted[0].start + timedelta(hours=rate_limit.hours)
+        if counted
+        else None,
     )
-    max_user_messages = user.billing_plan.get_max_user_message_count(rate_limit)
-    if user_message_count > max_user_messages:
-        return f"Maximum message count exceeded for the {rate_limit.unit}, the limit is {max_user_messages} messages."
-    return None
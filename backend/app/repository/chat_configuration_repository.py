@@ -4,12 +4,12 @@ from typing import List
 from typing import Optional
 from uuid import UUID
 
-import sqlalchemy
 
 from app.domain.chat.entities import ChatConfiguration
 from app.domain.chat.entities import ChatConfigurationInput
 from app.domain.chat.entities import ChatConfigurationSummary
 from app.domain.chat.entities import Message
+from app.repository import query
 from app.repository.connection import SessionProvider
 from app.repository.utils import utcnow
 from uuid_extensions import uuid7
@@ -157,7 +157,7 @@ class ChatConfigurationRepository:
             "last_updated_at": utc_now,
         }
         async with self._session_provider.get() as session:
-            await session.execute(sqlalchemy.text(SQL_INSERT), data)
+            await session.execute(query.text(SQL_INSERT), data)
             await session.commit()
         return configuration_id
 
@@ -174,7 +174,7 @@ class ChatConfigurationRepository:
             "last_updated_at": utc_now,
         }
         async with self._session_provider.get() as session:
-            await session.execute(sqlalchemy.text(SQL_UPDATE), data)
+            await session.execute(query.text(SQL_UPDATE), data)
             await session.commit()
         return configuration_id
 
@@ -183,9 +183,7 @@ class ChatConfigurationRepository:
             "user_id": user_id,
         }
         async with self._session_provider_read.get() as session:
-            result = await session.execute(
-                sqlalchemy.text(SQL_GET_LATEST_BY_USER), data
-            )
+            result = await session.execute(query.text(SQL_GET_LATEST_BY_USER), data)
             row = result.first()
             if row:
                 return ChatConfiguration(
@@ -205,9 +203,7 @@ class ChatConfigurationRepository:
             "user_id": user_id,
         }
         async with self._session_provider_read.get() as session:
-            result = await session.execute(
-                sqlalchemy.text(SQL_GET_BY_ID_AND_USER), data
-            )
+            result = await session.execute(query.text(SQL_GET_BY_ID_AND_USER), data)
             row = result.first()
             if row:
                 return ChatConfigurationSummary(
@@ -235,7 +231,7 @@ class ChatConfigurationRepository:
         results = []
         async with self._session_provider_read.get() as session:
             rows = await session.execute(
-                sqlalchemy.text(SQL_GET_CHARACTERS_NEEDING_SUMMARIZATION), data
+                query.text(SQL_GET_CHARACTERS_NEEDING_SUMMARIZATION), data
             )
             for row in rows:
                 results.append(
@@ -263,7 +259,7 @@ class ChatConfigurationRepository:
         results = []
         async with self._session_provider_read.get() as session:
             rows = await session.execute(
-                sqlalchemy.text(SQL_GET_MESSAGES_BY_CONFIGURATION), data
+                query.text(SQL_GET_MESSAGES_BY_CONFIGURATION), data
             )
             for row in rows:
                 results.append(
@@ -296,5 +292,5 @@ class ChatConfigurationRepository:
             "last_updated_at": utc_now,
         }
         async with self._session_provider.get() as session:
-            await session.execute(sqlalchemy.text(SQL_UPSERT_SUMMARY), data)
+            await session.execute(query.text(SQL_UPSERT_SUMMARY), data)
             await session.commit()
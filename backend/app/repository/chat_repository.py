@@ -1,15 +1,23 @@
+from dataclasses import dataclass
+from dataclasses import replace
+from datetime import datetime
+from datetime import timedelta
 from typing import List
 from typing import Optional
 from uuid import UUID
+from uuid import uuid4
 import json
 
-import sqlalchemy
 from uuid_extensions import uuid7
 
 from app.domain.chat.entities import Chat
+from app.domain.chat.entities import ChatSummary
 from app.domain.chat.entities import Message
 from app.domain.chat.entities import ToolCall
-from app.repository import utils
+from app.cache import TtlLruCache
+from app.domain.users.entities import MessageCountBucket
+from app.repository import notifications
+from app.repository import query
 from app.repository.connection import SessionProvider
 from app.repository.utils import utcnow
 
@@ -86,8 +94,64 @@ INSERT INTO message (
 );
 """
 
-SQL_GET_MESSAGES = """
-SELECT 
+SQL_ALLOCATE_SEQUENCE_NUMBERS = """
+WITH allocated AS (
+    UPDATE chat
+    SET last_sequence_number = last_sequence_number + :count
+    WHERE id = :chat_id
+    RETURNING user_profile_id, last_sequence_number
+), counted AS (
+    INSERT INTO user_message_count (
+        user_profile_id,
+        bucket_start,
+        count,
+        created_at,
+        last_updated_at
+    )
+    SELECT
+        user_profile_id,
+        :bucket_start,
+        :user_message_count,
+        :created_at,
+        :created_at
+    FROM allocated
+    WHERE :user_message_count > 0
+    ON CONFLICT (user_profile_id, bucket_start)
+    DO UPDATE SET
+        count = user_message_count.count + EXCLUDED.count,
+        last_updated_at = EXCLUDED.last_updated_at
+)
+SELECT last_sequence_number FROM allocated;
+"""
+
+SQL_GET_LATEST_MESSAGES = """
+SELECT *
+FROM (
+    SELECT
+        id,
+        chat_id,
+        role,
+        content,
+        image_url,
+        model,
+        tool_call_id,
+        tool_name,
+        tool_calls,
+        sequence_number,
+        attachment_ids,
+        created_at
+    FROM message
+    WHERE
+        chat_id = :chat_id
+        AND sequence_number < :before_sequence_number
+    ORDER BY sequence_number DESC
+    LIMIT :limit
+) latest
+ORDER BY sequence_number;
+"""
+
+SQL_GET_MESSAGES_AFTER = """
+SELECT
     id,
     chat_id,
     role,
@@ -101,28 +165,104 @@ SELECT
     attachment_ids,
     created_at
 FROM message
-WHERE chat_id = :chat_id
-ORDER BY sequence_number;
+WHERE
+    chat_id = :chat_id
+    AND sequence_number > :after_sequence_number
+    AND sequence_number <= :until_sequence_number
+ORDER BY sequence_number
+LIMIT :limit;
 """
 
-SQL_GET_MESSAGE_COUNT_BY_USER = """
-SELECT 
-    COUNT(m.id) AS count
-FROM message m
-LEFT JOIN chat c ON m.chat_id = c.id
-WHERE 
-    c.user_profile_id = :user_id
-    AND m.role = 'user'
-    AND m.id > :min_message_id;
+SQL_GET_USER_MESSAGE_COUNTS = """
+SELECT
+    bucket_start,
+    count
+FROM user_message_count
+WHERE
+    user_profile_id = :user_id
+    AND bucket_start >= :min_bucket_start
+ORDER BY bucket_start;
+"""
+
+SQL_GET_SUMMARY = """
+SELECT
+    summary,
+    summarized_until_sequence_number
+FROM chat_summary
+WHERE chat_id = :chat_id;
+"""
+
+SQL_UPSERT_SUMMARY = """
+INSERT INTO chat_summary (
+    id,
+    chat_id,
+    summary,
+    summarized_until_sequence_number,
+    created_at,
+    last_updated_at
+) VALUES (
+    :id,
+    :chat_id,
+    :summary,
+    :summarized_until_sequence_number,
+    :created_at,
+    :last_updated_at
+) ON CONFLICT (chat_id)
+DO UPDATE SET
+    summary = EXCLUDED.summary,
+    summarized_until_sequence_number = EXCLUDED.summarized_until_sequence_number,
+    last_updated_at = EXCLUDED.last_updated_at
+WHERE
+    chat_summary.summarized_until_sequence_number
+    < EXCLUDED.summarized_until_sequence_number;
+"""
+
+SQL_DELETE_EXPIRED_MESSAGE_COUNTS = """
+DELETE FROM user_message_count
+WHERE bucket_start < :min_bucket_start;
 """
 
 
+SQL_NOTIFY_HISTORY_CHANGED = """
+SELECT pg_notify(:channel, :payload);
+"""
+
+# message.sequence_number is a 32-bit integer
+MAX_SEQUENCE_NUMBER = 2**31 - 1
+# Postgres channel used to invalidate cached chat histories in every worker
+HISTORY_INVALIDATION_CHANNEL = "chat_history_invalidated"
+# Rough per-message cost of the entity and its fields next to the text
+MESSAGE_OVERHEAD_BYTES = 600
+
+
+@dataclass
+class CachedHistory:
+    # Consecutive newest messages of a chat, oldest first
+    messages: List[Message]
+    # messages start from the first message of the chat
+    is_complete: bool
+
+
+def get_history_size(history: CachedHistory) -> int:
+    return sum(MESSAGE_OVERHEAD_BYTES + len(m.content or "") for m in history.messages)
+
+
 class ChatRepository:
     def __init__(
-        self, session_provider: SessionProvider, session_provider_read: SessionProvider
+        self,
+        session_provider: SessionProvider,
+        session_provider_read: SessionProvider,
+        history_cache: Optional[TtlLruCache[CachedHistory]] = None,
+        history_cache_max_messages: int = 1000,
+        notify_invalidations: bool = False,
     ):
         self._session_provider = session_provider
         self._session_provider_read = session_provider_read
+        self._history_cache = history_cache
+        self._history_cache_max_messages = history_cache_max_messages
+        self._notify_invalidations = notify_invalidations
+        # Tells this instance's own notifications apart from other workers'
+        self._instance_id = uuid4().hex
 
     async def insert(
         self, user_id: UUID, title: str, configuration_id: Optional[UUID]
@@ -144,7 +284,7 @@ class ChatRepository:
             "last_updated_at": utc_now,
         }
         async with self._session_provider.get() as session:
-            await session.execute(sqlalchemy.text(SQL_INSERT), data)
+            await session.execute(query.text(SQL_INSERT), data)
             await session.commit()
         return chat
 
@@ -153,7 +293,7 @@ class ChatRepository:
             "id": chat_id,
         }
         async with self._session_provider_read.get() as session:
-            result = await session.execute(sqlalchemy.text(SQL_GET), data)
+            result = await session.execute(query.text(SQL_GET), data)
             row = result.first()
             if row:
                 return Chat(
@@ -171,7 +311,7 @@ class ChatRepository:
         }
         chats = []
         async with self._session_provider_read.get() as session:
-            rows = await session.execute(sqlalchemy.text(SQL_GET_BY_USER), data)
+            rows = await session.execute(query.text(SQL_GET_BY_USER), data)
             for row in rows:
                 chats.append(
                     Chat(
@@ -185,21 +325,27 @@ class ChatRepository:
         return chats
 
     async def insert_messages(self, messages: List[Message]) -> None:
+        if not messages:
+            return
         utc_now = utcnow()
 
-        # Get the current max sequence number for this chat
         async with self._session_provider.get() as session:
+            # The counter row stays locked until commit, so concurrent turns on
+            # the same chat get consecutive, non-overlapping sequence numbers.
+            # The user's rate limit counter is bumped in the same statement.
             result = await session.execute(
-                sqlalchemy.text(
-                    "SELECT COALESCE(MAX(sequence_number), 0) FROM message WHERE chat_id = :chat_id"
-                ),
-                {"chat_id": messages[0].chat_id},
+                query.text(SQL_ALLOCATE_SEQUENCE_NUMBERS),
+                {
+                    "chat_id": messages[0].chat_id,
+                    "count": len(messages),
+                    "user_message_count": sum(m.role == "user" for m in messages),
+                    "bucket_start": get_bucket_start(utc_now),
+                    "created_at": utc_now,
+                },
             )
-            current_max = result.scalar() or 0
-
-        async with self._session_provider.get() as session:
-            for i, message in enumerate(messages, start=1):
-                data = {
+            first_sequence_number = result.scalar_one() - len(messages) + 1
+            data = [
+                {
                     "id": message.id,
                     "chat_id": message.chat_id,
                     "role": message.role,
@@ -215,60 +361,261 @@ class ChatRepository:
                     )
                     if message.tool_calls
                     else None,
-                    "sequence_number": current_max + i,
+                    "sequence_number": first_sequence_number + i,
                     "attachment_ids": message.attachment_ids,
                     "created_at": utc_now,
                     "last_updated_at": utc_now,
                 }
-                await session.execute(sqlalchemy.text(SQL_INSERT_MESSAGE), data)
+                for i, message in enumerate(messages)
+            ]
+            # A list of parameters runs as one executemany, pipelined by psycopg
+            await session.execute(query.text(SQL_INSERT_MESSAGE), data)
+            if self._notify_invalidations:
+                # Delivered to listeners only once the messages commit
+                await session.execute(
+                    query.text(SQL_NOTIFY_HISTORY_CHANGED),
+                    {
+                        "channel": HISTORY_INVALIDATION_CHANNEL,
+                        "payload": f"{self._instance_id} {messages[0].chat_id}",
+                    },
+                )
             await session.commit()
+        self._append_to_history(
+            messages[0].chat_id,
+            [
+                replace(message, sequence_number=first_sequence_number + i)
+                for i, message in enumerate(messages)
+            ],
+        )
+
+    async def get_latest_messages(
+        self,
+        chat_id: UUID,
+        limit: int,
+        before_sequence_number: Optional[int] = None,
+    ) -> List[Message]:
+        """
+        Up to limit newest messages sent before before_sequence_number, oldest
+        first. Seeks on the (chat_id, sequence_number) index, so a page costs
+        the same no matter how long the chat is
+        """
+        before_sequence_number = before_sequence_number or MAX_SEQUENCE_NUMBER
+        if self._history_cache is not None:
+            history = self._history_cache.get(chat_id)
+            if history is not None:
+                messages = [
+                    m
+                    for m in history.messages
+                    if m.sequence_number < before_sequence_number
+                ]
+                if len(messages) >= limit or history.is_complete:
+                    return messages[-limit:]
 
-    async def get_messages(self, chat_id: UUID) -> List[Message]:
         data = {
             "chat_id": chat_id,
+            "before_sequence_number": before_sequence_number,
+            "limit": limit,
         }
-        messages = []
         async with self._session_provider_read.get() as session:
-            rows = await session.execute(sqlalchemy.text(SQL_GET_MESSAGES), data)
-            for row in rows:
-                tool_calls = None
-                if row.tool_calls:
-                    tool_calls_data = json.loads(row.tool_calls)
-                    tool_calls = [
-                        ToolCall(id=tc["id"], function=tc["function"])
-                        for tc in tool_calls_data
-                    ]
-
-                tool_call = None
-                if row.tool_call_id and row.tool_name:
-                    tool_call = ToolCall(
-                        id=row.tool_call_id, function={"name": row.tool_name}
-                    )
+            result = await session.execute(query.text(SQL_GET_LATEST_MESSAGES), data)
+            messages = MESSAGE_MAPPER.all(result)
+        if (
+            self._history_cache is not None
+            and before_sequence_number == MAX_SEQUENCE_NUMBER
+        ):
+            self._history_cache.set(
+                chat_id,
+                CachedHistory(
+                    messages=messages[-self._history_cache_max_messages :],
+                    is_complete=len(messages) < limit
+                    and len(messages) <= self._history_cache_max_messages,
+                ),
+            )
+        return list(messages)
 
-                messages.append(
-                    Message(
-                        id=row.id,
-                        chat_id=row.chat_id,
-                        role=row.role,
-                        content=row.content,
-                        image_url=row.image_url,
-                        model=row.model,
-                        tool_call=tool_call,
-                        tool_calls=tool_calls,
-                        attachment_ids=row.attachment_ids,
-                    )
-                )
-        return messages
+    async def get_messages_after(
+        self,
+        chat_id: UUID,
+        after_sequence_number: int,
+        until_sequence_number: int,
+        limit: int,
+    ) -> List[Message]:
+        """
+        Up to limit oldest messages after after_sequence_number, up to and
+        including until_sequence_number, oldest first
+        """
+        data = {
+            "chat_id": chat_id,
+            "after_sequence_number": after_sequence_number,
+            "until_sequence_number": until_sequence_number,
+            "limit": limit,
+        }
+        async with self._session_provider_read.get() as session:
+            result = await session.execute(query.text(SQL_GET_MESSAGES_AFTER), data)
+            return MESSAGE_MAPPER.all(result)
+
+    def _append_to_history(self, chat_id: UUID, messages: List[Message]) -> None:
+        """
+        Write-through of inserted messages, so the next turn reads its own
+        writes even while the read replica lags
+        """
+        if self._history_cache is None:
+            return
+        history = self._history_cache.get(chat_id)
+        first_sequence_number = messages[0].sequence_number
+        if history is None:
+            if first_sequence_number == 1:
+                history = CachedHistory(messages=[], is_complete=True)
+            else:
+                return
+        last_sequence_number = (
+            history.messages[-1].sequence_number if history.messages else 0
+        )
+        if last_sequence_number + 1 != first_sequence_number:
+            # Messages were added elsewhere in between, the cache has a gap
+            self._history_cache.delete(chat_id)
+            return
+        history_messages = history.messages + messages
+        is_complete = history.is_complete
+        if len(history_messages) > self._history_cache_max_messages:
+            history_messages = history_messages[-self._history_cache_max_messages :]
+            is_complete = False
+        self._history_cache.set(
+            chat_id, CachedHistory(messages=history_messages, is_complete=is_complete)
+        )
+
+    async def listen_for_invalidations(self, conninfo: str) -> None:
+        """
+        Drops cached histories of chats other workers added messages to, runs
+        until cancelled
+        """
+
+        def _on_notify(payload: str) -> None:
+            instance_id, chat_id = payload.split(" ")
+            if instance_id != self._instance_id:
+                self._history_cache.delete(UUID(chat_id))
 
-    async def get_message_count_by_user(
-        self, user_id: UUID, hours_back: int = 24
-    ) -> int:
-        data = {"user_id": user_id, "min_message_id": utils.historic_uuid(hours_back)}
+        await notifications.listen(
+            conninfo,
+            HISTORY_INVALIDATION_CHANNEL,
+            on_notify=_on_notify,
+            on_connect=self._history_cache.clear,
+        )
+
+    async def get_summary(self, chat_id: UUID) -> Optional[ChatSummary]:
+        data = {
+            "chat_id": chat_id,
+        }
         async with self._session_provider_read.get() as session:
-            result = await session.execute(
-                sqlalchemy.text(SQL_GET_MESSAGE_COUNT_BY_USER), data
-            )
+            result = await session.execute(query.text(SQL_GET_SUMMARY), data)
             row = result.first()
             if row:
-                return row.count
-        return 0
+                return ChatSummary(
+                    summary=row.summary,
+                    summarized_until=row.summarized_until_sequence_number,
+                )
+        return None
+
+    async def upsert_summary(self, chat_id: UUID, summary: ChatSummary) -> None:
+        """
+        Never replaces a summary that already covers more of the chat
+        """
+        utc_now = utcnow()
+        data = {
+            "id": uuid7(),
+            "chat_id": chat_id,
+            "summary": summary.summary,
+            "summarized_until_sequence_number": summary.summarized_until,
+            "created_at": utc_now,
+            "last_updated_at": utc_now,
+        }
+        async with self._session_provider.get() as session:
+            await session.execute(query.text(SQL_UPSERT_SUMMARY), data)
+            await session.commit()
+
+    async def get_user_message_counts(
+        self, user_id: UUID, hours_back: int
+    ) -> List[MessageCountBucket]:
+        """
+        Hourly user message counters covering the last hours_back hours
+        """
+        data = {
+            "user_id": user_id,
+            "min_bucket_start": get_bucket_start(utcnow())
+            - timedelta(hours=hours_back),
+        }
+        async with self._session_provider_read.get() as session:
+            rows = await session.execute(query.text(SQL_GET_USER_MESSAGE_COUNTS), data)
+            return [
+                MessageCountBucket(start=row.bucket_start, count=row.count)
+                for row in rows
+            ]
+
+    async def delete_expired_message_counts(self, hours_back: int) -> None:
+        data = {
+            "min_bucket_start": get_bucket_start(utcnow())
+            - timedelta(hours=hours_back),
+        }
+        async with self._session_provider.get() as session:
+            await session.execute(query.text(SQL_DELETE_EXPIRED_MESSAGE_COUNTS), data)
+            await session.commit()
+
+
+def get_bucket_start(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _to_message(
+    id: UUID,
+    chat_id: UUID,
+    role: str,
+    content: Optional[str],
+    image_url: Optional[str],
+    model: Optional[str],
+    tool_call_id: Optional[str],
+    tool_name: Optional[str],
+    tool_calls_json: Optional[str],
+    attachment_ids: List[UUID],
+    sequence_number: int,
+) -> Message:
+    tool_calls = None
+    if tool_calls_json:
+        tool_calls = [
+            ToolCall(id=tc["id"], function=tc["function"])
+            for tc in json.loads(tool_calls_json)
+        ]
+
+    tool_call = None
+    if tool_call_id and tool_name:
+        tool_call = ToolCall(id=tool_call_id, function={"name": tool_name})
+
+    return Message(
+        id,
+        chat_id,
+        role,
+        attachment_ids,
+        content,
+        image_url,
+        model,
+        tool_call,
+        tool_calls,
+        sequence_number,
+    )
+
+
+MESSAGE_MAPPER = query.RowMapper(
+    _to_message,
+    [
+        "id",
+        "chat_id",
+        "role",
+        "content",
+        "image_url",
+        "model",
+        "tool_call_id",
+        "tool_name",
+        "tool_calls",
+        "attachment_ids",
+        "sequence_number",
+    ],
+)
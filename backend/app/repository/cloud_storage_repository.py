@@ -1,6 +1,14 @@
 import asyncio
+import math
 import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import AsyncIterator
+from typing import List
+from typing import Optional
 
+import httpx
 from app import api_logger
 from google.cloud import storage
 from google.cloud.storage import Bucket
@@ -8,10 +16,51 @@ from google.oauth2 import service_account
 
 logger = api_logger.get()
 
+# Resumable upload chunks have to be a multiple of 256 KiB
+DEFAULT_UPLOAD_CHUNK_SIZE = 4 * 256 * 1024
+DEFAULT_MAX_UPLOAD_WORKERS = 8
+# Blobs at least this big are uploaded as parallel parts and composed
+DEFAULT_COMPOSITE_UPLOAD_THRESHOLD = 32 * 1024 * 1024
+# GCS compose accepts at most 32 source objects
+MAX_COMPOSE_SOURCES = 32
+UPLOAD_TIMEOUT_SECONDS = 60
+# GCS answers a chunk that isn't the last one with 308 Resume Incomplete
+RESUME_INCOMPLETE = 308
+
+
+@dataclass
+class GcsUpload:
+    data: bytes
+    gcs_path: str
+    content_type: Optional[str] = None
+
 
 class CloudStorageRepository:
-    def __init__(self, bucket_name: str, credentials_file_path: str):
+    def __init__(
+        self,
+        bucket_name: str,
+        credentials_file_path: str,
+        upload_chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE,
+        storage_client: Optional[storage.Client] = None,
+        max_upload_workers: int = DEFAULT_MAX_UPLOAD_WORKERS,
+        composite_upload_threshold: int = DEFAULT_COMPOSITE_UPLOAD_THRESHOLD,
+    ):
+        if upload_chunk_size % (256 * 1024):
+            raise ValueError("upload_chunk_size must be a multiple of 256 KiB")
         self.bucket_name = bucket_name
+        self.upload_chunk_size = upload_chunk_size
+        self.composite_upload_threshold = composite_upload_threshold
+        # Blocking GCS calls get their own bounded pool so uploads can't starve
+        # the default executor used by asyncio.to_thread
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_upload_workers, thread_name_prefix="gcs-upload"
+        )
+        # Resumable session URLs carry their own authorization
+        self.http_client = httpx.AsyncClient(timeout=UPLOAD_TIMEOUT_SECONDS)
+
+        if storage_client:
+            self.storage_client = storage_client
+            return
 
         if not os.path.exists(credentials_file_path):
             raise FileNotFoundError(
@@ -23,14 +72,180 @@ class CloudStorageRepository:
         )
         self.storage_client = storage.Client(credentials=credentials)
 
-    async def upload_blob_to_gcs(self, data: bytes, gcs_path: str) -> str:
+    async def close(self) -> None:
+        await self.http_client.aclose()
+        self.executor.shutdown(wait=True)
+
+    async def upload_blob_to_gcs(
+        self, data: bytes, gcs_path: str, content_type: Optional[str] = None
+    ) -> str:
         """
         Uploads a bytes blob (e.g., image or video) to GCS at the specified path.
         Optionally sets the content type.
         Returns the public URL of the uploaded file.
         """
+        if len(data) >= self.composite_upload_threshold:
+            return await self.upload_composite_to_gcs(data, gcs_path, content_type)
+        await self._run(self._upload, data, gcs_path, content_type)
+        return self._get_public_url(gcs_path)
+
+    async def upload_blobs_to_gcs(self, uploads: List[GcsUpload]) -> List[str]:
+        """
+        Uploads several blobs concurrently, bounded by the upload pool.
+        Returns the public URLs in the same order.
+        """
+        return list(
+            await asyncio.gather(
+                *[
+                    self.upload_blob_to_gcs(
+                        upload.data, upload.gcs_path, upload.content_type
+                    )
+                    for upload in uploads
+                ]
+            )
+        )
+
+    async def upload_composite_to_gcs(
+        self,
+        data: bytes,
+        gcs_path: str,
+        content_type: Optional[str] = None,
+        part_size: Optional[int] = None,
+    ) -> str:
+        """
+        Uploads the parts of a big blob in parallel and composes them into
+        one object, the temporary parts are deleted afterwards.
+        Returns the public URL of the uploaded file.
+        """
+        part_size = max(
+            part_size or self.upload_chunk_size,
+            math.ceil(len(data) / MAX_COMPOSE_SOURCES),
+        )
+        part_paths = []
+        part_uploads = []
+        for i, offset in enumerate(range(0, len(data), part_size)):
+            part_path = f"{gcs_path}.parts/{i}"
+            part_paths.append(part_path)
+            part_uploads.append(
+                self._run(self._upload_part, data, offset, part_size, part_path)
+            )
+        try:
+            await asyncio.gather(*part_uploads)
+            await self._run(self._compose, part_paths, gcs_path, content_type)
+        finally:
+            await self._run(self._delete, part_paths)
+        return self._get_public_url(gcs_path)
+
+    async def upload_stream_to_gcs(
+        self,
+        chunks: AsyncIterator[bytes],
+        gcs_path: str,
+        content_type: Optional[str] = None,
+    ) -> str:
+        """
+        Pipes a byte stream into a resumable GCS upload, at most about two
+        upload chunks are held in memory regardless of the total size.
+        Returns the public URL of the uploaded file.
+        """
         bucket: Bucket = self.storage_client.bucket(self.bucket_name)
-        blob = bucket.blob(gcs_path)
+        # A session of our own, so a failed upload can be cancelled
+        session_url = await self._run(
+            partial(
+                bucket.blob(gcs_path).create_resumable_upload_session,
+                content_type=content_type,
+                checksum=None,
+            )
+        )
+        buffer = bytearray()
+        offset = 0
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                while len(buffer) >= self.upload_chunk_size:
+                    data = bytes(buffer[: self.upload_chunk_size])
+                    del buffer[: self.upload_chunk_size]
+                    await self._put_chunk(session_url, data, offset, None)
+                    offset += len(data)
+            # Sends the last chunk and finalizes the object
+            await self._put_chunk(
+                session_url, bytes(buffer), offset, offset + len(buffer)
+            )
+        except BaseException:
+            await self._cancel_upload(session_url, gcs_path)
+            raise
+        return self._get_public_url(gcs_path)
+
+    async def _put_chunk(
+        self, session_url: str, data: bytes, offset: int, total: Optional[int]
+    ) -> None:
+        """
+        Sends a chunk of a resumable upload, total is only known for the last one
+        """
+        size = "*" if total is None else str(total)
+        content_range = (
+            f"bytes {offset}-{offset + len(data) - 1}/{size}"
+            if data
+            else f"bytes */{size}"
+        )
+        response = await self.http_client.put(
+            session_url,
+            # A drained generator lets go of the chunk, httpx keeps the request
+            # in a reference cycle until the next garbage collection
+            content=_iterate(data),
+            headers={
+                "Content-Length": str(len(data)),
+                "Content-Range": content_range,
+            },
+        )
+        if total is not None or response.status_code != RESUME_INCOMPLETE:
+            response.raise_for_status()
+            return
+        persisted = response.headers.get("Range", "bytes=0--1").split("-")[-1]
+        if int(persisted) + 1 != offset + len(data):
+            raise IOError(f"GCS persisted the upload only up to byte {persisted}")
+
+    async def _cancel_upload(self, session_url: str, gcs_path: str) -> None:
+        """
+        Cancels the resumable session of a failed upload, GCS keeps it open for
+        a week otherwise
+        """
+        try:
+            # GCS answers 499 once the session is cancelled
+            await self.http_client.delete(session_url)
+        except Exception:
+            logger.warning(f"Failed to cancel upload of {gcs_path}", exc_info=True)
+
+    async def _run(self, func, *args):
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, lambda: blob.upload_from_string(data))
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def _upload(self, data: bytes, gcs_path: str, content_type: Optional[str]) -> None:
+        bucket: Bucket = self.storage_client.bucket(self.bucket_name)
+        bucket.blob(gcs_path).upload_from_string(data, content_type=content_type)
+
+    def _upload_part(self, data: bytes, offset: int, size: int, gcs_path: str) -> None:
+        # Sliced in the worker so only the parts being sent are copied
+        self._upload(data[offset : offset + size], gcs_path, None)
+
+    def _compose(
+        self, part_paths: List[str], gcs_path: str, content_type: Optional[str]
+    ) -> None:
+        bucket: Bucket = self.storage_client.bucket(self.bucket_name)
+        blob = bucket.blob(gcs_path)
+        blob.content_type = content_type
+        blob.compose([bucket.blob(path) for path in part_paths])
+
+    def _delete(self, part_paths: List[str]) -> None:
+        bucket: Bucket = self.storage_client.bucket(self.bucket_name)
+        for path in part_paths:
+            try:
+                bucket.blob(path).delete()
+            except Exception:
+                logger.warning(f"Failed to delete upload part {path}", exc_info=True)
+
+    def _get_public_url(self, gcs_path: str) -> str:
         return f"https://storage.googleapis.com/{self.bucket_name}/{gcs_path}"
+
+
+async def _iterate(data: bytes) -> AsyncIterator[bytes]:
+    yield data
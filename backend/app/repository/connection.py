@@ -1,12 +1,24 @@
+import asyncio
+import time
+from contextlib import AsyncExitStack
+from contextvars import ContextVar
+from dataclasses import dataclass
 from typing import Dict
+from typing import Hashable
 from typing import Optional
 
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 import settings
 from app import api_logger
+from app.cache import TtlLruCache
 
 connection: Dict = {}
 connection_read: Dict = {}
@@ -14,10 +26,108 @@ connection_read: Dict = {}
 DEFAULT_POOL_SIZE = 100
 DEFAULT_POOL_OVERFLOW = 0
 DEFAULT_POOL_TIMEOUT = 1
+DEFAULT_POOL_RECYCLE = 1800
+DEFAULT_PREPARE_THRESHOLD = 5
+
+SQL_GET_WRITE_LSN = """
+SELECT (pg_current_wal_lsn() - '0/0')::bigint;
+"""
+
+# NULL when the read database isn't a standby, it then sees every write
+SQL_GET_REPLAY_LSN = """
+SELECT (pg_last_wal_replay_lsn() - '0/0')::bigint;
+"""
+
+# Whose writes the current request has to read back, usually the user id
+consistency_key: ContextVar[Optional[Hashable]] = ContextVar(
+    "consistency_key", default=None
+)
 
 logger = api_logger.get()
 
 
+class _PrimarySession(Session):
+    pass
+
+
+@event.listens_for(_PrimarySession, "after_commit")
+def _mark_committed(session: Session) -> None:
+    session.info["committed"] = True
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    timeouts: int = 0
+    # Time requests waited for a connection, including opening new ones
+    checkout_wait_seconds: float = 0
+    max_checkout_wait_seconds: float = 0
+
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """
+    Counts checkouts and how long they waited for a free connection
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self) -> "MeteredPool":
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except sqlalchemy.exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            wait = time.perf_counter() - start
+            self.stats.checkouts += 1
+            self.stats.checkout_wait_seconds += wait
+            self.stats.max_checkout_wait_seconds = max(
+                self.stats.max_checkout_wait_seconds, wait
+            )
+
+
+def _get_engines() -> Dict[str, AsyncEngine]:
+    engines = {}
+    for name, _connection in (("primary", connection), ("replica", connection_read)):
+        if _connection:
+            engines[name] = _connection["engine"]
+    return engines
+
+
+def get_pools() -> Dict[str, MeteredPool]:
+    return {name: engine.sync_engine.pool for name, engine in _get_engines().items()}
+
+
+async def warm_up(connections: int) -> None:
+    """
+    Opens up to connections connections in each pool so the first requests
+    don't pay for connection setup
+    """
+    for name, engine in _get_engines().items():
+        count = min(connections, engine.sync_engine.pool.size())
+        start = time.perf_counter()
+        try:
+            async with AsyncExitStack() as stack:
+                await asyncio.gather(
+                    *[stack.enter_async_context(engine.connect()) for _ in range(count)]
+                )
+        except Exception:
+            logger.warning(f"Failed to warm up the {name} pool", exc_info=True)
+            continue
+        logger.info(
+            f"Opened {count} {name} connections in "
+            f"{(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+
+
 def init(
     user,
     password,
@@ -27,22 +137,29 @@ def init(
     pool_size=DEFAULT_POOL_SIZE,
     pool_overflow=DEFAULT_POOL_OVERFLOW,
     pool_timeout=DEFAULT_POOL_TIMEOUT,
+    pool_recycle=DEFAULT_POOL_RECYCLE,
+    is_pgbouncer=False,
+    prepare_threshold=DEFAULT_PREPARE_THRESHOLD,
 ):
     global connection
     if not connection:
         logger.info("connection.py - creating new engine and session maker")
-        url = "postgresql+psycopg_async://{}:{}@{}:{}/{}"
-        url = url.format(user, password, host, port, db)
-
-        # The return value of create_engine() is our connection object
-        engine = create_async_engine(
-            url,
-            max_overflow=pool_overflow,
-            pool_timeout=pool_timeout,
-            pool_size=pool_size,
-            pool_recycle=1800,
+        engine = _create_engine(
+            user,
+            password,
+            db,
+            host,
+            port,
+            pool_size,
+            pool_overflow,
+            pool_timeout,
+            pool_recycle,
+            is_pgbouncer,
+            prepare_threshold,
+        )
+        session_maker = async_sessionmaker(
+            bind=engine, expire_on_commit=False, sync_session_class=_PrimarySession
         )
-        session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
         connection = {"engine": engine, "session_maker": session_maker}
 
 
@@ -55,29 +172,129 @@ def init_read(
     pool_size=DEFAULT_POOL_SIZE,
     pool_overflow=DEFAULT_POOL_OVERFLOW,
     pool_timeout=DEFAULT_POOL_TIMEOUT,
+    pool_recycle=DEFAULT_POOL_RECYCLE,
+    is_pgbouncer=False,
+    prepare_threshold=DEFAULT_PREPARE_THRESHOLD,
 ):
     global connection_read
     if not connection_read:
-        url = "postgresql+psycopg_async://{}:{}@{}:{}/{}"
-        url = url.format(user, password, host, port, db)
-
-        # The return value of create_engine() is our connection object
-        engine = create_async_engine(
-            url,
-            max_overflow=pool_overflow,
-            pool_timeout=pool_timeout,
-            pool_size=pool_size,
-            pool_recycle=1800,
+        engine = _create_engine(
+            user,
+            password,
+            db,
+            host,
+            port,
+            pool_size,
+            pool_overflow,
+            pool_timeout,
+            pool_recycle,
+            is_pgbouncer,
+            prepare_threshold,
         )
         session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
         connection_read = {"engine": engine, "session_maker": session_maker}
 
 
-def init_defaults():
-    _init_all(DEFAULT_POOL_SIZE, DEFAULT_POOL_OVERFLOW, DEFAULT_POOL_TIMEOUT)
+def _create_engine(
+    user,
+    password,
+    db,
+    host,
+    port,
+    pool_size: int,
+    pool_overflow: int,
+    pool_timeout: float,
+    pool_recycle: int,
+    is_pgbouncer: bool,
+    prepare_threshold: int,
+) -> AsyncEngine:
+    url = "postgresql+psycopg_async://{}:{}@{}:{}/{}"
+    url = url.format(user, password, host, port, db)
+    # psycopg prepares a statement server-side once a connection has executed
+    # it prepare_threshold times, later executions skip parsing and planning
+    connect_args = {"prepare_threshold": prepare_threshold}
+    if is_pgbouncer:
+        # A transaction pooler hands every transaction a different server
+        # connection, prepared statements of an earlier one aren't there
+        connect_args["prepare_threshold"] = None
+
+    # The return value of create_engine() is our connection object
+    return create_async_engine(
+        url,
+        poolclass=MeteredPool,
+        max_overflow=pool_overflow,
+        pool_timeout=pool_timeout,
+        pool_size=pool_size,
+        pool_recycle=pool_recycle,
+        connect_args=connect_args,
+    )
+
+
+def get_pool_size(
+    max_connections: int,
+    workers: int,
+    pool_overflow: int,
+    pool_size: Optional[int],
+    reserved: int = 0,
+) -> int:
+    """
+    Splits the connections the database allows this service between the
+    workers after the reserved ones, unless the pool size is set explicitly
+    """
+    if pool_size:
+        return pool_size
+    return max(1, (max_connections - reserved) // max(1, workers) - pool_overflow)
 
 
-def _init_all(pool_size: int, pool_overflow: int, pool_timeout: int):
+def get_reserved_connections(
+    workers: int, listeners: int, cron_pool_size: int, pool_overflow: int
+) -> int:
+    """
+    Connections opened outside the worker pools: the LISTEN connections of
+    every worker and the pool of the cron runner
+    """
+    return workers * listeners + cron_pool_size + pool_overflow
+
+
+def init_defaults(pool_size: Optional[int] = None):
+    """
+    Initializes the pools of an API worker, or with pool_size set the pools of
+    another process (the cron runner)
+    """
+    listeners = int(settings.USER_CACHE_NOTIFY) + int(
+        settings.CHAT_HISTORY_CACHE_NOTIFY
+    )
+    reserved = get_reserved_connections(
+        settings.WEB_CONCURRENCY,
+        listeners,
+        settings.DB_CRON_POOL_SIZE,
+        settings.DB_POOL_MAX_OVERFLOW,
+    )
+    pool_size = pool_size or get_pool_size(
+        settings.DB_MAX_CONNECTIONS,
+        settings.WEB_CONCURRENCY,
+        settings.DB_POOL_MAX_OVERFLOW,
+        settings.DB_POOL_SIZE,
+        reserved,
+    )
+    _init_all(
+        pool_size,
+        settings.DB_POOL_MAX_OVERFLOW,
+        settings.DB_POOL_TIMEOUT_SECONDS,
+        settings.DB_POOL_RECYCLE_SECONDS,
+        settings.DB_PGBOUNCER,
+        settings.DB_PREPARE_THRESHOLD,
+    )
+
+
+def _init_all(
+    pool_size: int,
+    pool_overflow: int,
+    pool_timeout: float,
+    pool_recycle: int = DEFAULT_POOL_RECYCLE,
+    is_pgbouncer: bool = False,
+    prepare_threshold: int = DEFAULT_PREPARE_THRESHOLD,
+):
     init(
         user=settings.DB_USER,
         password=settings.DB_PASSWORD,
@@ -87,6 +304,9 @@ def _init_all(pool_size: int, pool_overflow: int, pool_timeout: int):
         pool_size=pool_size,
         pool_overflow=pool_overflow,
         pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        is_pgbouncer=is_pgbouncer,
+        prepare_threshold=prepare_threshold,
     )
     init_read(
         user=settings.DB_USER_READ,
@@ -97,11 +317,24 @@ def _init_all(pool_size: int, pool_overflow: int, pool_timeout: int):
         pool_size=pool_size,
         pool_overflow=pool_overflow,
         pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        is_pgbouncer=is_pgbouncer,
+        prepare_threshold=prepare_threshold,
     )
     global session_provider
     global session_provider_read
+    global router
     session_provider = SessionProvider(connection)
     session_provider_read = SessionProvider(connection_read)
+    if settings.DB_READ_YOUR_WRITES:
+        router = ReadYourWritesRouter(
+            session_provider,
+            session_provider_read,
+            settings.DB_READ_YOUR_WRITES_MAX_KEYS,
+            settings.DB_READ_YOUR_WRITES_WINDOW_SECONDS,
+        )
+        session_provider = router.write_provider
+        session_provider_read = router.read_provider
 
 
 class SessionProvider:
@@ -112,8 +345,126 @@ class SessionProvider:
         return self.session_maker()
 
 
+@dataclass
+class ReadRoutingStats:
+    replica_reads: int = 0
+    # Reads sent to the primary because the replica was behind
+    primary_reads: int = 0
+    replay_lsn_checks: int = 0
+    tracked_writes: int = 0
+
+
+class ReadYourWritesRouter:
+    """
+    Remembers the primary's WAL position after every commit made for a
+    consistency_key and sends that key's reads to the primary until the replica
+    has replayed past it. Positions are forgotten after window_seconds, so a
+    stuck replica can't pin a key to the primary forever
+    """
+
+    def __init__(
+        self,
+        primary: SessionProvider,
+        replica: SessionProvider,
+        max_keys: int,
+        window_seconds: float,
+    ):
+        self.primary = primary
+        self.replica = replica
+        self.stats = ReadRoutingStats()
+        self.write_provider = _TrackingSessionProvider(self)
+        self.read_provider = _RoutingSessionProvider(self)
+        self._write_lsns: TtlLruCache[int] = TtlLruCache(max_keys, window_seconds)
+        # Highest position the replica is known to have replayed
+        self._replay_lsn = 0
+
+    async def record_write(self, session: AsyncSession) -> None:
+        key = consistency_key.get()
+        if key is None:
+            return
+        result = await session.execute(sqlalchemy.text(SQL_GET_WRITE_LSN))
+        self._write_lsns.set(key, result.scalar_one())
+        self.stats.tracked_writes += 1
+
+    async def get_read_provider(self) -> SessionProvider:
+        key = consistency_key.get()
+        write_lsn = self._write_lsns.get(key) if key is not None else None
+        if write_lsn is None or write_lsn <= self._replay_lsn:
+            self.stats.replica_reads += 1
+            return self.replica
+        self.stats.replay_lsn_checks += 1
+        try:
+            async with self.replica.get() as session:
+                result = await session.execute(sqlalchemy.text(SQL_GET_REPLAY_LSN))
+                replay_lsn = result.scalar_one()
+        except Exception:
+            logger.warning("Failed to get the replica position", exc_info=True)
+            replay_lsn = 0
+        if replay_lsn is None or replay_lsn >= write_lsn:
+            self._replay_lsn = max(self._replay_lsn, replay_lsn or write_lsn)
+            self._write_lsns.delete(key)
+            self.stats.replica_reads += 1
+            return self.replica
+        self.stats.primary_reads += 1
+        return self.primary
+
+
+class _TrackingSessionProvider(SessionProvider):
+    def __init__(self, _router: ReadYourWritesRouter):
+        self.session_maker = _router.primary.session_maker
+        self._router = _router
+
+    def get(self) -> "_TrackedSession":
+        return _TrackedSession(self._router)
+
+
+class _TrackedSession:
+    def __init__(self, _router: ReadYourWritesRouter):
+        self._router = _router
+        self._session = _router.primary.get()
+
+    async def __aenter__(self) -> AsyncSession:
+        return await self._session.__aenter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None and self._session.info.get("committed"):
+            try:
+                await self._router.record_write(self._session)
+            except Exception:
+                # The write is committed, only the user's next reads may lag
+                logger.warning("Failed to record the write position", exc_info=True)
+            except BaseException as e:
+                await self._session.__aexit__(type(e), e, e.__traceback__)
+                raise
+        return await self._session.__aexit__(exc_type, exc, tb)
+
+
+class _RoutingSessionProvider(SessionProvider):
+    def __init__(self, _router: ReadYourWritesRouter):
+        self.session_maker = _router.replica.session_maker
+        self._router = _router
+
+    def get(self) -> "_RoutedSession":
+        return _RoutedSession(self._router)
+
+
+class _RoutedSession:
+    def __init__(self, _router: ReadYourWritesRouter):
+        self._router = _router
+        self._session: Optional[AsyncSession] = None
+
+    async def __aenter__(self) -> AsyncSession:
+        provider = await self._router.get_read_provider()
+        self._session = provider.get()
+        return await self._session.__aenter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await self._session.__aexit__(exc_type, exc, tb)
+
+
 session_provider: Optional[SessionProvider] = None
 session_provider_read: Optional[SessionProvider] = None
+router: Optional[ReadYourWritesRouter] = None
 
 
 def get_session_provider() -> SessionProvider:
@@ -2,9 +2,9 @@ from typing import List
 from typing import Optional
 from uuid import UUID
 
-import sqlalchemy
 
 from app.domain.files.entities import File
+from app.repository import query
 from app.repository.connection import SessionProvider
 from app.repository.utils import utcnow
 
@@ -88,6 +88,12 @@ SET
 WHERE id = :id;
 """
 
+# In the order of File's fields
+FILE_MAPPER = query.RowMapper(
+    File,
+    ["id", "user_profile_id", "filename", "full_path", "content_type", "size"],
+)
+
 
 class FileRepository:
     def __init__(
@@ -110,7 +116,7 @@ class FileRepository:
             "last_updated_at": utc_now,
         }
         async with self._session_provider.get() as session:
-            await session.execute(sqlalchemy.text(SQL_INSERT), data)
+            await session.execute(query.text(SQL_INSERT), data)
             await session.commit()
 
     async def get(self, file_id: UUID) -> Optional[File]:
@@ -118,18 +124,8 @@ class FileRepository:
             "id": file_id,
         }
         async with self._session_provider_read.get() as session:
-            result = await session.execute(sqlalchemy.text(SQL_GET), data)
-            row = result.first()
-            if row:
-                return File(
-                    uid=row.id,
-                    user_id=row.user_profile_id,
-                    filename=row.filename,
-                    full_path=row.full_path,
-                    content_type=row.content_type,
-                    size=row.size,
-                )
-        return None
+            result = await session.execute(query.text(SQL_GET), data)
+            return FILE_MAPPER.first(result)
 
     async def get_by_ids(self, file_ids: List[UUID]) -> List[File]:
         if not file_ids:
@@ -138,38 +134,14 @@ class FileRepository:
         data = {
             "ids": file_ids,
         }
-        files = []
         async with self._session_provider_read.get() as session:
-            rows = await session.execute(sqlalchemy.text(SQL_GET_BY_IDS), data)
-            for row in rows:
-                files.append(
-                    File(
-                        uid=row.id,
-                        user_id=row.user_profile_id,
-                        filename=row.filename,
-                        full_path=row.full_path,
-                        content_type=row.content_type,
-                        size=row.size,
-                    )
-                )
-        return files
+            result = await session.execute(query.text(SQL_GET_BY_IDS), data)
+            return FILE_MAPPER.all(result)
 
     async def get_by_user(self, user_id: UUID) -> List[File]:
         data = {
             "user_id": user_id,
         }
-        files = []
         async with self._session_provider_read.get() as session:
-            rows = await session.execute(sqlalchemy.text(SQL_GET_BY_USER), data)
-            for row in rows:
-                files.append(
-                    File(
-                        uid=row.id,
-                        user_id=row.user_profile_id,
-                        filename=row.filename,
-                        full_path=row.full_path,
-                        content_type=row.content_type,
-                        size=row.size,
-                    )
-                )
-        return files
+            result = await session.execute(query.text(SQL_GET_BY_USER), data)
+            return FILE_MAPPER.all(result)
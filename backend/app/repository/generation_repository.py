@@ -1,15 +1,17 @@
 from typing import Any
 from typing import Dict
+from typing import List
 from typing import Optional
 from uuid import UUID
 import json
+from datetime import timedelta
 
-import sqlalchemy
 from uuid_extensions import uuid7
 
 from app.domain.generation.entities import GenerationOutput
 from app.domain.generation.entities import GenerationStatus
 from app.domain.generation.entities import GenerationType
+from app.repository import query
 from app.repository.connection import SessionProvider
 from app.repository.utils import utcnow
 
@@ -55,12 +57,48 @@ FROM generation
 WHERE id = :id;
 """
 
+SQL_GET_PENDING = """
+SELECT 
+    id,
+    user_profile_id,
+    chat_id,
+    type,
+    prompt,
+    status,
+    url,
+    data,
+    created_at,
+    last_updated_at
+FROM generation
+WHERE 
+    status IN (:created_status, :processing_status)
+    AND created_at > :min_created_at
+ORDER BY id;
+"""
+
 SQL_UPDATE = """
 UPDATE generation
 SET status = :status,
     url = :url,
     last_updated_at = :last_updated_at
-WHERE id = :id;
+WHERE id = :id AND status != :completed_status;
+"""
+
+SQL_COMPLETE = """
+UPDATE generation
+SET status = :completed_status,
+    url = :url,
+    last_updated_at = :last_updated_at
+WHERE id = :id AND status != :completed_status
+RETURNING id;
+"""
+
+SQL_REOPEN = """
+UPDATE generation
+SET status = :processing_status,
+    url = NULL,
+    last_updated_at = :last_updated_at
+WHERE id = :id AND status = :completed_status;
 """
 
 
@@ -96,7 +134,7 @@ class GenerationRepository:
             "last_updated_at": utc_now,
         }
         async with self._session_provider.get() as session:
-            await session.execute(sqlalchemy.text(SQL_INSERT), data)
+            await session.execute(query.text(SQL_INSERT), data)
             await session.commit()
         return GenerationOutput(
             id=id,
@@ -116,32 +154,86 @@ class GenerationRepository:
             "id": generation_id,
         }
         async with self._session_provider_read.get() as session:
-            result = await session.execute(sqlalchemy.text(SQL_GET), data)
+            result = await session.execute(query.text(SQL_GET), data)
             row = result.first()
             if row:
-                return GenerationOutput(
-                    id=row.id,
-                    user_id=row.user_profile_id,
-                    chat_id=row.chat_id,
-                    type=row.type,
-                    prompt=row.prompt,
-                    status=row.status,
-                    url=row.url,
-                    data=row.data,
-                    created_at=row.created_at,
-                    last_updated_at=row.last_updated_at,
-                )
+                return _row_to_generation(row)
         return None
 
+    async def get_pending(self, max_age_seconds: int) -> List[GenerationOutput]:
+        data = {
+            "created_status": GenerationStatus.CREATED,
+            "processing_status": GenerationStatus.PROCESSING,
+            "min_created_at": utcnow() - timedelta(seconds=max_age_seconds),
+        }
+        # Read from primary, a lagging replica would hand back finished generations
+        async with self._session_provider.get() as session:
+            rows = await session.execute(query.text(SQL_GET_PENDING), data)
+            return [_row_to_generation(row) for row in rows]
+
     async def update(
         self, generation_id: UUID, status: GenerationStatus, url: Optional[str]
     ) -> None:
+        """
+        Never overwrites a completed generation, use complete() to finish one
+        """
         data = {
             "id": generation_id,
             "status": status,
             "url": url,
+            "completed_status": GenerationStatus.COMPLETED,
+            "last_updated_at": utcnow(),
+        }
+        async with self._session_provider.get() as session:
+            await session.execute(query.text(SQL_UPDATE), data)
+            await session.commit()
+
+    async def complete(self, generation_id: UUID, url: Optional[str]) -> bool:
+        """
+        Marks the generation completed, returns False if it already was
+        """
+        data = {
+            "id": generation_id,
+            "url": url,
+            "completed_status": GenerationStatus.COMPLETED,
             "last_updated_at": utcnow(),
         }
         async with self._session_provider.get() as session:
-            await session.execute(sqlalchemy.text(SQL_UPDATE), data)
+            result = await session.execute(query.text(SQL_COMPLETE), data)
+            row = result.first()
+            await session.commit()
+        return row is not None
+
+    async def reopen(self, generation_id: UUID) -> None:
+        data = {
+            "id": generation_id,
+            "processing_status": GenerationStatus.PROCESSING,
+            "completed_status": GenerationStatus.COMPLETED,
+            "last_updated_at": utcnow(),
+        }
+        async with self._session_provider.get() as session:
+            await session.execute(query.text(SQL_REOPEN), data)
             await session.commit()
+
+
+def _row_to_generation(row) -> GenerationOutput:
+    return GenerationOutput(
+        id=row.id,
+        user_id=row.user_profile_id,
+        chat_id=row.chat_id,
+        type=_to_enum(GenerationType, row.type),
+        prompt=row.prompt,
+        status=_to_enum(GenerationStatus, row.status),
+        url=row.url,
+        data=row.data,
+        created_at=row.created_at,
+        last_updated_at=row.last_updated_at,
+    )
+
+
+def _to_enum(enum_type, value: str):
+    # psycopg stores enum parameters by name, e.g. "COMPLETED"
+    try:
+        return enum_type[value]
+    except KeyError:
+        return enum_type(value)
@@ -0,0 +1,94 @@
+from datetime import timedelta
+from typing import Optional
+
+
+from app.repository import query
+from app.repository.connection import SessionProvider
+from app.repository.utils import utcnow
+
+SQL_GET = """
+SELECT
+    intent
+FROM intent_cache
+WHERE key = :key AND last_updated_at > :min_updated_at;
+"""
+
+SQL_UPSERT = """
+INSERT INTO intent_cache (
+    key,
+    intent,
+    created_at,
+    last_updated_at
+) VALUES (
+    :key,
+    :intent,
+    :created_at,
+    :last_updated_at
+)
+ON CONFLICT (key) DO UPDATE SET
+    intent = EXCLUDED.intent,
+    last_updated_at = EXCLUDED.last_updated_at;
+"""
+
+SQL_DELETE_EXPIRED = """
+DELETE FROM intent_cache
+WHERE key IN (
+    SELECT key
+    FROM intent_cache
+    WHERE last_updated_at < :min_updated_at
+    LIMIT :limit
+);
+"""
+
+# Rows deleted per transaction, so a big purge doesn't hold locks for long
+DELETE_BATCH_SIZE = 10000
+
+
+class IntentCacheRepository:
+    def __init__(
+        self, session_provider: SessionProvider, session_provider_read: SessionProvider
+    ):
+        self._session_provider = session_provider
+        self._session_provider_read = session_provider_read
+
+    async def get(self, key: str, ttl_seconds: int) -> Optional[str]:
+        data = {
+            "key": key,
+            "min_updated_at": utcnow() - timedelta(seconds=ttl_seconds),
+        }
+        async with self._session_provider_read.get() as session:
+            result = await session.execute(query.text(SQL_GET), data)
+            row = result.first()
+            if row:
+                return row.intent
+        return None
+
+    async def upsert(self, key: str, intent: str) -> None:
+        utc_now = utcnow()
+        data = {
+            "key": key,
+            "intent": intent,
+            "created_at": utc_now,
+            "last_updated_at": utc_now,
+        }
+        async with self._session_provider.get() as session:
+            await session.execute(query.text(SQL_UPSERT), data)
+            await session.commit()
+
+    async def delete_expired(self, ttl_seconds: int) -> int:
+        """
+        Deletes the entries get() no longer returns, in batches.
+        Returns the number of deleted rows
+        """
+        data = {
+            "min_updated_at": utcnow() - timedelta(seconds=ttl_seconds),
+            "limit": DELETE_BATCH_SIZE,
+        }
+        deleted = 0
+        while True:
+            async with self._session_provider.get() as session:
+                result = await session.execute(query.text(SQL_DELETE_EXPIRED), data)
+                await session.commit()
+            deleted += result.rowcount
+            if result.rowcount < DELETE_BATCH_SIZE:
+                return deleted
@@ -1,4 +1,6 @@
+import hashlib
 import os
+import time
 from datetime import datetime, timedelta
 
 from app.domain.users.entities import (
@@ -10,11 +12,21 @@ from app.domain.users.entities import (
 )
 from jose import JWTError, jwt
 
+import settings
+from app.cache import TtlLruCache
+from app.cache import register_stats
+
 # JWT configuration
 SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 365 * 10  # 10 years
 
+# Verified payloads keyed by token hash, so repeated requests skip the decode
+_payload_cache: TtlLruCache[TokenPayload] = TtlLruCache(
+    settings.JWT_CACHE_MAX_SIZE, settings.JWT_CACHE_TTL_SECONDS
+)
+register_stats("jwt", _payload_cache.stats)
+
 
 class JwtRepository:
     """Repository for JWT token operations - handles serialization/deserialization of user data in tokens"""
@@ -70,6 +82,12 @@ def create_access_token(user: User) -> str:
 
 
 def verify_access_token(token: str) -> TokenPayload:
-    """Verify and decode an access token"""
+    """Verify and decode an access token, cached by token hash"""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = _payload_cache.get(key)
+    if payload and (not payload.exp or payload.exp > time.time()):
+        return payload
     repository = JwtRepository()
-    return repository.verify_access_token(token)
+    payload = repository.verify_access_token(token)
+    _payload_cache.set(key, payload)
+    return payload
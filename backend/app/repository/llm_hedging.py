@@ -0,0 +1,77 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque
+
+
+@dataclass
+class HedgeStats:
+    requests: int = 0
+    # Requests that started the fallback next to a slow primary
+    hedged: int = 0
+    primary_wins: int = 0
+    fallback_wins: int = 0
+    # Slow primaries that weren't hedged because the budget was used up
+    over_budget: int = 0
+
+    @property
+    def hedge_rate(self) -> float:
+        return self.hedged / self.requests if self.requests else 0.0
+
+
+class HedgePolicy:
+    """
+    Decides when a slow primary gets the fallback raced against it. The delay
+    is a percentile of the primary's recent times to first token, hedges are
+    capped at budget share of the last window requests
+    """
+
+    def __init__(
+        self,
+        percentile: float,
+        budget: float,
+        initial_delay: float,
+        min_delay: float,
+        max_delay: float,
+        window: int = 200,
+        min_samples: int = 20,
+    ):
+        self.percentile = percentile
+        self.budget = budget
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.stats = HedgeStats()
+        self._first_token_seconds: Deque[float] = deque(maxlen=window)
+        self._recent_hedges: Deque[bool] = deque(maxlen=window)
+        self._recent_hedge_count = 0
+
+    def get_delay(self) -> float:
+        samples = self._first_token_seconds
+        if len(samples) < self.min_samples:
+            delay = self.initial_delay
+        else:
+            ordered = sorted(samples)
+            delay = ordered[int(self.percentile / 100 * (len(ordered) - 1))]
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def record_first_token(self, seconds: float) -> None:
+        """
+        A primary that lost the race records how long it was waited for, its
+        real time to first token was at least that
+        """
+        self._first_token_seconds.append(seconds)
+
+    def record_request(self, is_hedged: bool) -> None:
+        if len(self._recent_hedges) == self._recent_hedges.maxlen:
+            self._recent_hedge_count -= self._recent_hedges[0]
+        self._recent_hedges.append(is_hedged)
+        self._recent_hedge_count += is_hedged
+        self.stats.requests += 1
+        self.stats.hedged += is_hedged
+
+    def can_hedge(self) -> bool:
+        allowed = self._recent_hedge_count < self.budget * self._recent_hedges.maxlen
+        if not allowed:
+            self.stats.over_budget += 1
+        return allowed
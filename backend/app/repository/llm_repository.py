@@ -1,9 +1,13 @@
 import asyncio
+import time
 from typing import AsyncGenerator
+from typing import Awaitable
 from typing import Dict
+from typing import Iterator
 from typing import List
 from typing import Optional
 
+import httpx
 import openai
 import serpapi
 from openai import AsyncOpenAI
@@ -12,13 +16,24 @@ from openai import NotGiven
 
 from app import api_logger
 from app.domain.chat.entities import ChunkOutput
+from app.domain.chat.entities import Model
 from app.domain.chat.entities import ModelSpec
 from app.domain.chat.entities import ToolOutput
 from app.domain.llm_tools.tools_definition import SEARCH_TOOL_DEFINITION
 from app.exceptions import LlmError
+from app.repository.llm_hedging import HedgePolicy
+from app.repository.llm_router import ProviderRouter
+from app.repository.llm_router import ProviderTarget
 
 logger = api_logger.get()
 
+RETRIABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APIError,
+    # A connection dropped mid-stream, the client doesn't wrap these
+    httpx.TransportError,
+)
+
 
 class LlmRepository:
     api_key: str
@@ -31,6 +46,9 @@ class LlmRepository:
         base_url: str,
         fallback_api_key: str,
         fallback_base_url: str,
+        hedge_policies: Optional[Dict[Model, HedgePolicy]] = None,
+        extra_providers: Optional[Dict[str, Dict]] = None,
+        router: Optional[ProviderRouter] = None,
     ):
         if not api_key:
             raise ValueError("API key must be set")
@@ -44,7 +62,24 @@ class LlmRepository:
             base_url=fallback_base_url,
             api_key=fallback_api_key,
         )
+        # By provider name in the models' providers
+        self.clients: Dict[str, AsyncOpenAI] = {
+            "primary": self.client,
+            "fallback": self.fallback_client,
+        }
+        for name, provider in (extra_providers or {}).items():
+            self.clients[name] = AsyncOpenAI(
+                base_url=provider["base_url"], api_key=provider["api_key"]
+            )
         self.search_client = serpapi.Client(api_key=search_api_key)
+        # Models without a policy only call the next provider once one failed
+        self.hedge_policies = hedge_policies or {}
+        self.router = router or ProviderRouter()
+
+    async def close(self) -> None:
+        for client in self.clients.values():
+            await client.close()
+        self.search_client.session.close()
 
     async def completion(
         self,
@@ -53,57 +88,225 @@ class LlmRepository:
         is_search_enabled: bool = True,
         response_format: Optional[dict] = None,
     ) -> AsyncGenerator[ChunkOutput | ToolOutput, None]:
+        """
+        Streams from the healthiest provider of the model and moves on to the
+        next one when it fails or stalls. Providers with an open circuit are
+        skipped, one failing mid-stream is continued from the text already
+        streamed unless it streamed tool calls. All of them together get the
+        model's total_timeout
+        """
+        deadline = time.monotonic() + model.type.total_timeout
+        route = self.router.get_route(model.type)
+        target = next(route, None)
+        if target is None:
+            raise LlmError(
+                message="The AI service is unavailable, please try again in a few moments."
+            )
+        policy = self.hedge_policies.get(model.type)
+        first_error = None
+        # What the caller already has, in case a provider fails mid-stream
+        streamed = ""
+        has_tool_output = False
+        try:
+            while target:
+                request_messages = messages
+                if streamed:
+                    request_messages = messages + [
+                        {"role": "assistant", "content": streamed}
+                    ]
+                try:
+                    if policy:
+                        outputs = self._hedged_completion(
+                            policy,
+                            target,
+                            route,
+                            request_messages,
+                            model,
+                            is_search_enabled,
+                            response_format,
+                            deadline,
+                        )
+                    else:
+                        outputs = self._attempt(
+                            target,
+                            request_messages,
+                            model,
+                            is_search_enabled,
+                            response_format,
+                            deadline,
+                        )
+                    if streamed:
+                        outputs = _skip_streamed(outputs, streamed)
+                    async for output in outputs:
+                        if isinstance(output, ChunkOutput):
+                            streamed += output.content
+                        else:
+                            has_tool_output = True
+                        yield output
+                    return
+                except RETRIABLE_ERRORS as e:
+                    logger.error(
+                        f"LLM provider {target.provider} failed after streaming "
+                        f"{len(streamed)} characters: {str(e)}. "
+                        "Attempting fallback..."
+                    )
+                    first_error = first_error or e
+                    if has_tool_output:
+                        # The caller already acts on the tool calls, a fallback
+                        # would answer without them
+                        target = None
+                    elif time.monotonic() < deadline:
+                        target = next(route, None)
+                    else:
+                        target = None
+            raise _get_llm_error(first_error)
+        except LlmError:
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            raise LlmError(
+                message="An unexpected error occurred. Please try again in a few moments."
+            )
+
+    async def _hedged_completion(
+        self,
+        policy: HedgePolicy,
+        target: ProviderTarget,
+        route: Iterator[ProviderTarget],
+        messages: List[Dict],
+        model: ModelSpec,
+        is_search_enabled: bool,
+        response_format: Optional[dict],
+        deadline: float,
+    ) -> AsyncGenerator[ChunkOutput | ToolOutput, None]:
+        """
+        Streams target, unless it has no first token within the policy's delay.
+        The next provider of the route is then started next to it, whichever
+        answers first is streamed and the other one is cancelled
+        """
+        start = time.monotonic()
+        primary = self._attempt(
+            target, messages, model, is_search_enabled, response_format, deadline
+        )
+        primary_first = asyncio.ensure_future(primary.__anext__())
+        try:
+            await asyncio.wait({primary_first}, timeout=policy.get_delay())
+        except BaseException:
+            await _cancel(primary_first, primary)
+            raise
+        hedge_target = None
+        if not primary_first.done() and policy.can_hedge():
+            hedge_target = next(route, None)
+        if hedge_target is None:
+            policy.record_request(is_hedged=False)
+            try:
+                first = await primary_first
+            except StopAsyncIteration:
+                return
+            policy.record_first_token(time.monotonic() - start)
+            yield first
+            async for output in primary:
+                yield output
+            return
+
+        policy.record_request(is_hedged=True)
+        logger.info(
+            f"No first token from {target.provider} after "
+            f"{time.monotonic() - start:.2f}s, racing {hedge_target.provider}"
+        )
+        fallback = self._attempt(
+            hedge_target,
+            messages,
+            model,
+            is_search_enabled,
+            response_format,
+            deadline,
+        )
+        fallback_first = asyncio.ensure_future(fallback.__anext__())
+        outputs = {primary_first: primary, fallback_first: fallback}
+        pending = set(outputs)
+        winner = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # The primary wins ties
+                for task in (primary_first, fallback_first):
+                    if task not in done:
+                        continue
+                    error = task.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        winner = task
+                        break
+                    logger.error(f"Hedged LLM request failed: {str(error)}")
+        finally:
+            for task, generator in outputs.items():
+                if task is not winner:
+                    await _cancel(task, generator)
+
+        # The primary's time to first token is at least how long it was waited
+        policy.record_first_token(time.monotonic() - start)
+        if winner is None:
+            # Both failed, the route goes on with the provider after them
+            raise primary_first.exception()
+        if winner is primary_first:
+            policy.stats.primary_wins += 1
+        else:
+            policy.stats.fallback_wins += 1
+        try:
+            first = winner.result()
+        except StopAsyncIteration:
+            return
+        yield first
+        async for output in outputs[winner]:
+            yield output
+
+    async def _attempt(
+        self,
+        target: ProviderTarget,
+        messages: List[Dict],
+        model: ModelSpec,
+        is_search_enabled: bool,
+        response_format: Optional[dict],
+        deadline: float,
+    ) -> AsyncGenerator[ChunkOutput | ToolOutput, None]:
+        """
+        Streams from one provider and reports the outcome to the router, the
+        first token counts as a success
+        """
+        start = time.monotonic()
+        has_outcome = False
         try:
             async for output in self._completion(
-                self.client,
+                self.clients[target.provider],
                 messages,
                 model,
-                model.type.primary_model,
+                target.model_id,
                 is_search_enabled,
                 response_format,
+                deadline,
             ):
+                if not has_outcome:
+                    has_outcome = True
+                    self.router.record_success(target, time.monotonic() - start)
                 yield output
-        except (
-            asyncio.TimeoutError,
-            openai.RateLimitError,
-            openai.NotFoundError,
-            openai.BadRequestError,
-            openai.InternalServerError,
-            openai.APIStatusError,
-            openai.APIError,
-        ) as e:
-            logger.error(f"Primary LLM client failed: {str(e)}. Attempting fallback...")
-            try:
-                async for output in self._completion(
-                    self.fallback_client,
-                    messages,
-                    model,
-                    model.type.fallback_model,
-                    is_search_enabled,
-                    response_format,
-                ):
-                    yield output
-            except Exception as fallback_error:
-                logger.error(f"Fallback LLM client also failed: {str(fallback_error)}")
-                if isinstance(e, asyncio.TimeoutError):
-                    raise LlmError(
-                        message="Request timed out, please try again in a few moments."
-                    )
-                elif (
-                    hasattr(e, "body")
-                    and isinstance(e.body, dict)
-                    and "message" in e.body
-                ):
-                    raise LlmError(message=e.body["message"])
-                else:
-                    raise LlmError(
-                        message="An unexpected error occurred. Please try again in a few moments."
-                    )
+            if not has_outcome:
+                has_outcome = True
+                self.router.record_success(target, time.monotonic() - start)
+        except openai.BadRequestError:
+            # Caused by the request, not by the provider's health
+            raise
         except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}")
-            raise LlmError(
-                message="An unexpected error occurred. Please try again in a few moments."
+            has_outcome = True
+            self.router.record_failure(
+                target, is_timeout=isinstance(e, asyncio.TimeoutError)
             )
+            raise
+        finally:
+            if not has_outcome:
+                # Cancelled, e.g. the loser of a hedged request
+                self.router.release(target)
 
     async def _completion(
         self,
@@ -113,8 +316,14 @@ class LlmRepository:
         model_id: str,
         is_search_enabled: bool,
         response_format: Optional[dict],
+        deadline: float,
     ) -> AsyncGenerator[ChunkOutput | ToolOutput, None]:
-        stream: AsyncStream = await asyncio.wait_for(
+        """
+        Waits for the first chunk are bounded by the model's first_token_timeout,
+        later ones by its idle_timeout and all of them by deadline
+        """
+        first_chunk_at = time.monotonic() + model.type.first_token_timeout
+        stream: AsyncStream = await _wait(
             client.chat.completions.create(
                 model=model_id,
                 messages=messages,
@@ -124,22 +333,37 @@ class LlmRepository:
                 tools=[SEARCH_TOOL_DEFINITION] if is_search_enabled else NotGiven(),
                 stream=True,
             ),
-            timeout=model.type.timeout,
+            min(first_chunk_at, deadline),
+            "first token",
         )
 
-        async for chunk in stream:
-            choice = chunk.choices[0]
-            if choice.delta.tool_calls:
-                for tc in choice.delta.tool_calls:
-                    if tc.function:
-                        yield ToolOutput(
-                            tool_call_id=tc.id,
-                            name=tc.function.name,
-                            arguments=tc.function.arguments,
-                            result="",
-                        )
-            if choice.delta.content is not None:
-                yield ChunkOutput(content=choice.delta.content)
+        # Closes the response when a hedged request is cancelled mid-stream
+        async with stream:
+            chunks = stream.__aiter__()
+            waiting_for = "first token"
+            chunk_at = first_chunk_at
+            while True:
+                try:
+                    chunk = await _wait(
+                        chunks.__anext__(), min(chunk_at, deadline), waiting_for
+                    )
+                except StopAsyncIteration:
+                    break
+                choice = chunk.choices[0]
+                if choice.delta.tool_calls:
+                    for tc in choice.delta.tool_calls:
+                        if tc.function:
+                            yield ToolOutput(
+                                tool_call_id=tc.id,
+                                name=tc.function.name,
+                                arguments=tc.function.arguments,
+                                result="",
+                            )
+                if choice.delta.content is not None:
+                    yield ChunkOutput(content=choice.delta.content)
+                # The consumer's time between chunks isn't the provider's
+                waiting_for = "next chunk"
+                chunk_at = time.monotonic() + model.type.idle_timeout
 
     async def completion_nostream(
         self,
@@ -159,3 +383,56 @@ class LlmRepository:
             raise LlmError(
                 message="An unexpected error occurred. Please try again in a few moments."
             )
+
+
+async def _wait(awaitable: Awaitable, until: float, waiting_for: str):
+    """
+    Raises asyncio.TimeoutError if awaitable isn't done by until, a monotonic time
+    """
+    try:
+        return await asyncio.wait_for(awaitable, timeout=until - time.monotonic())
+    except asyncio.TimeoutError:
+        raise asyncio.TimeoutError(f"No {waiting_for} in time") from None
+
+
+async def _cancel(task: asyncio.Future, generator: AsyncGenerator) -> None:
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await generator.aclose()
+
+
+async def _skip_streamed(
+    outputs: AsyncGenerator[ChunkOutput | ToolOutput, None], streamed: str
+) -> AsyncGenerator[ChunkOutput | ToolOutput, None]:
+    """
+    Passes on a stream that continues streamed. A provider that ignored the
+    partial answer and started over repeats it first, that repeat is dropped.
+    Content is held back while it could still turn out to be a repeat
+    """
+    held = ""
+    is_deciding = True
+    async for output in outputs:
+        if is_deciding and isinstance(output, ChunkOutput):
+            held += output.content
+            if streamed.startswith(held):
+                continue
+            is_deciding = False
+            if held.startswith(streamed):
+                held = held[len(streamed) :]
+            if held:
+                yield ChunkOutput(content=held)
+            continue
+        if is_deciding and held:
+            yield ChunkOutput(content=held)
+        is_deciding = False
+        yield output
+
+
+def _get_llm_error(e: BaseException) -> LlmError:
+    if isinstance(e, asyncio.TimeoutError):
+        return LlmError(message="Request timed out, please try again in a few moments.")
+    elif hasattr(e, "body") and isinstance(e.body, dict) and "message" in e.body:
+        return LlmError(message=e.body["message"])
+    return LlmError(
+        message="An unexpected error occurred. Please try again in a few moments."
+    )
@@ -0,0 +1,180 @@
+import time
+from collections import deque
+from dataclasses import dataclass
+from dataclasses import field
+from enum import Enum
+from typing import Deque
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from app import api_logger
+from app.domain.chat.entities import Model
+
+logger = api_logger.get()
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclass(frozen=True)
+class ProviderTarget:
+    provider: str
+    model_id: str
+
+
+@dataclass
+class _Outcome:
+    at: float
+    is_success: bool
+    is_timeout: bool
+    first_token_seconds: Optional[float]
+
+
+@dataclass
+class ProviderHealth:
+    state: CircuitState = CircuitState.CLOSED
+    opened_at: float = 0
+    # Set while a half-open trial request is running
+    is_trial_running: bool = False
+    outcomes: Deque[_Outcome] = field(default_factory=deque)
+    requests: int = 0
+    failures: int = 0
+    times_opened: int = 0
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(not o.is_success for o in self.outcomes) / len(self.outcomes)
+
+    @property
+    def timeout_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(o.is_timeout for o in self.outcomes) / len(self.outcomes)
+
+    @property
+    def median_first_token_seconds(self) -> Optional[float]:
+        seconds = sorted(
+            o.first_token_seconds
+            for o in self.outcomes
+            if o.first_token_seconds is not None
+        )
+        return seconds[len(seconds) // 2] if seconds else None
+
+
+class ProviderRouter:
+    """
+    Orders the providers of a model by health and keeps a circuit breaker per
+    provider and model. A circuit opens once error_threshold of the last window
+    calls failed, requests skip the provider until open_seconds have passed and
+    then a single trial request decides whether it closes again. Calls older
+    than window_seconds are forgotten, so a demoted provider gets traffic back
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        window_seconds: float = 60,
+        min_calls: int = 5,
+        error_threshold: float = 0.5,
+        open_seconds: float = 30,
+        degraded_threshold: float = 0.2,
+    ):
+        self.window = window
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.open_seconds = open_seconds
+        # Closed providers failing this often are tried after the healthy ones
+        self.degraded_threshold = degraded_threshold
+        self._health: Dict[ProviderTarget, ProviderHealth] = {}
+
+    def get_health(self, target: ProviderTarget) -> ProviderHealth:
+        health = self._health.get(target)
+        if health is None:
+            health = ProviderHealth(outcomes=deque(maxlen=self.window))
+            self._health[target] = health
+        outcomes = health.outcomes
+        min_at = time.monotonic() - self.window_seconds
+        while outcomes and outcomes[0].at < min_at:
+            outcomes.popleft()
+        return health
+
+    def get_route(self, model: Model) -> Iterator[ProviderTarget]:
+        """
+        Providers to try in order, the ones acquire() refuses are skipped
+        """
+        targets = [ProviderTarget(p, m) for p, m in model.providers]
+
+        def rank(item: Tuple[int, ProviderTarget]) -> Tuple[int, int]:
+            i, target = item
+            health = self.get_health(target)
+            if health.state != CircuitState.CLOSED:
+                return 2, i
+            return int(health.error_rate >= self.degraded_threshold), i
+
+        for _, target in sorted(enumerate(targets), key=rank):
+            if self.acquire(target):
+                yield target
+
+    def acquire(self, target: ProviderTarget) -> bool:
+        health = self.get_health(target)
+        if health.state == CircuitState.CLOSED:
+            return True
+        if health.state == CircuitState.OPEN:
+            if time.monotonic() - health.opened_at < self.open_seconds:
+                return False
+            health.state = CircuitState.HALF_OPEN
+        if health.is_trial_running:
+            return False
+        health.is_trial_running = True
+        return True
+
+    def release(self, target: ProviderTarget) -> None:
+        """
+        For requests cancelled before they had an outcome
+        """
+        self.get_health(target).is_trial_running = False
+
+    def record_success(self, target: ProviderTarget, first_token_seconds: float):
+        health = self.get_health(target)
+        health.requests += 1
+        health.outcomes.append(
+            _Outcome(time.monotonic(), True, False, first_token_seconds)
+        )
+        if health.state == CircuitState.HALF_OPEN:
+            logger.info(f"Closing circuit of {target.provider} {target.model_id}")
+            health.state = CircuitState.CLOSED
+            health.outcomes.clear()
+        health.is_trial_running = False
+
+    def record_failure(self, target: ProviderTarget, is_timeout: bool) -> None:
+        health = self.get_health(target)
+        health.requests += 1
+        health.failures += 1
+        health.outcomes.append(_Outcome(time.monotonic(), False, is_timeout, None))
+        health.is_trial_running = False
+        if health.state == CircuitState.HALF_OPEN or (
+            health.state == CircuitState.CLOSED
+            and len(health.outcomes) >= self.min_calls
+            and health.error_rate >= self.error_threshold
+        ):
+            logger.warning(
+                f"Opening circuit of {target.provider} {target.model_id}, "
+                f"error rate {health.error_rate:.0%}"
+            )
+            health.state = CircuitState.OPEN
+            health.opened_at = time.monotonic()
+            health.times_opened += 1
+
+    def get_states(self) -> List[Tuple[ProviderTarget, ProviderHealth]]:
+        return sorted(
+            self._health.items(), key=lambda i: (i[0].provider, i[0].model_id)
+        )
@@ -0,0 +1,37 @@
+import asyncio
+from typing import Callable
+
+import psycopg
+
+from app import api_logger
+
+LISTEN_RETRY_SECONDS = 5
+
+logger = api_logger.get()
+
+
+async def listen(
+    conninfo: str,
+    channel: str,
+    on_notify: Callable[[str], None],
+    on_connect: Callable[[], None],
+) -> None:
+    """
+    Calls on_notify with the payload of every notification sent on channel,
+    reconnects until cancelled. on_connect runs after every (re)connect, as
+    notifications sent while disconnected are lost
+    """
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                conninfo, autocommit=True
+            ) as connection:
+                await connection.execute(f"LISTEN {channel}")
+                on_connect()
+                async for notify in connection.notifies():
+                    on_notify(notify.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.error(f"Listener of {channel} failed, reconnecting", exc_info=True)
+            await asyncio.sleep(LISTEN_RETRY_SECONDS)
@@ -0,0 +1,60 @@
+from functools import lru_cache
+from operator import itemgetter
+from typing import Callable
+from typing import Dict
+from typing import Generic
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import TypeVar
+
+import sqlalchemy
+from sqlalchemy import Result
+from sqlalchemy import TextClause
+
+T = TypeVar("T")
+
+
+@lru_cache(maxsize=None)
+def text(sql: str) -> TextClause:
+    """
+    sqlalchemy.text() parses the bind parameters out of the SQL on every call,
+    the repositories' statements are constants so each is built once
+    """
+    return sqlalchemy.text(sql)
+
+
+class RowMapper(Generic[T]):
+    """
+    Builds entities positionally from the given columns. Column names are
+    resolved to indexes once per distinct result shape, not per row and field
+    """
+
+    def __init__(self, to_entity: Callable[..., T], columns: Sequence[str]):
+        self._to_entity = to_entity
+        self._columns = tuple(columns)
+        self._getters: Dict[Tuple[str, ...], Callable] = {}
+
+    def _get_getter(self, keys: Sequence[str]) -> Callable:
+        keys = tuple(keys)
+        getter = self._getters.get(keys)
+        if getter is None:
+            indexes = [keys.index(column) for column in self._columns]
+            getter = itemgetter(*indexes)
+            if len(indexes) == 1:
+                index = indexes[0]
+                getter = lambda row: (row[index],)  # noqa: E731
+            self._getters[keys] = getter
+        return getter
+
+    def all(self, result: Result) -> List[T]:
+        getter = self._get_getter(result.keys())
+        to_entity = self._to_entity
+        return [to_entity(*getter(row)) for row in result]
+
+    def first(self, result: Result) -> Optional[T]:
+        row = result.first()
+        if row is None:
+            return None
+        return self._to_entity(*self._get_getter(row._fields)(row))
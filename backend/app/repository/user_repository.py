@@ -1,10 +1,11 @@
 from typing import Optional
 from uuid import UUID
 
-import sqlalchemy
 
-from app import api_logger
+from app.cache import TtlLruCache
 from app.domain.users.entities import User
+from app.repository import notifications
+from app.repository import query
 from app.repository.connection import SessionProvider
 from app.repository.utils import utcnow
 
@@ -97,29 +98,42 @@ FROM user_profile
 WHERE auth_provider = :auth_provider AND provider_id = :provider_id;
 """
 
-logger = api_logger.get()
+SQL_NOTIFY_INVALIDATED = """
+SELECT pg_notify(:channel, :id);
+"""
+
+# Postgres channel used to invalidate cached users in every worker
+INVALIDATION_CHANNEL = "user_profile_invalidated"
+
+# In the order of User's fields
+USER_MAPPER = query.RowMapper(
+    User,
+    [
+        "id",
+        "email",
+        "name",
+        "profile_picture",
+        "auth_provider",
+        "provider_id",
+        "is_email_verified",
+        "created_at",
+        "last_login_at",
+    ],
+)
 
 
 class UserRepository:
     def __init__(
-        self, session_provider: SessionProvider, session_provider_read: SessionProvider
+        self,
+        session_provider: SessionProvider,
+        session_provider_read: SessionProvider,
+        cache: Optional[TtlLruCache[User]] = None,
+        notify_invalidations: bool = False,
     ):
         self._session_provider = session_provider
         self._session_provider_read = session_provider_read
-
-    def _row_to_user(self, row) -> User:
-        """Convert database row to User entity"""
-        return User(
-            uid=row.id,
-            email=row.email,
-            name=row.name,
-            profile_picture=row.profile_picture,
-            auth_provider=row.auth_provider,
-            provider_id=row.provider_id,
-            is_email_verified=row.is_email_verified,
-            created_at=row.created_at,
-            last_login_at=row.last_login_at,
-        )
+        self._cache = cache
+        self._notify_invalidations = notify_invalidations
 
     async def insert(self, user: User):
         """Insert a new user"""
@@ -136,7 +150,7 @@ class UserRepository:
             "last_login_at": user.last_login_at or utcnow(),
         }
         async with self._session_provider.get() as session:
-            await session.execute(sqlalchemy.text(SQL_INSERT), data)
+            await session.execute(query.text(SQL_INSERT), data)
             await session.commit()
 
     async def update(self, user: User):
@@ -153,28 +167,48 @@ class UserRepository:
             "last_login_at": user.last_login_at or utcnow(),
         }
         async with self._session_provider.get() as session:
-            await session.execute(sqlalchemy.text(SQL_UPDATE), data)
+            await session.execute(query.text(SQL_UPDATE), data)
+            if self._notify_invalidations:
+                # Delivered to listeners only once the update commits
+                await session.execute(
+                    query.text(SQL_NOTIFY_INVALIDATED),
+                    {"channel": INVALIDATION_CHANNEL, "id": str(user.uid)},
+                )
             await session.commit()
+        if self._cache is not None:
+            self._cache.delete(user.uid)
 
     async def get_by_id(self, user_profile_id: UUID) -> Optional[User]:
-        """Get user by ID"""
+        """Get user by ID, served from the cache when one is configured"""
+        if self._cache is not None and (user := self._cache.get(user_profile_id)):
+            return user
         data = {"id": user_profile_id}
         async with self._session_provider_read.get() as session:
-            result = await session.execute(sqlalchemy.text(SQL_GET_BY_ID), data)
-            row = result.first()
-            if row:
-                return self._row_to_user(row)
+            result = await session.execute(query.text(SQL_GET_BY_ID), data)
+            user = USER_MAPPER.first(result)
+            if user:
+                if self._cache is not None:
+                    self._cache.set(user_profile_id, user)
+                return user
         return None
 
+    async def listen_for_invalidations(self, conninfo: str) -> None:
+        """
+        Drops cached users updated by other workers, runs until cancelled
+        """
+        await notifications.listen(
+            conninfo,
+            INVALIDATION_CHANNEL,
+            on_notify=lambda payload: self._cache.delete(UUID(payload)),
+            on_connect=self._cache.clear,
+        )
+
     async def get_by_email(self, email: str) -> Optional[User]:
         """Get user by email"""
         data = {"email": email}
         async with self._session_provider_read.get() as session:
-            result = await session.execute(sqlalchemy.text(SQL_GET_BY_EMAIL), data)
-            row = result.first()
-            if row:
-                return self._row_to_user(row)
-        return None
+            result = await session.execute(query.text(SQL_GET_BY_EMAIL), data)
+            return USER_MAPPER.first(result)
 
     async def get_by_provider(
         self, auth_provider: str, provider_id: str
@@ -182,8 +216,5 @@ class UserRepository:
         """Get user by auth provider and provider ID"""
         data = {"auth_provider": auth_provider, "provider_id": provider_id}
         async with self._session_provider_read.get() as session:
-            result = await session.execute(sqlalchemy.text(SQL_GET_BY_PROVIDER), data)
-            row = result.first()
-            if row:
-                return self._row_to_user(row)
-        return None
+            result = await session.execute(query.text(SQL_GET_BY_PROVIDER), data)
+            return USER_MAPPER.first(result)
@@ -1,4 +1,8 @@
+import asyncio
+import random
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
+from typing import AsyncIterator
 from typing import Optional
 
 import httpx
@@ -7,6 +11,10 @@ from app import api_logger
 
 logger = api_logger.get()
 
+BASE_URL = "https://api.wavespeed.ai/api/v3"
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
 
 @dataclass
 class WavespeedGenerationOutput:
@@ -15,54 +23,130 @@ class WavespeedGenerationOutput:
     url: Optional[str]
 
 
+@dataclass
+class WavespeedClientConfig:
+    timeout: float = 30
+    connect_timeout: float = 5
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60
+    http2: bool = True
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 8
+
+
 class WavespeedRepository:
     api_key: str
 
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        config: Optional[WavespeedClientConfig] = None,
+        base_url: str = BASE_URL,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
         if not api_key:
             raise ValueError("API key must be set")
         self.api_key = api_key
+        self.config = config or WavespeedClientConfig()
+        # One long-lived client so every request reuses pooled keep-alive connections
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            timeout=httpx.Timeout(
+                self.config.timeout, connect=self.config.connect_timeout
+            ),
+            limits=httpx.Limits(
+                max_connections=self.config.max_connections,
+                max_keepalive_connections=self.config.max_keepalive_connections,
+                keepalive_expiry=self.config.keepalive_expiry,
+            ),
+            http2=self.config.http2,
+            transport=transport,
+        )
+
+    async def close(self) -> None:
+        await self.client.aclose()
 
     async def generate_image(
         self,
         prompt: str,
     ) -> WavespeedGenerationOutput:
-        async with httpx.AsyncClient() as session:
-            response = await session.post(
-                "https://api.wavespeed.ai/api/v3/wavespeed-ai/flux-kontext-max/text-to-image",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.api_key}",
-                },
-                json={
-                    "prompt": prompt,
-                    # "aspect_ratio": "1:1",
-                    # "num_images": 1,
-                    # "guidance_scale": 3.5,
-                    # "safety_tolerance": "2"
-                },
-            )
-            response.raise_for_status()
-            result = response.json()
-            logger.info(
-                f"Task submitted successfully. Request ID: {result['data']['id']}"
-            )
-            return WavespeedGenerationOutput(
-                id=result["data"]["id"],
-                status=result["data"]["status"],
-                url=result["data"]["outputs"][0] if result["data"]["outputs"] else None,
-            )
+        response = await self._request(
+            "POST",
+            "/wavespeed-ai/flux-kontext-max/text-to-image",
+            # Submitting a job is not idempotent, only retry if it was never sent
+            is_idempotent=False,
+            json={
+                "prompt": prompt,
+                # "aspect_ratio": "1:1",
+                # "num_images": 1,
+                # "guidance_scale": 3.5,
+                # "safety_tolerance": "2"
+            },
+        )
+        result = response.json()
+        logger.info(f"Task submitted successfully. Request ID: {result['data']['id']}")
+        return WavespeedGenerationOutput(
+            id=result["data"]["id"],
+            status=result["data"]["status"],
+            url=result["data"]["outputs"][0] if result["data"]["outputs"] else None,
+        )
 
     async def get_result(self, request_id: str) -> WavespeedGenerationOutput:
-        with httpx.Client() as client:
-            response = client.get(
-                f"https://api.wavespeed.ai/api/v3/predictions/{request_id}/result",
-                headers={"Authorization": f"Bearer {self.api_key}"},
-            )
+        response = await self._request("GET", f"/predictions/{request_id}/result")
+        result = response.json()
+        return WavespeedGenerationOutput(
+            id=request_id,
+            status=result["data"]["status"],
+            url=result["data"]["outputs"][0] if result["data"]["outputs"] else None,
+        )
+
+    @asynccontextmanager
+    async def stream_output(self, url: str) -> AsyncIterator[httpx.Response]:
+        """
+        Streams a generated file over the pooled connections, outputs are public
+        so the API key isn't sent to their host
+        """
+        request = self.client.build_request("GET", url)
+        del request.headers["Authorization"]
+        response = await self.client.send(request, stream=True)
+        try:
             response.raise_for_status()
-            result = response.json()
-            return WavespeedGenerationOutput(
-                id=request_id,
-                status=result["data"]["status"],
-                url=result["data"]["outputs"][0] if result["data"]["outputs"] else None,
-            )
+            yield response
+        finally:
+            await response.aclose()
+
+    async def _request(
+        self, method: str, url: str, is_idempotent: bool = True, **kwargs
+    ) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.request(method, url, **kwargs)
+                if (
+                    response.status_code not in RETRYABLE_STATUS_CODES
+                    or attempt >= self.config.max_retries
+                    or (not is_idempotent and response.status_code != 429)
+                ):
+                    response.raise_for_status()
+                    return response
+                logger.warning(
+                    f"Wavespeed {method} {url} returned {response.status_code}, retrying"
+                )
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                if attempt >= self.config.max_retries:
+                    raise
+                logger.warning(f"Wavespeed {method} {url} connection failed, retrying")
+            except httpx.TransportError:
+                if not is_idempotent or attempt >= self.config.max_retries:
+                    raise
+                logger.warning(f"Wavespeed {method} {url} request failed, retrying")
+            await asyncio.sleep(self._get_backoff(attempt))
+            attempt += 1
+
+    def _get_backoff(self, attempt: int) -> float:
+        # Full jitter so retrying pollers don't synchronize
+        ceiling = min(self.config.backoff_max, self.config.backoff_base * 2**attempt)
+        return random.uniform(0, ceiling)
@@ -3,9 +3,11 @@ from typing import List
 from fastapi import APIRouter
 
 from app import api_logger
+from app.routers.routes import admin_router
 from app.routers.routes import auth_router, chat_router
 from app.routers.routes import files_router
 from app.routers.routes import job_router
+from app.routers.routes import metrics_router
 
 TAG_ROOT = "root"
 
@@ -18,6 +20,8 @@ routers_to_include: List[APIRouter] = [
     chat_router.router,
     files_router.router,
     job_router.router,
+    metrics_router.router,
+    admin_router.router,
 ]
 
 for router_to_include in routers_to_include:
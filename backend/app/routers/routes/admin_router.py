@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from fastapi import Depends
+
+from app import dependencies
+from app.repository.llm_repository import LlmRepository
+from app.service.admin import get_llm_providers_service
+from app.service.admin.entities import LlmProvidersResponse
+from app.service.auth import authentication
+
+TAG = "Admin"
+router = APIRouter(prefix="/admin", tags=[TAG])
+
+
+@router.get(
+    "/llm/providers",
+    response_model=LlmProvidersResponse,
+    summary="Circuit breaker state and health of every LLM provider and model",
+)
+async def get_llm_providers(
+    _: None = Depends(authentication.validate_admin_token),
+    llm_repository: LlmRepository = Depends(dependencies.get_llm_repository),
+):
+    return await get_llm_providers_service.execute(llm_repository)
@@ -1,10 +1,16 @@
+from typing import Optional
+
 from fastapi import APIRouter
 from fastapi import Body
 from fastapi import Path
 from fastapi import Depends
+from fastapi import Header
+from fastapi import Query
 from fastapi.responses import StreamingResponse
 
+import settings
 from app import dependencies
+from app.domain.users import get_rate_limit_error_use_case
 from app.domain.users.entities import User
 from app.repository.chat_configuration_repository import ChatConfigurationRepository
 from app.repository.chat_repository import ChatRepository
@@ -15,8 +21,10 @@ from app.repository.wavespeed_repository import WavespeedRepository
 from app.service.auth import authentication
 from app.service.chat import chat_details_service
 from app.service.chat import chat_service
+from app.service.chat import chat_stream
 from app.service.chat import chats_service
 from app.service.chat import create_chat_configuration_service
+from app.service.chat import get_rate_limit_headers_service
 from app.service.chat.entities import ChatConfigurationRequest
 from app.service.chat.entities import ChatRequest
 
@@ -46,11 +54,22 @@ async def chat(
     wavespeed_repository: WavespeedRepository = Depends(
         dependencies.get_wavespeed_repository
     ),
+    accept: Optional[str] = Header(
+        None, description="text/event-stream streams server-sent events."
+    ),
 ):
+    stream_format = chat_stream.get_format(accept)
+    # Loaded once for the headers and the rate limit check of the chat
+    quotas = await get_rate_limit_error_use_case.get_quotas(user, chat_repository)
     headers = {
         "X-Content-Type-Options": "nosniff",
         "Connection": "keep-alive",
+        **get_rate_limit_headers_service.execute(quotas),
     }
+    if stream_format == chat_stream.StreamFormat.SSE:
+        headers["Cache-Control"] = "no-cache"
+        # Stops nginx from buffering the events
+        headers["X-Accel-Buffering"] = "no"
 
     return StreamingResponse(
         chat_service.execute(
@@ -62,9 +81,11 @@ async def chat(
             configuration_repository,
             generation_repository,
             wavespeed_repository,
+            quotas,
+            stream_format,
         ),
         headers=headers,
-        media_type="text/plain",
+        media_type=stream_format.media_type,
     )
 
 
@@ -94,6 +115,16 @@ async def get_chats(
 )
 async def get_chat_details(
     chat_id: str = Path(description="Chat ID"),
+    limit: Optional[int] = Query(
+        default=None,
+        ge=1,
+        le=settings.CHAT_HISTORY_MAX_PAGE_SIZE,
+        description="Number of most recent messages to return, the whole history "
+        f"without limit and cursor, {settings.CHAT_HISTORY_PAGE_SIZE} with a cursor",
+    ),
+    cursor: Optional[str] = Query(
+        default=None, description="next_cursor of the previous page"
+    ),
     user: User = Depends(authentication.validate_session_token),
     chat_repository: ChatRepository = Depends(dependencies.get_chat_repository),
     chat_configuration_repository: ChatConfigurationRepository = Depends(
@@ -105,6 +136,8 @@ async def get_chat_details(
         user,
         chat_repository,
         chat_configuration_repository,
+        limit,
+        cursor,
     )
 
 
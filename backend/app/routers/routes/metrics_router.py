@@ -0,0 +1,49 @@
+from fastapi import APIRouter
+from fastapi import Depends
+
+from app import dependencies
+from app.repository.llm_repository import LlmRepository
+from app.service.auth import authentication
+from app.service.metrics import get_cache_metrics_service
+from app.service.metrics import get_database_metrics_service
+from app.service.metrics import get_llm_metrics_service
+from app.service.metrics.entities import CacheMetricsResponse
+from app.service.metrics.entities import DatabaseMetricsResponse
+from app.service.metrics.entities import LlmMetricsResponse
+
+TAG = "Metrics"
+router = APIRouter(prefix="/metrics", tags=[TAG])
+
+
+@router.get(
+    "/caches",
+    response_model=CacheMetricsResponse,
+    summary="Hit rates of the in-process caches",
+)
+async def get_cache_metrics(
+    _: None = Depends(authentication.validate_metrics_token),
+):
+    return await get_cache_metrics_service.execute()
+
+
+@router.get(
+    "/database",
+    response_model=DatabaseMetricsResponse,
+    summary="Connection pool gauges and read routing between the databases",
+)
+async def get_database_metrics(
+    _: None = Depends(authentication.validate_metrics_token),
+):
+    return await get_database_metrics_service.execute()
+
+
+@router.get(
+    "/llm",
+    response_model=LlmMetricsResponse,
+    summary="Hedge rate and wins of the primary and fallback LLM providers",
+)
+async def get_llm_metrics(
+    _: None = Depends(authentication.validate_metrics_token),
+    llm_repository: LlmRepository = Depends(dependencies.get_llm_repository),
+):
+    return await get_llm_metrics_service.execute(llm_repository)
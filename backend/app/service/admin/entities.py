@@ -0,0 +1,24 @@
+from typing import List
+from typing import Optional
+
+from pydantic import BaseModel
+from pydantic import Field
+
+
+class LlmProviderState(BaseModel):
+    provider: str
+    model_id: str
+    state: str = Field(description="closed, open or half_open")
+    error_rate: float = Field(description="Share of recent calls that failed")
+    timeout_rate: float
+    median_first_token_ms: Optional[float]
+    requests: int
+    failures: int
+    times_opened: int
+    open_remaining_seconds: float = Field(
+        description="Until the next trial request of an open circuit"
+    )
+
+
+class LlmProvidersResponse(BaseModel):
+    providers: List[LlmProviderState]
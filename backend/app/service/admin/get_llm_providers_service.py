@@ -0,0 +1,32 @@
+import time
+
+from app.repository.llm_repository import LlmRepository
+from app.repository.llm_router import CircuitState
+from app.service.admin.entities import LlmProviderState
+from app.service.admin.entities import LlmProvidersResponse
+
+
+async def execute(llm_repository: LlmRepository) -> LlmProvidersResponse:
+    router = llm_repository.router
+    now = time.monotonic()
+    providers = []
+    for target, health in router.get_states():
+        median = health.median_first_token_seconds
+        open_remaining = 0.0
+        if health.state == CircuitState.OPEN:
+            open_remaining = max(0.0, health.opened_at + router.open_seconds - now)
+        providers.append(
+            LlmProviderState(
+                provider=target.provider,
+                model_id=target.model_id,
+                state=health.state.value,
+                error_rate=health.error_rate,
+                timeout_rate=health.timeout_rate,
+                median_first_token_ms=median * 1000 if median is not None else None,
+                requests=health.requests,
+                failures=health.failures,
+                times_opened=health.times_opened,
+                open_remaining_seconds=open_remaining,
+            )
+        )
+    return LlmProvidersResponse(providers=providers)
@@ -1,13 +1,16 @@
+import hmac
 from typing import Optional
 from uuid import UUID
 
+import settings
 from app import dependencies, api_logger
 
 from app.domain.users.entities import User, JwtTokenError
+from app.repository import connection
 from app.repository.jwt_repository import verify_access_token
 from app.repository.user_repository import UserRepository
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
@@ -34,6 +37,8 @@ async def validate_session_token(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
             )
 
+        # Later reads of this request see the user's own writes
+        connection.consistency_key.set(user.uid)
         return user
 
     except JwtTokenError as e:
@@ -61,3 +66,32 @@ async def require_valid_session(
             detail="Authentication required. Please provide a valid session token.",
         )
     return user
+
+
+async def validate_metrics_token(
+    x_metrics_token: Optional[str] = Header(None),
+) -> None:
+    """
+    Dependency guarding the metrics endpoints, which are hidden unless
+    METRICS_TOKEN is configured
+    """
+    _validate_token(x_metrics_token, settings.METRICS_TOKEN, "metrics")
+
+
+async def validate_admin_token(
+    x_admin_token: Optional[str] = Header(None),
+) -> None:
+    """
+    Dependency guarding the admin endpoints, which are hidden unless
+    ADMIN_TOKEN is configured
+    """
+    _validate_token(x_admin_token, settings.ADMIN_TOKEN, "admin")
+
+
+def _validate_token(token: Optional[str], expected_token: str, name: str) -> None:
+    if not expected_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if not token or not hmac.compare_digest(token, expected_token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Invalid {name} token"
+        )
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from app.domain.chat import get_chat_details_use_case
 from app.domain.users.entities import User
 from app.repository.chat_configuration_repository import ChatConfigurationRepository
@@ -5,6 +7,7 @@ from app.repository.chat_repository import ChatRepository
 from app.service.chat.entities import ChatDetailsResponse
 from app.service.chat.entities import ChatMessage
 from app.service.chat.entities import UserChatConfiguration
+from app.service.utils import parse_cursor
 from app.service.utils import parse_uuid
 
 
@@ -13,12 +16,16 @@ async def execute(
     user: User,
     chat_repository: ChatRepository,
     configuration_repository: ChatConfigurationRepository,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
 ) -> ChatDetailsResponse:
     chat_details = await get_chat_details_use_case.execute(
         parse_uuid.parse(chat_id),
         user,
         chat_repository,
         configuration_repository,
+        limit,
+        parse_cursor.parse(cursor),
     )
 
     return ChatDetailsResponse(
@@ -45,4 +52,5 @@ async def execute(
         )
         if chat_details.configuration
         else None,
+        next_cursor=parse_cursor.encode(chat_details.next_before_sequence_number),
     )
@@ -1,7 +1,9 @@
-import json
+from typing import List
 
+import settings
 from app.domain.chat import chat_use_case
 from app.domain.chat.entities import ChatInput
+from app.domain.users.entities import MessageQuota
 from app.domain.users.entities import User
 from app.repository.chat_configuration_repository import ChatConfigurationRepository
 from app.repository.chat_repository import ChatRepository
@@ -10,6 +12,7 @@ from app.repository.llm_repository import LlmRepository
 from app.repository.generation_repository import GenerationRepository
 from app.repository.wavespeed_repository import WavespeedRepository
 from app.service import error_responses
+from app.service.chat import chat_stream
 from app.service.chat.entities import ChatRequest
 from app.service.utils import parse_uuid
 
@@ -25,20 +28,23 @@ async def execute(
     configuration_repository: ChatConfigurationRepository,
     generation_repository: GenerationRepository,
     wavespeed_repository: WavespeedRepository,
+    quotas: List[MessageQuota],
+    stream_format: chat_stream.StreamFormat = chat_stream.StreamFormat.NDJSON,
 ):
     chat_id = None
     if request.chat_id:
         try:
             chat_id = parse_uuid.parse(request.chat_id)
         except error_responses.APIErrorResponse as e:
-            yield json.dumps({"error": e.to_message()})
+            yield chat_stream.encode({"error": e.to_message()}, stream_format)
             return
 
     if len(request.content) > MAX_MESSAGE_LENGTH:
-        yield json.dumps(
+        yield chat_stream.encode(
             {
                 "error": f"Input message is too long, max length is {MAX_MESSAGE_LENGTH} characters."
-            }
+            },
+            stream_format,
         )
         return
 
@@ -54,7 +60,7 @@ async def execute(
         attachment_ids=uuid_attachment_ids,
     )
 
-    async for chunk in chat_use_case.execute(
+    chunks = chat_use_case.execute(
         chat_input,
         user,
         llm_repository,
@@ -63,5 +69,11 @@ async def execute(
         configuration_repository,
         generation_repository,
         wavespeed_repository,
+        quotas,
+    )
+    async for chunk in chat_stream.coalesce(
+        chunks,
+        settings.CHAT_STREAM_COALESCE_SECONDS,
+        settings.CHAT_STREAM_COALESCE_BYTES,
     ):
-        yield json.dumps(chunk.to_serializable_dict()) + "\n"
+        yield chat_stream.encode(chunk.to_serializable_dict(), stream_format)
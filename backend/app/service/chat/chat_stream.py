@@ -0,0 +1,103 @@
+import asyncio
+from enum import Enum
+from typing import AsyncGenerator
+from typing import AsyncIterator
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import orjson
+
+from app.domain.chat.entities import ChatOutputChunk
+from app.domain.chat.entities import ChunkOutput
+
+_END = object()
+_FLUSH = object()
+
+
+class StreamFormat(Enum):
+    # A JSON object per line, what clients get unless they ask for SSE
+    NDJSON = "text/plain"
+    SSE = "text/event-stream"
+
+    @property
+    def media_type(self) -> str:
+        return self.value
+
+
+def get_format(accept: Optional[str]) -> StreamFormat:
+    if accept and StreamFormat.SSE.value in accept:
+        return StreamFormat.SSE
+    return StreamFormat.NDJSON
+
+
+def encode(chunk: Dict, stream_format: StreamFormat) -> bytes:
+    data = orjson.dumps(chunk)
+    if stream_format == StreamFormat.SSE:
+        return b"data: " + data + b"\n\n"
+    return data + b"\n"
+
+
+async def coalesce(
+    chunks: AsyncIterator[ChatOutputChunk],
+    window_seconds: float,
+    window_bytes: int,
+) -> AsyncGenerator[ChatOutputChunk, None]:
+    """
+    Merges consecutive ChunkOutputs, so a response isn't written a token at a
+    time. Content is held for at most window_seconds or until window_bytes are
+    held, other chunks flush it and are passed on right away. chunks is run in
+    a task of its own, a timer can then flush while it waits for a delta
+    """
+    if window_seconds <= 0:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    # Unbounded, so the timer can always queue its flush. A response is held
+    # in memory for its messages anyway
+    queue: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.create_task(_produce(chunks, queue))
+    held: List[str] = []
+    held_bytes = 0
+    timer: Optional[asyncio.TimerHandle] = None
+    try:
+        while True:
+            item = await queue.get()
+            if isinstance(item, ChunkOutput):
+                if not item.content:
+                    continue
+                if timer is None:
+                    timer = loop.call_later(window_seconds, queue.put_nowait, _FLUSH)
+                held.append(item.content)
+                held_bytes += len(item.content.encode())
+                if held_bytes < window_bytes:
+                    continue
+            if held:
+                yield ChunkOutput(content="".join(held))
+                held, held_bytes = [], 0
+            if timer is not None:
+                timer.cancel()
+                timer = None
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            if isinstance(item, ChatOutputChunk) and not isinstance(item, ChunkOutput):
+                yield item
+    finally:
+        if timer is not None:
+            timer.cancel()
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+async def _produce(chunks: AsyncIterator[ChatOutputChunk], queue: asyncio.Queue):
+    try:
+        async for chunk in chunks:
+            await queue.put(chunk)
+    except Exception as e:
+        await queue.put(e)
+        return
+    await queue.put(_END)
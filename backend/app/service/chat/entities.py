@@ -51,6 +51,10 @@ class UserChatConfiguration(BaseModel):
 class ChatDetailsResponse(UserChat):
     messages: List[ChatMessage]
     configuration: Optional[UserChatConfiguration]
+    next_cursor: Optional[str] = Field(
+        description="Pass as cursor to get older messages, null on the oldest page",
+        default=None,
+    )
 
 
 class ChatsResponse(BaseModel):
@@ -0,0 +1,22 @@
+from datetime import timezone
+from typing import Dict
+from typing import List
+
+from app.domain.users.entities import MessageQuota
+
+
+def execute(quotas: List[MessageQuota]) -> Dict[str, str]:
+    """
+    Remaining quota of every rate limit window, e.g. X-RateLimit-Remaining-Day,
+    counted before the current request
+    """
+    headers = {}
+    for quota in quotas:
+        unit = quota.rate_limit.unit.capitalize()
+        headers[f"X-RateLimit-Limit-{unit}"] = str(quota.limit)
+        headers[f"X-RateLimit-Remaining-{unit}"] = str(quota.remaining)
+        if quota.reset_at:
+            headers[f"X-RateLimit-Reset-{unit}"] = str(
+                int(quota.reset_at.replace(tzinfo=timezone.utc).timestamp())
+            )
+    return headers
@@ -1,8 +1,12 @@
+from datetime import timedelta
 from uuid import UUID
 
-from app.domain.generation.entities import GenerationStatus
+import settings
+
 from app.domain.generation import get_generation_result_use_case
+from app.domain.generation.entities import GenerationOutput
 from app.domain.users.entities import User
+from app.repository import utils
 from app.repository.chat_repository import ChatRepository
 from app.repository.generation_repository import GenerationRepository
 from app.repository.cloud_storage_repository import CloudStorageRepository
@@ -24,14 +28,14 @@ async def execute(
         raise error_responses.NotFoundAPIError("Generation not found")
     if generation.user_id != user.uid:
         raise error_responses.InvalidCredentialsAPIError()
-    if generation.status == GenerationStatus.COMPLETED:
+    if generation.status.is_finished or _is_watched(generation):
         return JobStatus(
             id=str(generation.id),
-            status=generation.status,
+            status=generation.status.value,
             url=generation.url,
         )
-    generation = await get_generation_result_use_case.execute(
-        job_id,
+    generation = await get_generation_result_use_case.refresh(
+        generation,
         generation_repository,
         chat_repository,
         cloud_storage_repository,
@@ -39,6 +43,19 @@ async def execute(
     )
     return JobStatus(
         id=str(generation.id),
-        status=generation.status,
+        status=generation.status.value,
         url=generation.url,
     )
+
+
+def _is_watched(generation: GenerationOutput) -> bool:
+    """
+    The cron watcher finalizes generations, only fall back to polling Wavespeed
+    here if it hasn't touched this one recently
+    """
+    if not settings.GENERATION_WATCHER_ENABLED:
+        return False
+    stale_at = generation.last_updated_at + timedelta(
+        seconds=settings.GENERATION_WATCHER_STALE_SECONDS
+    )
+    return stale_at > utils.utcnow()
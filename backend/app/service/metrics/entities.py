@@ -0,0 +1,58 @@
+from typing import Dict
+from typing import Optional
+
+from pydantic import BaseModel
+from pydantic import Field
+
+
+class CacheMetrics(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+class CacheMetricsResponse(BaseModel):
+    caches: Dict[str, CacheMetrics]
+
+
+class HedgingMetrics(BaseModel):
+    requests: int
+    hedged: int
+    hedge_rate: float
+    primary_wins: int
+    fallback_wins: int
+    over_budget: int
+    hedge_delay_ms: float = Field(description="Current wait before hedging")
+
+
+class LlmMetricsResponse(BaseModel):
+    hedging: Dict[str, HedgingMetrics] = Field(
+        description="By model, empty when hedging is disabled"
+    )
+
+
+class ReadRoutingMetrics(BaseModel):
+    replica_reads: int
+    primary_reads: int = Field(
+        description="Reads sent to the primary because the replica was behind"
+    )
+    replay_lsn_checks: int
+    tracked_writes: int
+
+
+class PoolMetrics(BaseModel):
+    size: int
+    checked_out: int
+    idle: int
+    overflow: int = Field(description="Open connections beyond size")
+    checkouts: int
+    timeouts: int
+    average_checkout_wait_ms: float
+    max_checkout_wait_ms: float
+
+
+class DatabaseMetricsResponse(BaseModel):
+    pools: Dict[str, PoolMetrics]
+    read_routing: Optional[ReadRoutingMetrics] = Field(
+        description="Null when read-your-writes routing is disabled"
+    )
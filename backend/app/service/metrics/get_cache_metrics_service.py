@@ -0,0 +1,16 @@
+from app import cache
+from app.service.metrics.entities import CacheMetrics
+from app.service.metrics.entities import CacheMetricsResponse
+
+
+async def execute() -> CacheMetricsResponse:
+    return CacheMetricsResponse(
+        caches={
+            name: CacheMetrics(
+                hits=stats.hits,
+                misses=stats.misses,
+                hit_rate=stats.hit_rate,
+            )
+            for name, stats in cache.get_all_stats().items()
+        }
+    )
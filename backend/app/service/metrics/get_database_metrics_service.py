@@ -0,0 +1,36 @@
+from dataclasses import asdict
+
+from app.repository import connection
+from app.repository.connection import MeteredPool
+from app.service.metrics.entities import DatabaseMetricsResponse
+from app.service.metrics.entities import PoolMetrics
+from app.service.metrics.entities import ReadRoutingMetrics
+
+
+async def execute() -> DatabaseMetricsResponse:
+    router = connection.router
+    return DatabaseMetricsResponse(
+        pools={
+            name: _get_pool_metrics(pool)
+            for name, pool in connection.get_pools().items()
+        },
+        read_routing=ReadRoutingMetrics(**asdict(router.stats)) if router else None,
+    )
+
+
+def _get_pool_metrics(pool: MeteredPool) -> PoolMetrics:
+    stats = pool.stats
+    return PoolMetrics(
+        size=pool.size(),
+        checked_out=pool.checkedout(),
+        idle=pool.checkedin(),
+        overflow=max(0, pool.overflow()),
+        checkouts=stats.checkouts,
+        timeouts=stats.timeouts,
+        average_checkout_wait_ms=(
+            stats.checkout_wait_seconds * 1000 / stats.checkouts
+            if stats.checkouts
+            else 0
+        ),
+        max_checkout_wait_ms=stats.max_checkout_wait_seconds * 1000,
+    )
@@ -0,0 +1,20 @@
+from app.repository.llm_repository import LlmRepository
+from app.service.metrics.entities import HedgingMetrics
+from app.service.metrics.entities import LlmMetricsResponse
+
+
+async def execute(llm_repository: LlmRepository) -> LlmMetricsResponse:
+    return LlmMetricsResponse(
+        hedging={
+            model.value: HedgingMetrics(
+                requests=policy.stats.requests,
+                hedged=policy.stats.hedged,
+                hedge_rate=policy.stats.hedge_rate,
+                primary_wins=policy.stats.primary_wins,
+                fallback_wins=policy.stats.fallback_wins,
+                over_budget=policy.stats.over_budget,
+                hedge_delay_ms=policy.get_delay() * 1000,
+            )
+            for model, policy in llm_repository.hedge_policies.items()
+        }
+    )
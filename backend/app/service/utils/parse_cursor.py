@@ -0,0 +1,28 @@
+import base64
+import json
+from typing import Optional
+
+from app.service import error_responses
+
+
+def encode(sequence_number: Optional[int]) -> Optional[str]:
+    if sequence_number is None:
+        return None
+    data = json.dumps({"before": sequence_number}).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def parse(cursor: Optional[str]) -> Optional[int]:
+    """
+    Cursors are opaque to clients, so the keyset can change without breaking them
+    """
+    if not cursor:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sequence_number = json.loads(data)["before"]
+    except Exception:
+        raise error_responses.ValidationTypeError("Error, cursor is not valid")
+    if not isinstance(sequence_number, int) or sequence_number < 1:
+        raise error_responses.ValidationTypeError("Error, cursor is not valid")
+    return sequence_number
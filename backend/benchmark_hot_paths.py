@@ -0,0 +1,166 @@
+"""
+Times the in-process hot paths of a chat turn against how they were done
+before they were optimized. Timings depend on the machine, so they are
+printed for comparison instead of asserted in the unit tests:
+
+    python benchmark_hot_paths.py turn_assembly
+    python benchmark_hot_paths.py row_mapping
+"""
+
+import argparse
+import json
+import time
+from copy import deepcopy
+from typing import Callable
+from typing import Dict
+from typing import List
+
+from sqlalchemy import Result
+from sqlalchemy.engine.result import IteratorResult
+from sqlalchemy.engine.result import SimpleResultMetaData
+from uuid_extensions import uuid7
+
+from app.domain.chat import chat_use_case
+from app.domain.chat.entities import Message
+from app.domain.chat.entities import ToolCall
+from app.repository import chat_repository
+
+REPEATS = 5
+
+
+def _best_of(callback: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        callback()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def _get_messages(count: int) -> List[Message]:
+    chat_id = uuid7()
+    return [
+        Message(
+            id=uuid7(),
+            chat_id=chat_id,
+            role="user" if i % 2 else "assistant",
+            content="Hello there, how are you doing today? " * 10,
+            attachment_ids=[uuid7()],
+            tool_calls=[ToolCall(id="call", function={"name": "search"})],
+            sequence_number=i,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def _assemble_with_copies(messages: List[Message]) -> List[Dict]:
+    # How turns were assembled before the message cache
+    copies = [deepcopy(m) for m in messages]
+    return [m.to_llm_ready_dict() for m in copies[:-1]] + [
+        copies[-1].to_llm_ready_dict_with_images([])
+    ]
+
+
+def turn_assembly() -> None:
+    for history_length in [100, 1000, 4000]:
+        messages = _get_messages(history_length)
+        # The first turn fills the cache
+        chat_use_case._get_messages_to_llm(messages, [])
+        cached = _best_of(lambda: chat_use_case._get_messages_to_llm(messages, []))
+        copied = _best_of(lambda: _assemble_with_copies(messages))
+        print(
+            f"{history_length} messages: cached {cached * 1000:.2f} ms, "
+            f"copied {copied * 1000:.2f} ms, {copied / cached:.1f}x"
+        )
+
+
+def _get_message_rows(count: int) -> List[Dict]:
+    tool_calls = json.dumps([{"id": "call", "function": {"name": "search"}}])
+    chat_id = uuid7()
+    return [
+        {
+            "id": uuid7(),
+            "chat_id": chat_id,
+            "role": "assistant",
+            "content": "Hello there, how are you doing today? " * 10,
+            "image_url": None,
+            "model": "default",
+            "tool_call_id": None,
+            "tool_name": None,
+            # Like in a chat, only some messages call tools
+            "tool_calls": tool_calls if i % 10 == 0 else None,
+            "sequence_number": i,
+            "attachment_ids": [],
+            "created_at": None,
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def _get_result(rows: List[Dict]) -> Result:
+    return IteratorResult(
+        SimpleResultMetaData(list(rows[0])), iter([tuple(r.values()) for r in rows])
+    )
+
+
+def _to_message_by_name(row) -> Message:
+    # How rows were mapped before RowMapper
+    tool_calls = None
+    if row.tool_calls:
+        tool_calls = [
+            ToolCall(id=tc["id"], function=tc["function"])
+            for tc in json.loads(row.tool_calls)
+        ]
+    tool_call = None
+    if row.tool_call_id and row.tool_name:
+        tool_call = ToolCall(id=row.tool_call_id, function={"name": row.tool_name})
+    return Message(
+        id=row.id,
+        chat_id=row.chat_id,
+        role=row.role,
+        content=row.content,
+        image_url=row.image_url,
+        model=row.model,
+        tool_call=tool_call,
+        tool_calls=tool_calls,
+        attachment_ids=row.attachment_ids,
+        sequence_number=row.sequence_number,
+    )
+
+
+def row_mapping() -> None:
+    rows = _get_message_rows(10_000)
+
+    def _rows_per_second(map_rows: Callable) -> float:
+        timings = []
+        for _ in range(REPEATS):
+            result = _get_result(rows)
+            start = time.perf_counter()
+            map_rows(result)
+            timings.append(time.perf_counter() - start)
+        return len(rows) / min(timings)
+
+    by_position = _rows_per_second(chat_repository.MESSAGE_MAPPER.all)
+    by_name = _rows_per_second(
+        lambda result: [_to_message_by_name(row) for row in result]
+    )
+    print(
+        f"{len(rows)} message rows: by position {by_position:.0f} rows/s, "
+        f"by name {by_name:.0f} rows/s, {by_position / by_name:.1f}x"
+    )
+
+
+BENCHMARKS: Dict[str, Callable[[], None]] = {
+    "turn_assembly": turn_assembly,
+    "row_mapping": row_mapping,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("benchmark", choices=[*BENCHMARKS, "all"])
+    args = parser.parse_args()
+
+    for name, benchmark in BENCHMARKS.items():
+        if args.benchmark in (name, "all"):
+            print(f"-- {name}")
+            benchmark()
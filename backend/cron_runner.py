@@ -2,8 +2,12 @@ import asyncio
 from typing import Awaitable
 from typing import Callable
 
+import settings
 from app import api_logger
 from app import dependencies
+from app.cron import generation_watcher_job
+from app.cron import intent_cache_cleanup_job
+from app.cron import message_count_cleanup_job
 from app.cron import summarization_job
 from app.repository import connection
 
@@ -11,13 +15,20 @@ logger = api_logger.get()
 
 
 async def start_cron_jobs():
-    connection.init_defaults()
+    connection.init_defaults(settings.DB_CRON_POOL_SIZE)
 
     tasks = [
         (_run_character_summarization_job, "Chat summarization job", 900),
+        (_run_message_count_cleanup_job, "Message count cleanup job", 3600),
+        (_run_intent_cache_cleanup_job, "Intent cache cleanup job", 3600),
     ]
+    if settings.GENERATION_WATCHER_ENABLED:
+        tasks.append((_run_generation_watcher_job, "Generation watcher job", 1))
 
-    await asyncio.gather(*[_cron_runner(*t) for t in tasks])
+    try:
+        await asyncio.gather(*[_cron_runner(*t) for t in tasks])
+    finally:
+        await dependencies.close()
     logger.info("Cron jobs done")
 
 
@@ -48,5 +59,22 @@ async def _run_character_summarization_job():
     await summarization_job.execute(repository, llm_repository)
 
 
+async def _run_message_count_cleanup_job():
+    await message_count_cleanup_job.execute(dependencies.get_chat_repository())
+
+
+async def _run_intent_cache_cleanup_job():
+    await intent_cache_cleanup_job.execute(dependencies.get_intent_cache_repository())
+
+
+async def _run_generation_watcher_job():
+    await generation_watcher_job.execute(
+        dependencies.get_generation_repository(),
+        dependencies.get_chat_repository(),
+        dependencies.get_cloud_storage_repository(),
+        dependencies.get_wavespeed_repository(),
+    )
+
+
 if __name__ == "__main__":
     asyncio.run(start_cron_jobs())
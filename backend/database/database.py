@@ -4,9 +4,11 @@ from typing import Optional
 from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import DateTime
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import JSON
 from sqlalchemy import String
+from sqlalchemy import text
 
 from sqlalchemy import ForeignKey
 from sqlalchemy import ARRAY
@@ -23,6 +25,12 @@ Base = declarative_base()
 
 class UserProfile(Base):
     __tablename__ = "user_profile"
+    __table_args__ = (
+        Index(
+            "ix_user_profile_auth_provider_provider_id", "auth_provider", "provider_id"
+        ),
+        Index("ix_user_profile_email", "email"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     email = Column(String(), nullable=False)
@@ -42,6 +50,13 @@ class UserProfile(Base):
 
 class ChatConfiguration(Base):
     __tablename__ = "chat_configuration"
+    __table_args__ = (
+        Index(
+            "ix_chat_configuration_user_profile_id_id",
+            "user_profile_id",
+            text("id DESC"),
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_profile_id = Column(
@@ -85,6 +100,10 @@ class ChatConfigurationSummary(Base):
 
 class Chat(Base):
     __tablename__ = "chat"
+    __table_args__ = (
+        Index("ix_chat_chat_configuration_id", "chat_configuration_id"),
+        Index("ix_chat_user_profile_id_id", "user_profile_id", text("id DESC")),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_profile_id = Column(
@@ -98,6 +117,29 @@ class Chat(Base):
         nullable=True,
     )
     title = Column(String(), nullable=False)
+    # Last message sequence number handed out, locked while allocating new ones
+    last_sequence_number = Column(Integer, nullable=False, server_default="0")
+
+    # Autogenerated
+    created_at = Column(DateTime, nullable=False)
+    last_updated_at = Column(
+        DateTime, default=datetime.datetime.now(datetime.UTC), nullable=False
+    )
+
+
+class ChatSummary(Base):
+    __tablename__ = "chat_summary"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    chat_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey(Chat.id),
+        unique=True,
+        nullable=False,
+    )
+    # Rolling summary of the messages that no longer fit the LLM context
+    summary = Column(String(), nullable=False)
+    summarized_until_sequence_number = Column(Integer, nullable=False)
 
     # Autogenerated
     created_at = Column(DateTime, nullable=False)
@@ -108,6 +150,14 @@ class Chat(Base):
 
 class Message(Base):
     __tablename__ = "message"
+    __table_args__ = (
+        Index(
+            "ix_message_chat_id_sequence_number",
+            "chat_id",
+            "sequence_number",
+            unique=True,
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     chat_id = Column(
@@ -142,6 +192,14 @@ class Message(Base):
 
 class File(Base):
     __tablename__ = "file"
+    __table_args__ = (
+        Index(
+            "ix_file_user_profile_id_created_at_not_deleted",
+            "user_profile_id",
+            text("created_at DESC"),
+            postgresql_where=text("deleted = false"),
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_profile_id = Column(
@@ -164,6 +222,7 @@ class File(Base):
 
 class Generation(Base):
     __tablename__ = "generation"
+    __table_args__ = (Index("ix_generation_status_created_at", "status", "created_at"),)
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_profile_id = Column(
@@ -185,3 +244,37 @@ class Generation(Base):
     last_updated_at = Column(
         DateTime, default=datetime.datetime.now(datetime.UTC), nullable=False
     )
+
+
+class UserMessageCount(Base):
+    __tablename__ = "user_message_count"
+
+    user_profile_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey(UserProfile.id),
+        primary_key=True,
+    )
+    # Start of the hour the user messages were sent in
+    bucket_start = Column(DateTime, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+    # Autogenerated
+    created_at = Column(DateTime, nullable=False)
+    last_updated_at = Column(
+        DateTime, default=datetime.datetime.now(datetime.UTC), nullable=False
+    )
+
+
+class IntentCache(Base):
+    __tablename__ = "intent_cache"
+    __table_args__ = (Index("ix_intent_cache_last_updated_at", "last_updated_at"),)
+
+    # sha256 of the normalized message
+    key = Column(String(), primary_key=True)
+    intent = Column(String(), nullable=False)
+
+    # Autogenerated
+    created_at = Column(DateTime, nullable=False)
+    last_updated_at = Column(
+        DateTime, default=datetime.datetime.now(datetime.UTC), nullable=False
+    )
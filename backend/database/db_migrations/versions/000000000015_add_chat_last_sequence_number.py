@@ -0,0 +1,42 @@
+"""Add chat last_sequence_number counter
+
+Revision ID: 000000000015
+Revises: 000000000014
+Create Date: 2026-10-18 12:03:12.518204
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "000000000015"
+down_revision = "000000000014"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "chat",
+        sa.Column(
+            "last_sequence_number", sa.Integer(), nullable=False, server_default="0"
+        ),
+    )
+    op.execute(
+        """
+        UPDATE chat
+        SET last_sequence_number = m.max_sequence_number
+        FROM (
+            SELECT chat_id, MAX(sequence_number) AS max_sequence_number
+            FROM message
+            GROUP BY chat_id
+        ) m
+        WHERE chat.id = m.chat_id;
+        """
+    )
+
+
+def downgrade():
+    op.drop_column("chat", "last_sequence_number")
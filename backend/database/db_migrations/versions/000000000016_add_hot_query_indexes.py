@@ -0,0 +1,117 @@
+"""Add indexes for the hot query paths
+
+Revision ID: 000000000016
+Revises: 000000000015
+Create Date: 2026-10-18 12:41:05.190346
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "000000000016"
+down_revision = "000000000015"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY can't run inside a transaction, but it doesn't block writes
+    with op.get_context().autocommit_block():
+        # ChatRepository.get_messages
+        op.create_index(
+            "ix_message_chat_id_sequence_number",
+            "message",
+            ["chat_id", "sequence_number"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # ChatRepository.get_message_count_by_user
+        op.create_index(
+            "ix_message_chat_id_id_user",
+            "message",
+            ["chat_id", "id"],
+            postgresql_where=sa.text("role = 'user'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # ChatConfigurationRepository.get_messages_by_configuration
+        op.create_index(
+            "ix_chat_chat_configuration_id",
+            "chat",
+            ["chat_configuration_id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # ChatRepository.get_by_user, the rate limit join
+        op.create_index(
+            "ix_chat_user_profile_id_id",
+            "chat",
+            ["user_profile_id", sa.text("id DESC")],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # ChatConfigurationRepository.get_latest_by_user
+        op.create_index(
+            "ix_chat_configuration_user_profile_id_id",
+            "chat_configuration",
+            ["user_profile_id", sa.text("id DESC")],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # FileRepository.get_by_user
+        op.create_index(
+            "ix_file_user_profile_id_created_at_not_deleted",
+            "file",
+            ["user_profile_id", sa.text("created_at DESC")],
+            postgresql_where=sa.text("deleted = false"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # UserRepository.get_by_provider
+        op.create_index(
+            "ix_user_profile_auth_provider_provider_id",
+            "user_profile",
+            ["auth_provider", "provider_id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # UserRepository.get_by_email
+        op.create_index(
+            "ix_user_profile_email",
+            "user_profile",
+            ["email"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # GenerationRepository.get_pending, polled by the generation watcher
+        op.create_index(
+            "ix_generation_status_created_at",
+            "generation",
+            ["status", "created_at"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table_name, index_name in [
+            ("generation", "ix_generation_status_created_at"),
+            ("user_profile", "ix_user_profile_email"),
+            ("user_profile", "ix_user_profile_auth_provider_provider_id"),
+            ("file", "ix_file_user_profile_id_created_at_not_deleted"),
+            ("chat_configuration", "ix_chat_configuration_user_profile_id_id"),
+            ("chat", "ix_chat_user_profile_id_id"),
+            ("chat", "ix_chat_chat_configuration_id"),
+            ("message", "ix_message_chat_id_id_user"),
+            ("message", "ix_message_chat_id_sequence_number"),
+        ]:
+            op.drop_index(
+                index_name,
+                table_name=table_name,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
@@ -0,0 +1,76 @@
+"""Add user_message_count table
+
+Revision ID: 000000000017
+Revises: 000000000016
+Create Date: 2026-10-18 13:20:44.901127
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "000000000017"
+down_revision = "000000000016"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user_message_count",
+        sa.Column("user_profile_id", sa.UUID(), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("last_updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_profile_id"],
+            ["user_profile.id"],
+        ),
+        sa.PrimaryKeyConstraint("user_profile_id", "bucket_start"),
+    )
+    # Seed the counters with the messages still inside the rate limit window
+    op.execute(
+        """
+        INSERT INTO user_message_count (
+            user_profile_id, bucket_start, count, created_at, last_updated_at
+        )
+        SELECT
+            c.user_profile_id,
+            date_trunc('hour', m.created_at),
+            COUNT(*),
+            now() AT TIME ZONE 'utc',
+            now() AT TIME ZONE 'utc'
+        FROM message m
+        JOIN chat c ON m.chat_id = c.id
+        WHERE
+            m.role = 'user'
+            AND m.created_at >= date_trunc('hour', now() AT TIME ZONE 'utc')
+                - interval '24 hours'
+        GROUP BY c.user_profile_id, date_trunc('hour', m.created_at);
+        """
+    )
+    # Only get_message_count_by_user read it, every message insert still paid
+    # for it
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_message_chat_id_id_user",
+            table_name="message",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_message_chat_id_id_user",
+            "message",
+            ["chat_id", "id"],
+            postgresql_where=sa.text("role = 'user'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+    op.drop_table("user_message_count")
@@ -0,0 +1,39 @@
+"""Add chat_summary table
+
+Revision ID: 000000000018
+Revises: 000000000017
+Create Date: 2026-10-18 14:41:09.318220
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "000000000018"
+down_revision = "000000000017"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "chat_summary",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("chat_id", sa.UUID(), nullable=False),
+        sa.Column("summary", sa.String(), nullable=False),
+        sa.Column("summarized_until_sequence_number", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("last_updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["chat_id"],
+            ["chat.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("chat_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("chat_summary")
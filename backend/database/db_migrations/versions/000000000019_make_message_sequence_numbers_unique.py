@@ -0,0 +1,98 @@
+"""Make message sequence numbers unique per chat
+
+Revision ID: 000000000019
+Revises: 000000000018
+Create Date: 2026-10-18 16:02:37.514208
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "000000000019"
+down_revision = "000000000018"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Sequence numbers handed out before the chat counter could collide,
+    # the chats with duplicates are renumbered in their current order
+    op.execute(
+        """
+        UPDATE message m
+        SET sequence_number = renumbered.sequence_number
+        FROM (
+            SELECT
+                id,
+                row_number() OVER (
+                    PARTITION BY chat_id
+                    ORDER BY sequence_number, created_at, id
+                ) AS sequence_number
+            FROM message
+            WHERE chat_id IN (
+                SELECT chat_id
+                FROM message
+                GROUP BY chat_id, sequence_number
+                HAVING count(*) > 1
+            )
+        ) renumbered
+        WHERE m.id = renumbered.id
+            AND m.sequence_number IS DISTINCT FROM renumbered.sequence_number
+        """
+    )
+    op.execute(
+        """
+        UPDATE chat c
+        SET last_sequence_number = m.max_sequence_number
+        FROM (
+            SELECT chat_id, MAX(sequence_number) AS max_sequence_number
+            FROM message
+            GROUP BY chat_id
+        ) m
+        WHERE c.id = m.chat_id
+            AND c.last_sequence_number < m.max_sequence_number
+        """
+    )
+    # Keyset pagination of the history relies on the order being total
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_message_chat_id_sequence_number_unique",
+            "message",
+            ["chat_id", "sequence_number"],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_message_chat_id_sequence_number",
+            table_name="message",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.execute(
+        "ALTER INDEX ix_message_chat_id_sequence_number_unique "
+        "RENAME TO ix_message_chat_id_sequence_number"
+    )
+
+
+def downgrade():
+    op.execute(
+        "ALTER INDEX ix_message_chat_id_sequence_number "
+        "RENAME TO ix_message_chat_id_sequence_number_unique"
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_message_chat_id_sequence_number",
+            "message",
+            ["chat_id", "sequence_number"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_message_chat_id_sequence_number_unique",
+            table_name="message",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
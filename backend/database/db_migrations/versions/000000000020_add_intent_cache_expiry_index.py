@@ -0,0 +1,38 @@
+"""Add intent_cache last_updated_at index
+
+Revision ID: 000000000020
+Revises: 000000000019
+Create Date: 2026-10-18 16:34:52.871043
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "000000000020"
+down_revision = "000000000019"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # IntentCacheRepository.delete_expired, run by the cleanup cron job
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_intent_cache_last_updated_at",
+            "intent_cache",
+            ["last_updated_at"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_intent_cache_last_updated_at",
+            table_name="intent_cache",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,357 @@
+"""
+Seeds a local database and records EXPLAIN ANALYZE plans of the API's hot
+queries, run it before and after a migration to compare the plans:
+
+    python explain_hot_queries.py seed
+    alembic downgrade 000000000015
+    python explain_hot_queries.py explain before
+    alembic upgrade head
+    python explain_hot_queries.py explain after
+
+Plans are written to explain/<label>.txt
+"""
+
+import argparse
+import datetime
+import json
+import random
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+import psycopg
+
+import settings
+
+SEED = 42
+OUTPUT_DIR = Path("explain")
+
+HOT_QUERIES: Dict[str, str] = {
+    # Newest and oldest page of the longest chat, keyset pages should cost
+    # the same wherever they are
+    "chat_repository.get_latest_messages": """
+        SELECT *
+        FROM (
+            SELECT id, chat_id, role, content, sequence_number
+            FROM message
+            WHERE chat_id = %(chat_id)s AND sequence_number < %(max_sequence_number)s
+            ORDER BY sequence_number DESC
+            LIMIT 51
+        ) latest
+        ORDER BY sequence_number
+    """,
+    "chat_repository.get_latest_messages.oldest_page": """
+        SELECT *
+        FROM (
+            SELECT id, chat_id, role, content, sequence_number
+            FROM message
+            WHERE chat_id = %(chat_id)s AND sequence_number < %(oldest_page_before)s
+            ORDER BY sequence_number DESC
+            LIMIT 51
+        ) latest
+        ORDER BY sequence_number
+    """,
+    "chat_repository.get_by_user": """
+        SELECT id, chat_configuration_id, user_profile_id, title, created_at
+        FROM chat
+        WHERE user_profile_id = %(user_id)s
+        ORDER BY id DESC
+    """,
+    "chat_repository.get_user_message_counts": """
+        SELECT bucket_start, count
+        FROM user_message_count
+        WHERE user_profile_id = %(user_id)s AND bucket_start >= %(min_bucket_start)s
+        ORDER BY bucket_start
+    """,
+    "chat_configuration_repository.get_latest_by_user": """
+        SELECT id, user_name, ai_name, description, role
+        FROM chat_configuration
+        WHERE user_profile_id = %(user_id)s
+        ORDER BY id DESC
+        LIMIT 1
+    """,
+    "chat_configuration_repository.get_messages_by_configuration": """
+        SELECT m.id, m.chat_id, m.role, m.content
+        FROM message m
+        LEFT JOIN chat c ON m.chat_id = c.id
+        WHERE
+            c.chat_configuration_id = %(configuration_id)s
+            AND m.role != 'system'
+            AND m.tool_calls IS NULL
+        ORDER BY m.id
+    """,
+    "file_repository.get_by_user": """
+        SELECT id, filename, content_type, size, created_at
+        FROM file
+        WHERE user_profile_id = %(user_id)s AND deleted = false
+        ORDER BY created_at DESC
+    """,
+    "user_repository.get_by_provider": """
+        SELECT id, email
+        FROM user_profile
+        WHERE auth_provider = %(auth_provider)s AND provider_id = %(provider_id)s
+    """,
+    "user_repository.get_by_email": """
+        SELECT id, email
+        FROM user_profile
+        WHERE email = %(email)s
+    """,
+    "generation_repository.get_pending": """
+        SELECT id, status, created_at
+        FROM generation
+        WHERE
+            status IN ('CREATED', 'PROCESSING')
+            AND created_at > %(min_created_at)s
+        ORDER BY id
+    """,
+}
+
+
+SQL_SEED_MESSAGE_COUNTS = """
+INSERT INTO user_message_count (
+    user_profile_id, bucket_start, count, created_at, last_updated_at
+)
+SELECT c.user_profile_id, date_trunc('hour', m.created_at), COUNT(*), now(), now()
+FROM message m
+JOIN chat c ON m.chat_id = c.id
+WHERE m.role = 'user'
+GROUP BY 1, 2
+ON CONFLICT DO NOTHING
+"""
+
+
+def _get_connection() -> psycopg.Connection:
+    return psycopg.connect(
+        host=settings.DB_HOST,
+        port=settings.DB_PORT,
+        dbname=settings.DB_DATABASE,
+        user=settings.DB_USER,
+        password=settings.DB_PASSWORD,
+    )
+
+
+def _uuid7(timestamp: datetime.datetime, rng: random.Random) -> uuid.UUID:
+    # Time ordered like the API's uuid7 ids, but reproducible
+    value = int(timestamp.timestamp() * 1000) << 80 | rng.getrandbits(80)
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return uuid.UUID(int=value)
+
+
+def seed(
+    users: int, chats_per_user: int, messages_per_chat: int, long_chat_messages: int
+) -> None:
+    rng = random.Random(SEED)
+    now = datetime.datetime(2026, 1, 1)
+    rows: Dict[str, List[Tuple]] = {
+        "user_profile": [],
+        "chat_configuration": [],
+        "chat": [],
+        "message": [],
+        "file": [],
+        "generation": [],
+    }
+    for u in range(users):
+        created_at = now - datetime.timedelta(days=rng.randint(1, 365))
+        user_id = _uuid7(created_at, rng)
+        rows["user_profile"].append(
+            (
+                user_id,
+                f"user{u}@example.com",
+                f"User {u}",
+                rng.choice(["google", "apple"]),
+                str(rng.getrandbits(64)),
+                True,
+                now,
+                created_at,
+                now,
+            )
+        )
+        configuration_id = _uuid7(created_at, rng)
+        rows["chat_configuration"].append(
+            (configuration_id, user_id, "User", "AI", "", "", created_at, now)
+        )
+        chat_lengths = [messages_per_chat] * chats_per_user
+        if u == 0:
+            # A long-running character chat
+            chat_lengths.append(long_chat_messages)
+        for chat_length in chat_lengths:
+            chat_at = created_at + datetime.timedelta(
+                minutes=rng.randint(0, int((now - created_at).total_seconds() / 60))
+            )
+            chat_id = _uuid7(chat_at, rng)
+            rows["chat"].append(
+                (
+                    chat_id,
+                    user_id,
+                    configuration_id,
+                    "Chat",
+                    chat_length,
+                    chat_at,
+                    now,
+                )
+            )
+            for m in range(chat_length):
+                message_at = chat_at + datetime.timedelta(seconds=m * 30)
+                rows["message"].append(
+                    (
+                        _uuid7(message_at, rng),
+                        chat_id,
+                        m + 1,
+                        "user" if m % 2 == 0 else "assistant",
+                        "x" * rng.randint(20, 400),
+                        [],
+                        message_at,
+                        message_at,
+                    )
+                )
+        for _ in range(5):
+            file_at = created_at + datetime.timedelta(days=rng.randint(0, 30))
+            rows["file"].append(
+                (
+                    _uuid7(file_at, rng),
+                    user_id,
+                    "image.png",
+                    "storage/image.png",
+                    "image/png",
+                    rng.randint(1000, 10_000_000),
+                    rng.random() < 0.2,
+                    file_at,
+                    file_at,
+                )
+            )
+        for _ in range(3):
+            generation_at = created_at + datetime.timedelta(days=rng.randint(0, 30))
+            rows["generation"].append(
+                (
+                    _uuid7(generation_at, rng),
+                    user_id,
+                    "IMAGE",
+                    "a cat",
+                    rng.choice(["COMPLETED"] * 18 + ["FAILED", "PROCESSING"]),
+                    json.dumps({}),
+                    generation_at,
+                    generation_at,
+                )
+            )
+
+    columns = {
+        "user_profile": "id, email, name, auth_provider, provider_id, "
+        "is_email_verified, last_login_at, created_at, last_updated_at",
+        "chat_configuration": "id, user_profile_id, user_name, ai_name, "
+        "description, role, created_at, last_updated_at",
+        "chat": "id, user_profile_id, chat_configuration_id, title, "
+        "last_sequence_number, created_at, last_updated_at",
+        "message": "id, chat_id, sequence_number, role, content, attachment_ids, "
+        "created_at, last_updated_at",
+        "file": "id, user_profile_id, filename, full_path, content_type, size, "
+        "deleted, created_at, last_updated_at",
+        "generation": "id, user_profile_id, type, prompt, status, data, "
+        "created_at, last_updated_at",
+    }
+    with _get_connection() as connection:
+        for table, table_rows in rows.items():
+            with connection.cursor().copy(
+                f"COPY {table} ({columns[table]}) FROM STDIN"
+            ) as copy:
+                for row in table_rows:
+                    copy.write_row(row)
+            print(f"Seeded {len(table_rows)} rows into {table}")
+        if _table_exists(connection, "user_message_count"):
+            connection.execute(SQL_SEED_MESSAGE_COUNTS)
+        connection.execute("ANALYZE")
+
+
+def _table_exists(connection: psycopg.Connection, table: str) -> bool:
+    return (
+        connection.execute("SELECT to_regclass(%s)", (table,)).fetchone()[0] is not None
+    )
+
+
+def _get_params(connection: psycopg.Connection) -> Dict:
+    user = connection.execute(
+        """
+        SELECT u.id, u.email, u.auth_provider, u.provider_id
+        FROM user_profile u
+        ORDER BY u.email
+        LIMIT 1
+        """
+    ).fetchone()
+    chat = connection.execute(
+        """
+        SELECT id, chat_configuration_id
+        FROM chat
+        WHERE user_profile_id = %s
+        ORDER BY last_sequence_number DESC
+        LIMIT 1
+        """,
+        (user[0],),
+    ).fetchone()
+    newest = connection.execute("SELECT MAX(created_at) FROM message").fetchone()[0]
+    return {
+        "user_id": user[0],
+        "email": user[1],
+        "auth_provider": user[2],
+        "provider_id": user[3],
+        "chat_id": chat[0],
+        "configuration_id": chat[1],
+        "max_sequence_number": 2**31 - 1,
+        "oldest_page_before": 51,
+        "min_bucket_start": newest - datetime.timedelta(hours=24),
+        "min_created_at": newest - datetime.timedelta(hours=1),
+    }
+
+
+def explain(label: str) -> None:
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    output = []
+    summary = []
+    with _get_connection() as connection:
+        params = _get_params(connection)
+        for name, query in HOT_QUERIES.items():
+            table = re.search(r"FROM\s+(\w+)", query).group(1)
+            if not _table_exists(connection, table):
+                # Tables added by the migration being compared
+                summary.append(f"{name}: skipped, {table} does not exist")
+                continue
+            # Warm up so both runs are measured with a hot cache
+            connection.execute(query, params).fetchall()
+            start = time.perf_counter()
+            plan = connection.execute(
+                f"EXPLAIN (ANALYZE, BUFFERS) {query}", params
+            ).fetchall()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            output.append(f"-- {name}\n" + "\n".join(row[0] for row in plan))
+            summary.append(f"{name}: {elapsed_ms:.2f} ms")
+
+    path = OUTPUT_DIR / f"{label}.txt"
+    path.write_text("\n\n".join(summary + output) + "\n")
+    print("\n".join(summary))
+    print(f"Plans written to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    seed_parser = subparsers.add_parser("seed", help="Insert reproducible test data")
+    seed_parser.add_argument("--users", type=int, default=2000)
+    seed_parser.add_argument("--chats-per-user", type=int, default=10)
+    seed_parser.add_argument("--messages-per-chat", type=int, default=20)
+    seed_parser.add_argument("--long-chat-messages", type=int, default=10_000)
+    explain_parser = subparsers.add_parser("explain", help="Record query plans")
+    explain_parser.add_argument("label", help="e.g. before or after")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        seed(
+            args.users,
+            args.chats_per_user,
+            args.messages_per_chat,
+            args.long_chat_messages,
+        )
+    else:
+        explain(args.label)
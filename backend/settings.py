@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 
@@ -36,26 +37,108 @@ DB_PASSWORD_READ = os.getenv("DB_PASSWORD_READ", "passw0rd")
 DB_DATABASE_READ = os.getenv("DB_DATABASE_READ", "agents")
 DB_HOST_READ = os.getenv("DB_HOST_READ", "localhost")
 DB_PORT_READ = os.getenv("DB_PORT_READ", "5435")
+# Gunicorn worker count, each worker has its own connection pools
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Connections the service may open to each database, the cron runner pool and
+# the LISTEN connections of the caches are subtracted and the rest is split
+# between the workers, unless DB_POOL_SIZE sets the pool size of every worker.
+# Leave room below max_connections for other clients (migrations, psql)
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "100"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "0")) or None
+# Pool size of the cron runner, it runs a handful of jobs one query at a time
+DB_CRON_POOL_SIZE = int(os.getenv("DB_CRON_POOL_SIZE", "3"))
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "0"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "1"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+# Connections opened per pool at startup
+DB_POOL_WARMUP_SIZE = int(os.getenv("DB_POOL_WARMUP_SIZE", "5"))
+# Disables prepared statements, required behind PgBouncer in transaction mode
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+# Executions of a statement on a connection before psycopg prepares it
+# server-side, every hot query is a constant so they are prepared early
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "1"))
+# Reads of a user go to the primary until the replica has replayed their last
+# write, or for at most DB_READ_YOUR_WRITES_WINDOW_SECONDS after it. Every
+# commit of a request with a user costs an extra round trip to the primary to
+# read its WAL position (pg_current_wal_lsn)
+DB_READ_YOUR_WRITES = os.getenv("DB_READ_YOUR_WRITES", "true").lower() == "true"
+DB_READ_YOUR_WRITES_WINDOW_SECONDS = float(
+    os.getenv("DB_READ_YOUR_WRITES_WINDOW_SECONDS", "30")
+)
+DB_READ_YOUR_WRITES_MAX_KEYS = int(os.getenv("DB_READ_YOUR_WRITES_MAX_KEYS", "100000"))
 
 # AI configurations
+# context_tokens is the prompt budget, it leaves room for the completion in the
+# smaller context window of the primary and fallback model. tokenizer names a
+# <TOKENIZERS_DIR>/<tokenizer>.json file, see toolbox.sh download-tokenizers.
+# hedge_budget is the share of requests that may race the fallback against a
+# slow primary when LLM_HEDGING_ENABLED, 0 disables hedging for the model.
+# A streamed completion fails over to the next provider when it has no token
+# within first_token_timeout or stalls for idle_timeout between chunks, all
+# providers together get total_timeout seconds.
+# extra_providers are (LLM_EXTRA_PROVIDERS name, model id) pairs tried after the
+# primary and fallback, e.g. LLM_DEFAULT_MODEL_EXTRA_PROVIDERS="name=model,..."
+
+
+def _get_extra_providers(env: str) -> list:
+    providers = []
+    for provider in filter(None, os.getenv(env, "").split(",")):
+        name, model_id = provider.split("=", 1)
+        providers.append((name.strip(), model_id.strip()))
+    return providers
+
+
 SUPPORTED_MODELS = {
     "default": {
         "primary": os.getenv(
             "LLM_DEFAULT_MODEL", "accounts/fireworks/models/deepseek-v3-0324"
         ),
         "fallback": os.getenv("FALLBACK_LLM_DEFAULT_MODEL", "deepseek-ai/DeepSeek-V3"),
+        "tokenizer": os.getenv("LLM_DEFAULT_MODEL_TOKENIZER", "deepseek-v3"),
+        "context_tokens": int(os.getenv("LLM_DEFAULT_MODEL_CONTEXT_TOKENS", "65536")),
+        "hedge_budget": float(os.getenv("LLM_DEFAULT_MODEL_HEDGE_BUDGET", "0.1")),
+        "first_token_timeout": float(
+            os.getenv("LLM_DEFAULT_MODEL_FIRST_TOKEN_TIMEOUT_SECONDS", "20")
+        ),
+        "idle_timeout": float(
+            os.getenv("LLM_DEFAULT_MODEL_IDLE_TIMEOUT_SECONDS", "20")
+        ),
+        "total_timeout": float(
+            os.getenv("LLM_DEFAULT_MODEL_TOTAL_TIMEOUT_SECONDS", "300")
+        ),
+        "extra_providers": _get_extra_providers("LLM_DEFAULT_MODEL_EXTRA_PROVIDERS"),
     },
     "think": {
         "primary": os.getenv(
             "LLM_THINK_MODEL", "accounts/fireworks/models/deepseek-r1-0528"
         ),
         "fallback": os.getenv("FALLBACK_LLM_THINK_MODEL", "deepseek-ai/DeepSeek-R1"),
+        "tokenizer": os.getenv("LLM_THINK_MODEL_TOKENIZER", "deepseek-v3"),
+        "context_tokens": int(os.getenv("LLM_THINK_MODEL_CONTEXT_TOKENS", "65536")),
+        "hedge_budget": float(os.getenv("LLM_THINK_MODEL_HEDGE_BUDGET", "0.1")),
+        "first_token_timeout": float(
+            os.getenv("LLM_THINK_MODEL_FIRST_TOKEN_TIMEOUT_SECONDS", "20")
+        ),
+        "idle_timeout": float(os.getenv("LLM_THINK_MODEL_IDLE_TIMEOUT_SECONDS", "20")),
+        "total_timeout": float(
+            os.getenv("LLM_THINK_MODEL_TOTAL_TIMEOUT_SECONDS", "300")
+        ),
+        "extra_providers": _get_extra_providers("LLM_THINK_MODEL_EXTRA_PROVIDERS"),
     },
     "vlm": {
         "primary": os.getenv(
             "VLM_MODEL", "accounts/fireworks/models/qwen2p5-vl-32b-instruct"
         ),
         "fallback": os.getenv("FALLBACK_VLM_MODEL", "Qwen/Qwen2.5-VL-72B-Instruct"),
+        "tokenizer": os.getenv("VLM_MODEL_TOKENIZER", "qwen2.5-vl"),
+        "context_tokens": int(os.getenv("VLM_MODEL_CONTEXT_TOKENS", "16384")),
+        "hedge_budget": float(os.getenv("VLM_MODEL_HEDGE_BUDGET", "0.1")),
+        "first_token_timeout": float(
+            os.getenv("VLM_MODEL_FIRST_TOKEN_TIMEOUT_SECONDS", "30")
+        ),
+        "idle_timeout": float(os.getenv("VLM_MODEL_IDLE_TIMEOUT_SECONDS", "20")),
+        "total_timeout": float(os.getenv("VLM_MODEL_TOTAL_TIMEOUT_SECONDS", "300")),
+        "extra_providers": _get_extra_providers("VLM_MODEL_EXTRA_PROVIDERS"),
     },
 }
 LLM_API_KEY = os.getenv("LLM_API_KEY")
@@ -66,14 +149,78 @@ FALLBACK_LLM_API_KEY = os.getenv("FALLBACK_LLM_API_KEY")
 if not FALLBACK_LLM_API_KEY:
     raise RuntimeError("FALLBACK_LLM_API_KEY is not set")
 
+# Starts the fallback next to a primary that has no first token after the
+# LLM_HEDGE_PERCENTILE of its recent times to first token, the first to answer
+# is streamed. LLM_HEDGE_INITIAL_DELAY_SECONDS is used until there are samples
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_INITIAL_DELAY_SECONDS = float(
+    os.getenv("LLM_HEDGE_INITIAL_DELAY_SECONDS", "3")
+)
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.5"))
+
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
 if not SERPAPI_API_KEY:
     raise RuntimeError("SERPAPI_API_KEY is not set")
 
+# /chat holds streamed content for up to CHAT_STREAM_COALESCE_SECONDS or
+# CHAT_STREAM_COALESCE_BYTES and writes it at once, 0 seconds writes every delta
+CHAT_STREAM_COALESCE_SECONDS = float(os.getenv("CHAT_STREAM_COALESCE_SECONDS", "0.02"))
+CHAT_STREAM_COALESCE_BYTES = int(os.getenv("CHAT_STREAM_COALESCE_BYTES", "256"))
+
+# Below this confidence the local intent classifier defers to the LLM
+INTENT_CLASSIFIER_THRESHOLD = float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", "0.8"))
+INTENT_CACHE_MAX_SIZE = int(os.getenv("INTENT_CACHE_MAX_SIZE", "10000"))
+INTENT_CACHE_TTL_SECONDS = int(os.getenv("INTENT_CACHE_TTL_SECONDS", "86400"))
+# Share detected intents between workers through the intent_cache table
+INTENT_CACHE_SHARED = os.getenv("INTENT_CACHE_SHARED", "false").lower() == "true"
+
+# Authenticated users and decoded JWTs cached in-process to skip per-request work
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+# Broadcast user cache invalidations to other workers with Postgres LISTEN/NOTIFY
+USER_CACHE_NOTIFY = os.getenv("USER_CACHE_NOTIFY", "false").lower() == "true"
+JWT_CACHE_MAX_SIZE = int(os.getenv("JWT_CACHE_MAX_SIZE", "10000"))
+JWT_CACHE_TTL_SECONDS = int(os.getenv("JWT_CACHE_TTL_SECONDS", "300"))
+
+# Most recent messages loaded as LLM context for a chat turn
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "200"))
+# Recent messages of active chats kept in-process, bounded by approximate size
+CHAT_HISTORY_CACHE_MAX_BYTES = int(
+    os.getenv("CHAT_HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+CHAT_HISTORY_CACHE_TTL_SECONDS = int(os.getenv("CHAT_HISTORY_CACHE_TTL_SECONDS", "300"))
+# Messages are also inserted by other workers and the cron generation watcher
+CHAT_HISTORY_CACHE_NOTIFY = (
+    os.getenv("CHAT_HISTORY_CACHE_NOTIFY", "true").lower() == "true"
+)
+TOKENIZERS_DIR = os.getenv("TOKENIZERS_DIR", "tokenizers")
+MESSAGE_CACHE_MAX_SIZE = int(os.getenv("MESSAGE_CACHE_MAX_SIZE", "100000"))
+# Messages per page of GET /chat/{chat_id} given a cursor but no limit, it
+# returns the whole history without either
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "50"))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_MAX_PAGE_SIZE", "500"))
+
+# Required in the X-Metrics-Token header of /metrics endpoints, disabled if unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Required in the X-Admin-Token header of /admin endpoints, disabled if unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.fireworks.ai/inference/v1")
 FALLBACK_LLM_BASE_URL = os.getenv(
     "FALLBACK_LLM_BASE_URL", "https://api.together.xyz/v1"
 )
+# OpenAI-compatible providers next to primary and fallback that models'
+# extra_providers refer to, as JSON: {"name": {"base_url": "", "api_key": ""}}
+LLM_EXTRA_PROVIDERS = json.loads(os.getenv("LLM_EXTRA_PROVIDERS") or "{}")
+# A provider's circuit opens once LLM_CIRCUIT_ERROR_THRESHOLD of its last
+# LLM_CIRCUIT_WINDOW calls within LLM_CIRCUIT_WINDOW_SECONDS failed, after
+# LLM_CIRCUIT_OPEN_SECONDS one trial request decides whether it closes again
+LLM_CIRCUIT_WINDOW = int(os.getenv("LLM_CIRCUIT_WINDOW", "20"))
+LLM_CIRCUIT_WINDOW_SECONDS = float(os.getenv("LLM_CIRCUIT_WINDOW_SECONDS", "60"))
+LLM_CIRCUIT_MIN_CALLS = int(os.getenv("LLM_CIRCUIT_MIN_CALLS", "5"))
+LLM_CIRCUIT_ERROR_THRESHOLD = float(os.getenv("LLM_CIRCUIT_ERROR_THRESHOLD", "0.5"))
+LLM_CIRCUIT_OPEN_SECONDS = float(os.getenv("LLM_CIRCUIT_OPEN_SECONDS", "30"))
 
 
 STORAGE_FOLDER = os.getenv("STORAGE_FOLDER", "storage")
@@ -82,6 +229,28 @@ STORAGE_MAX_FILE_SIZE = int(os.getenv("STORAGE_MAX_FILE_SIZE", "10485760"))
 
 GOOGLE_CREDENTIALS = "credentials.json"
 GCS_BUCKET = os.getenv("GCS_BUCKET", "chatgpt")
+# Bytes per resumable upload request, has to be a multiple of 256 KiB
+GCS_UPLOAD_CHUNK_SIZE = int(os.getenv("GCS_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Threads reserved for blocking GCS calls
+GCS_UPLOAD_MAX_WORKERS = int(os.getenv("GCS_UPLOAD_MAX_WORKERS", "8"))
+# Blobs at least this big are uploaded as parallel composite parts
+GCS_COMPOSITE_UPLOAD_THRESHOLD = int(
+    os.getenv("GCS_COMPOSITE_UPLOAD_THRESHOLD", str(32 * 1024 * 1024))
+)
 WAVESPEED_API_KEY = os.getenv("WAVESPEED_API_KEY")
 if not WAVESPEED_API_KEY:
     raise ValueError("WAVESPEED_API_KEY is not set")
+WAVESPEED_TIMEOUT = float(os.getenv("WAVESPEED_TIMEOUT", "30"))
+WAVESPEED_MAX_CONNECTIONS = int(os.getenv("WAVESPEED_MAX_CONNECTIONS", "100"))
+WAVESPEED_MAX_RETRIES = int(os.getenv("WAVESPEED_MAX_RETRIES", "3"))
+WAVESPEED_HTTP2 = os.getenv("WAVESPEED_HTTP2", "true").lower() == "true"
+
+# Generations are finalized by the cron watcher, /job only reads their status.
+# Only enable it where the cron container runs, /job polls Wavespeed otherwise
+GENERATION_WATCHER_ENABLED = (
+    os.getenv("GENERATION_WATCHER_ENABLED", "false").lower() == "true"
+)
+# /job finalizes inline if the watcher hasn't touched a generation for this long
+GENERATION_WATCHER_STALE_SECONDS = int(
+    os.getenv("GENERATION_WATCHER_STALE_SECONDS", "30")
+)
@@ -0,0 +1,102 @@
+import os
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+import pytest
+from uuid_extensions import uuid7
+
+os.environ["SERPAPI_API_KEY"] = "dummy_serpapi_key"
+os.environ["LLM_API_KEY"] = "dummy_llm_key"
+os.environ["FALLBACK_LLM_API_KEY"] = "dummy_fallback_llm_key"
+os.environ["WAVESPEED_API_KEY"] = "dummy_wavespeed_key"
+
+from app.cron import generation_watcher_job as job
+from app.domain.generation.entities import GenerationOutput
+from app.domain.generation.entities import GenerationStatus
+from app.domain.generation.entities import GenerationType
+from app.repository.wavespeed_repository import WavespeedGenerationOutput
+
+
+@pytest.fixture(autouse=True)
+def clear_schedules():
+    job._schedules.clear()
+    yield
+    job._schedules.clear()
+
+
+def _get_generation() -> GenerationOutput:
+    return GenerationOutput(
+        id=uuid7(),
+        user_id=uuid7(),
+        chat_id=uuid7(),
+        type=GenerationType.IMAGE,
+        prompt="a cat",
+        status=GenerationStatus.PROCESSING,
+        url=None,
+        data={"wavespeed_id": "wavespeed_id"},
+        created_at=datetime(2020, 1, 1),
+        last_updated_at=datetime(2020, 1, 1),
+    )
+
+
+def _get_wavespeed_repository(status: str):
+    repo = AsyncMock()
+    repo.get_result.return_value = WavespeedGenerationOutput(
+        id="wavespeed_id",
+        status=status,
+        url="https://example.com/cat.png" if status == "completed" else None,
+    )
+    return repo
+
+
+async def _execute(generation_repository, chat_repository, wavespeed_repository):
+    await job.execute(
+        generation_repository, chat_repository, AsyncMock(), wavespeed_repository
+    )
+
+
+async def test_completed_generation_is_finalized_once():
+    generation = _get_generation()
+    generation_repository = AsyncMock()
+    generation_repository.get_pending.return_value = [generation]
+    chat_repository = AsyncMock()
+    wavespeed_repository = _get_wavespeed_repository("completed")
+
+    await _execute(generation_repository, chat_repository, wavespeed_repository)
+    generation_repository.get_pending.return_value = []
+    await _execute(generation_repository, chat_repository, wavespeed_repository)
+
+    wavespeed_repository.get_result.assert_called_once()
+    chat_repository.insert_messages.assert_called_once()
+    generation_repository.complete.assert_called_once_with(
+        generation.id, "https://example.com/cat.png"
+    )
+    assert generation.id not in job._schedules
+
+
+async def test_processing_generation_is_not_polled_until_due():
+    generation = _get_generation()
+    generation_repository = AsyncMock()
+    generation_repository.get_pending.return_value = [generation]
+    wavespeed_repository = _get_wavespeed_repository("processing")
+
+    await _execute(generation_repository, AsyncMock(), wavespeed_repository)
+    await _execute(generation_repository, AsyncMock(), wavespeed_repository)
+
+    wavespeed_repository.get_result.assert_called_once()
+    schedule = job._schedules[generation.id]
+    assert schedule.interval > job.MIN_POLL_INTERVAL_SECONDS
+
+
+async def test_poll_interval_backs_off_up_to_max():
+    generation = _get_generation()
+    generation_repository = AsyncMock()
+    generation_repository.get_pending.return_value = [generation]
+    wavespeed_repository = _get_wavespeed_repository("processing")
+
+    for _ in range(20):
+        await _execute(generation_repository, AsyncMock(), wavespeed_repository)
+        job._schedules[generation.id].next_poll_at = 0
+
+    assert job._schedules[generation.id].interval == job.MAX_POLL_INTERVAL_SECONDS
+    assert wavespeed_repository.get_result.call_count == 20
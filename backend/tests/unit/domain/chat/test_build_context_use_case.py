@@ -0,0 +1,184 @@
+from unittest.mock import AsyncMock
+from unittest.mock import MagicMock
+
+import pytest
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import WhitespaceSplit
+from uuid_extensions import uuid7
+
+import settings
+from app.domain.chat import build_context_use_case as use_case
+from app.domain.chat import message_cache
+from app.domain.chat import summarize_chat_use_case
+from app.domain.chat import token_counter
+from app.domain.chat.entities import ChatSummary
+from app.domain.chat.entities import Message
+from app.domain.chat.entities import Model
+
+CHAT_ID = uuid7()
+BUDGET = 200
+
+
+@pytest.fixture(autouse=True)
+def word_tokenizer(tmp_path, monkeypatch):
+    # One token per word keeps the budgets in the tests easy to follow
+    tokenizer = Tokenizer(WordLevel({"[UNK]": 0}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = WhitespaceSplit()
+    tokenizer.save(str(tmp_path / "words.json"))
+    monkeypatch.setattr(settings, "TOKENIZERS_DIR", str(tmp_path))
+    monkeypatch.setitem(settings.SUPPORTED_MODELS["default"], "tokenizer", "words")
+    monkeypatch.setitem(settings.SUPPORTED_MODELS["default"], "context_tokens", BUDGET)
+    token_counter._get_tokenizer.cache_clear()
+    yield
+    token_counter._get_tokenizer.cache_clear()
+
+
+def _message(role: str, words: int, sequence_number=None) -> Message:
+    return Message(
+        id=uuid7(),
+        chat_id=CHAT_ID,
+        role=role,
+        content=" ".join(["word"] * words),
+        attachment_ids=[],
+        sequence_number=sequence_number,
+    )
+
+
+def _get_messages(history_count: int):
+    # 10 tokens per stored message with the overhead
+    history = [
+        _message("user" if i % 2 else "assistant", 6, i)
+        for i in range(2, history_count + 2)
+    ]
+    return [_message("system", 16, 1)] + history + [_message("user", 6)]
+
+
+def test_count_tokens_uses_tokenizer_file():
+    assert token_counter.count_tokens("one two  three", Model.DEFAULT_MODEL) == 3
+
+
+def test_missing_tokenizer_warns_once(monkeypatch):
+    monkeypatch.setitem(settings.SUPPORTED_MODELS["default"], "tokenizer", "missing")
+    logger = MagicMock()
+    monkeypatch.setattr(token_counter, "logger", logger)
+
+    assert token_counter.count_tokens("x" * 30, Model.DEFAULT_MODEL) == 11
+    token_counter.count_tokens("one two", Model.DEFAULT_MODEL)
+
+    logger.warning.assert_called_once()
+
+
+def test_long_history_fits_budget():
+    messages = _get_messages(1000)
+
+    context = use_case.execute(messages, None, Model.DEFAULT_MODEL)
+
+    assert context.tokens <= BUDGET
+    # System prompt, the 17 most recent messages that fit and the new turn
+    assert context.messages[0] is messages[0]
+    assert context.messages[1:] == messages[-18:]
+    # Older history is folded until the rest takes half of the history budget
+    assert context.to_fold == messages[1:-9]
+
+
+def test_short_history_is_not_folded():
+    messages = _get_messages(5)
+
+    context = use_case.execute(messages, None, Model.DEFAULT_MODEL)
+
+    assert context.messages == messages
+    assert context.to_fold == []
+
+
+def test_summary_replaces_summarized_history():
+    messages = _get_messages(30)
+    summary = ChatSummary(summary="The user likes cats", summarized_until=20)
+
+    context = use_case.execute(messages, summary, Model.DEFAULT_MODEL)
+
+    assert context.messages[0].content.endswith("The user likes cats")
+    assert messages[0].content == " ".join(["word"] * 16)
+    assert [m.sequence_number for m in context.messages[1:-1]] == list(range(21, 32))
+    assert context.to_fold == []
+
+
+def test_tool_results_stay_with_their_call():
+    messages = _get_messages(1000)
+    # The oldest message that fits is a tool result of a call that doesn't
+    messages[-18].role = "tool"
+
+    context = use_case.execute(messages, None, Model.DEFAULT_MODEL)
+
+    assert context.messages[1] is messages[-17]
+    assert context.tokens <= BUDGET
+
+
+def test_message_token_counts_are_cached():
+    messages = _get_messages(1000)
+    use_case.execute(messages, None, Model.DEFAULT_MODEL)
+    hits = message_cache.tokens.stats.hits
+
+    use_case.execute(messages, None, Model.DEFAULT_MODEL)
+
+    # Every stored message of the second turn is a cache hit
+    assert message_cache.tokens.stats.hits - hits >= 18
+
+
+async def test_fold_updates_summary():
+    messages = _get_messages(6)[1:-1]
+    messages[2].role = "tool"
+    chat_repository = AsyncMock()
+    llm_repository = AsyncMock()
+    llm_repository.completion_nostream.return_value = "Updated summary"
+    summary = ChatSummary(summary="Old summary", summarized_until=1)
+
+    result = await summarize_chat_use_case.execute(
+        CHAT_ID, summary, messages, chat_repository, llm_repository
+    )
+
+    assert result == ChatSummary(summary="Updated summary", summarized_until=7)
+    chat_repository.upsert_summary.assert_called_once_with(CHAT_ID, result)
+    prompt = llm_repository.completion_nostream.call_args.args[0][1]["content"]
+    assert "Old summary" in prompt
+    assert "tool:" not in prompt
+
+
+async def test_fold_loads_messages_older_than_window():
+    unloaded = _get_messages(4)[1:-1]
+    window_overflow = [_message("user", 6, 6), _message("assistant", 6, 7)]
+    chat_repository = AsyncMock()
+    chat_repository.get_messages_after.return_value = unloaded
+    llm_repository = AsyncMock()
+    llm_repository.completion_nostream.return_value = "Updated summary"
+    summary = ChatSummary(summary="Old summary", summarized_until=1)
+
+    result = await summarize_chat_use_case.execute(
+        CHAT_ID, summary, window_overflow, chat_repository, llm_repository, 5
+    )
+
+    chat_repository.get_messages_after.assert_called_once_with(
+        CHAT_ID, 1, 5, summarize_chat_use_case.UNLOADED_BATCH_SIZE
+    )
+    assert result == ChatSummary(summary="Updated summary", summarized_until=7)
+
+
+async def test_fold_skips_window_while_older_messages_are_left(monkeypatch):
+    monkeypatch.setattr(summarize_chat_use_case, "UNLOADED_BATCH_SIZE", 2)
+    chat_repository = AsyncMock()
+    chat_repository.get_messages_after.return_value = _get_messages(2)[1:-1]
+    llm_repository = AsyncMock()
+    llm_repository.completion_nostream.return_value = "Updated summary"
+    summary = ChatSummary(summary="Old summary", summarized_until=1)
+
+    result = await summarize_chat_use_case.execute(
+        CHAT_ID,
+        summary,
+        [_message("user", 6, 9)],
+        chat_repository,
+        llm_repository,
+        8,
+    )
+
+    # Folding the window now would leave 4-8 out of the summary for good
+    assert result == ChatSummary(summary="Updated summary", summarized_until=3)
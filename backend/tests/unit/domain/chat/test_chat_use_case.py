@@ -0,0 +1,244 @@
+import asyncio
+import os
+from datetime import datetime
+from unittest.mock import AsyncMock
+from unittest.mock import MagicMock
+
+import pytest
+from uuid_extensions import uuid7
+
+os.environ["SERPAPI_API_KEY"] = "dummy_serpapi_key"
+os.environ["LLM_API_KEY"] = "dummy_llm_key"
+os.environ["FALLBACK_LLM_API_KEY"] = "dummy_fallback_llm_key"
+os.environ["WAVESPEED_API_KEY"] = "dummy_wavespeed_key"
+
+from app.domain.chat import chat_use_case as use_case
+from app.domain.chat import detect_intent_use_case
+from app.domain.chat import summarize_chat_use_case
+from app.domain.chat.entities import Chat
+from app.domain.chat.entities import ChatInput
+from app.domain.chat.entities import ChatSummary
+from app.domain.chat.entities import ChunkOutput
+from app.domain.chat.entities import ErrorChunk
+from app.domain.chat.entities import Intent
+from app.domain.chat.entities import Message
+from app.domain.chat.entities import NewChatOutput
+from app.domain.users.entities import MESSAGE_RATE_LIMIT_TIMEFRAMES
+from app.domain.users.entities import MessageQuota
+from tests.unit import testing_utils
+
+DELAY = 0.1
+
+
+def _get_chat_input() -> ChatInput:
+    return ChatInput(
+        chat_id=uuid7(),
+        configuration_id=None,
+        think_model=None,
+        is_search_enabled=False,
+        content="Hello",
+        attachment_ids=[],
+    )
+
+
+def _get_chat_repository(chat_input: ChatInput):
+    async def _get_latest_messages(*args, **kwargs):
+        await asyncio.sleep(DELAY)
+        return []
+
+    repo = AsyncMock()
+    repo.get.return_value = Chat(
+        id=chat_input.chat_id,
+        configuration_id=None,
+        user_id=uuid7(),
+        title="title",
+        created_at=datetime(2020, 1, 1),
+    )
+    repo.get_latest_messages.side_effect = _get_latest_messages
+    repo.get_summary.return_value = None
+    return repo
+
+
+def _get_llm_repository():
+    async def _completion(*args, **kwargs):
+        yield ChunkOutput(content="Hi!")
+
+    repo = MagicMock()
+    repo.completion = _completion
+    return repo
+
+
+def _get_quotas(used: int = 0):
+    return [
+        MessageQuota(rate_limit=rate_limit, limit=80, used=used, reset_at=None)
+        for rate_limit in MESSAGE_RATE_LIMIT_TIMEFRAMES
+    ]
+
+
+async def _execute(
+    chat_input: ChatInput, chat_repository, llm_repository, used_messages: int = 0
+):
+    return [
+        chunk
+        async for chunk in use_case.execute(
+            chat_input,
+            testing_utils.get_user(),
+            llm_repository,
+            chat_repository,
+            AsyncMock(),
+            AsyncMock(),
+            AsyncMock(),
+            AsyncMock(),
+            _get_quotas(used_messages),
+        )
+    ]
+
+
+@pytest.fixture
+def mock_intent(monkeypatch):
+    def _mock_intent(delay: float):
+        state = {"finished": False}
+
+        async def _detect_intent(*args, **kwargs):
+            await asyncio.sleep(delay)
+            state["finished"] = True
+            return Intent.DEFAULT
+
+        monkeypatch.setattr(detect_intent_use_case, "execute", _detect_intent)
+        return state
+
+    return _mock_intent
+
+
+async def test_preflight_runs_concurrently(monkeypatch):
+    intent_started = asyncio.Event()
+    history_started = asyncio.Event()
+
+    async def _detect_intent(*args, **kwargs):
+        intent_started.set()
+        # Serially the history would only be loaded after this returns
+        await asyncio.wait_for(history_started.wait(), timeout=5)
+        return Intent.DEFAULT
+
+    async def _get_latest_messages(*args, **kwargs):
+        history_started.set()
+        await asyncio.wait_for(intent_started.wait(), timeout=5)
+        return []
+
+    monkeypatch.setattr(detect_intent_use_case, "execute", _detect_intent)
+    chat_input = _get_chat_input()
+    chat_repository = _get_chat_repository(chat_input)
+    chat_repository.get_latest_messages.side_effect = _get_latest_messages
+
+    chunks = await _execute(chat_input, chat_repository, _get_llm_repository())
+
+    assert isinstance(chunks[0], NewChatOutput)
+    assert chunks[-1] == ChunkOutput(content="Hi!")
+    chat_repository.insert_messages.assert_called_once()
+
+
+async def test_rate_limited_cancels_intent_detection(mock_intent):
+    intent_state = mock_intent(DELAY * 3)
+    chat_input = _get_chat_input()
+    chat_repository = _get_chat_repository(chat_input)
+
+    chunks = await _execute(
+        chat_input, chat_repository, _get_llm_repository(), used_messages=81
+    )
+    await asyncio.sleep(DELAY * 4)
+
+    assert len(chunks) == 1
+    assert isinstance(chunks[0], ErrorChunk)
+    assert not intent_state["finished"]
+    chat_repository.insert_messages.assert_not_called()
+
+
+async def test_chat_not_found_cancels_intent_detection(mock_intent):
+    intent_state = mock_intent(DELAY)
+    chat_input = _get_chat_input()
+    chat_repository = _get_chat_repository(chat_input)
+    chat_repository.get.return_value = None
+
+    chunks = await _execute(chat_input, chat_repository, _get_llm_repository())
+    await asyncio.sleep(DELAY * 2)
+
+    assert len(chunks) == 1
+    assert isinstance(chunks[0], ErrorChunk)
+    assert not intent_state["finished"]
+
+
+async def test_only_history_window_goes_to_llm(mock_intent, monkeypatch):
+    mock_intent(0)
+    monkeypatch.setattr(use_case, "CHAT_HISTORY_WINDOW", 3)
+    chat_input = _get_chat_input()
+    chat_repository = _get_chat_repository(chat_input)
+    # The stored system prompt and the tool call message fell out of the window
+    chat_repository.get_latest_messages.side_effect = None
+    chat_repository.get_latest_messages.return_value = [
+        Message(
+            id=uuid7(),
+            chat_id=chat_input.chat_id,
+            role=role,
+            attachment_ids=[],
+            sequence_number=i,
+        )
+        for i, role in enumerate(["tool", "assistant", "user"], start=10)
+    ]
+    llm_inputs = []
+
+    async def _completion(messages, *args, **kwargs):
+        llm_inputs.append(messages)
+        yield ChunkOutput(content="Hi!")
+
+    llm_repository = MagicMock()
+    llm_repository.completion = _completion
+
+    await _execute(chat_input, chat_repository, llm_repository)
+
+    chat_repository.get_latest_messages.assert_called_once_with(chat_input.chat_id, 3)
+    assert [m["role"] for m in llm_inputs[0]] == ["system", "assistant", "user", "user"]
+    # The system prompt is not stored again
+    new_messages = chat_repository.insert_messages.call_args.args[0]
+    assert [m.role for m in new_messages] == ["user", "assistant"]
+
+
+async def test_messages_older_than_window_are_summarized(mock_intent, monkeypatch):
+    mock_intent(0)
+    monkeypatch.setattr(use_case, "CHAT_HISTORY_WINDOW", 3)
+    chat_input = _get_chat_input()
+    chat_repository = _get_chat_repository(chat_input)
+
+    def _messages(first: int, last: int):
+        return [
+            Message(
+                id=uuid7(),
+                chat_id=chat_input.chat_id,
+                role="user" if i % 2 else "assistant",
+                content=f"message {i}",
+                attachment_ids=[],
+                sequence_number=i,
+            )
+            for i in range(first, last + 1)
+        ]
+
+    # The summary stops at 2 and the window starts at 10, 3-9 are in neither
+    chat_repository.get_latest_messages.side_effect = None
+    chat_repository.get_latest_messages.return_value = _messages(10, 12)
+    chat_repository.get_summary.return_value = ChatSummary(
+        summary="Old summary", summarized_until=2
+    )
+    chat_repository.get_messages_after.return_value = _messages(3, 9)
+    llm_repository = _get_llm_repository()
+    llm_repository.completion_nostream = AsyncMock(return_value="New summary")
+
+    await _execute(chat_input, chat_repository, llm_repository)
+    await summarize_chat_use_case._in_flight[chat_input.chat_id]
+
+    chat_repository.get_messages_after.assert_called_once_with(
+        chat_input.chat_id, 2, 9, summarize_chat_use_case.UNLOADED_BATCH_SIZE
+    )
+    prompt = llm_repository.completion_nostream.call_args.args[0][1]["content"]
+    assert "message 3" in prompt and "message 9" in prompt
+    chat_repository.upsert_summary.assert_called_once_with(
+        chat_input.chat_id, ChatSummary(summary="New summary", summarized_until=9)
+    )
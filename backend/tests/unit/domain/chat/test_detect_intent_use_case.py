@@ -0,0 +1,196 @@
+import os
+from unittest.mock import AsyncMock
+from unittest.mock import MagicMock
+
+os.environ["SERPAPI_API_KEY"] = "dummy_serpapi_key"
+os.environ["LLM_API_KEY"] = "dummy_llm_key"
+os.environ["FALLBACK_LLM_API_KEY"] = "dummy_fallback_llm_key"
+os.environ["WAVESPEED_API_KEY"] = "dummy_wavespeed_key"
+
+from app.domain.chat import detect_intent_use_case as use_case
+from app.domain.chat import intent_classifier
+from app.domain.chat.entities import ChunkOutput
+from app.domain.chat.entities import Intent
+from app.domain.chat.intent_cache import IntentCache
+from app.exceptions import LlmError
+
+THRESHOLD = 0.8
+
+# Routing these to generation starts a paid job, only the LLM may do it
+HARD_NEGATIVES = [
+    ("draw conclusions from the data", Intent.DEFAULT),
+    ("Draw a conclusion from these results", Intent.DEFAULT),
+    ("paint.net alternatives", Intent.DEFAULT),
+    ("what is the art of war about", Intent.DEFAULT),
+    ("Sketch out a plan for my thesis", Intent.DEFAULT),
+    ("Create an image classifier with pytorch", Intent.DEFAULT),
+    ("make a meme generator in python", Intent.DEFAULT),
+    ("write code to make a photo gallery in React", Intent.DEFAULT),
+    ("how do I create a logo in Figma?", Intent.DEFAULT),
+    ("create a drawing app with canvas", Intent.DEFAULT),
+    ("generate a picture-perfect resume", Intent.DEFAULT),
+    ("make a video player component", Intent.DEFAULT),
+    ("draw me a bath", Intent.DEFAULT),
+    ("make an image upload form", Intent.DEFAULT),
+    ("Create a movie recommendation system", Intent.DEFAULT),
+    ("how to make a gif from a video with ffmpeg", Intent.DEFAULT),
+    ("Design a logo database schema", Intent.DEFAULT),
+]
+
+LABELED_MESSAGES = HARD_NEGATIVES + [
+    ("hi", Intent.DEFAULT),
+    ("Hello!", Intent.DEFAULT),
+    ("thanks", Intent.DEFAULT),
+    ("continue", Intent.DEFAULT),
+    ("What is the capital of France?", Intent.DEFAULT),
+    ("Help me write a cover letter for a backend job", Intent.DEFAULT),
+    ("Explain the difference between TCP and UDP", Intent.DEFAULT),
+    ("Can you summarize the french revolution in 3 sentences", Intent.DEFAULT),
+    ("Write a python function that reverses a list", Intent.DEFAULT),
+    ("What's the weather like in Tallinn today?", Intent.DEFAULT),
+    ("Tell me a joke about programmers", Intent.DEFAULT),
+    ("draw a cat", Intent.IMAGE_GENERATION),
+    ("Draw a monkey riding a bicycle", Intent.IMAGE_GENERATION),
+    ("please paint a sunset over the mountains", Intent.IMAGE_GENERATION),
+    ("Generate an image of a futuristic city", Intent.IMAGE_GENERATION),
+    ("Can you create a logo for my coffee shop?", Intent.IMAGE_GENERATION),
+    ("make me a picture of a dragon", Intent.IMAGE_GENERATION),
+    ("Create a portrait of a knight in shining armor", Intent.IMAGE_GENERATION),
+    ("Make a video of a dog running on the beach", Intent.VIDEO_GENERATION),
+    ("generate a short animation of a rocket launch", Intent.VIDEO_GENERATION),
+    ("Create a clip of waves crashing on rocks", Intent.VIDEO_GENERATION),
+    ("What is in this picture?", Intent.IMAGE_COMPREHENSION),
+    ("Describe the image", Intent.IMAGE_COMPREHENSION),
+    ("Can you read the text in this photo", Intent.IMAGE_COMPREHENSION),
+    ("What do you see?", Intent.IMAGE_COMPREHENSION),
+    ("I love this picture", Intent.DEFAULT),
+    ("The movie was great, what should I watch next?", Intent.DEFAULT),
+    ("generate a cat wearing a hat", Intent.IMAGE_GENERATION),
+    ("create a cartoon of a dog", Intent.IMAGE_GENERATION),
+    ("imagine a dragon over a castle", Intent.IMAGE_GENERATION),
+]
+
+
+def _get_cache() -> IntentCache:
+    return IntentCache(max_size=10, ttl_seconds=60)
+
+
+def _get_llm_repository(response: str):
+    async def _completion(*args, **kwargs):
+        yield ChunkOutput(content=response)
+
+    repo = MagicMock()
+    repo.completion = MagicMock(side_effect=_completion)
+    return repo
+
+
+def test_classifier_accuracy():
+    classifier = intent_classifier.get_default_classifier()
+    confident = 0
+    misrouted = []
+    for message, expected in LABELED_MESSAGES:
+        prediction = classifier.classify(message)
+        if not prediction or prediction.confidence < THRESHOLD:
+            continue
+        confident += 1
+        if prediction.intent != expected:
+            misrouted.append((message, prediction))
+
+    # Confident answers skip the LLM, so a wrong one is a misroute. The rest
+    # goes to the intent cache and then the LLM
+    assert misrouted == []
+    # Hard negatives are meant to reach the LLM, they don't count as misses
+    assert confident / (len(LABELED_MESSAGES) - len(HARD_NEGATIVES)) >= 0.5
+
+
+async def test_confident_skips_llm():
+    llm_repository = _get_llm_repository("default")
+    intent = await use_case.execute("draw a cat", llm_repository, threshold=THRESHOLD)
+    assert intent == Intent.IMAGE_GENERATION
+    llm_repository.completion.assert_not_called()
+
+
+async def test_not_confident_asks_llm():
+    llm_repository = _get_llm_repository("image_generation")
+    intent = await use_case.execute(
+        "draw a cat", llm_repository, threshold=1.0, cache=_get_cache()
+    )
+    assert intent == Intent.IMAGE_GENERATION
+    llm_repository.completion.assert_called_once()
+
+
+async def test_no_prediction_asks_llm():
+    llm_repository = _get_llm_repository("image_comprehension")
+    intent = await use_case.execute(
+        "this picture",
+        llm_repository,
+        classifier=intent_classifier.ChainIntentClassifier([]),
+        threshold=THRESHOLD,
+        cache=_get_cache(),
+    )
+    assert intent == Intent.IMAGE_COMPREHENSION
+    llm_repository.completion.assert_called_once()
+
+
+async def test_retried_message_uses_cache():
+    llm_repository = _get_llm_repository("image_generation")
+    cache = _get_cache()
+    first = await use_case.execute(
+        "a cat in a hat", llm_repository, threshold=1.0, cache=cache
+    )
+    second = await use_case.execute(
+        "A cat  in a hat!", llm_repository, threshold=1.0, cache=cache
+    )
+    assert first == second == Intent.IMAGE_GENERATION
+    llm_repository.completion.assert_called_once()
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+
+
+async def test_wrapped_llm_response_is_parsed():
+    llm_repository = _get_llm_repository('The intent is "image_generation".')
+    intent = await use_case.execute(
+        "a cat in a hat", llm_repository, threshold=1.0, cache=_get_cache()
+    )
+    assert intent == Intent.IMAGE_GENERATION
+
+
+async def test_unparseable_llm_response_falls_back_to_default():
+    llm_repository = _get_llm_repository("I am not sure")
+    cache = _get_cache()
+    intent = await use_case.execute(
+        "a cat in a hat", llm_repository, threshold=1.0, cache=cache
+    )
+    assert intent == Intent.DEFAULT
+    # Fallbacks are not cached, the next attempt asks the LLM again
+    assert len(cache._local) == 0
+
+
+async def test_llm_error_falls_back_to_default():
+    async def _completion(*args, **kwargs):
+        raise LlmError("Request timed out")
+        yield
+
+    llm_repository = MagicMock()
+    llm_repository.completion = _completion
+    intent = await use_case.execute(
+        "a cat in a hat", llm_repository, threshold=1.0, cache=_get_cache()
+    )
+    assert intent == Intent.DEFAULT
+
+
+async def test_shared_cache_hit_skips_llm():
+    shared_repository = AsyncMock()
+    shared_repository.get.return_value = "video_generation"
+    cache = IntentCache(
+        max_size=10, ttl_seconds=60, shared_repository=shared_repository
+    )
+    llm_repository = _get_llm_repository("default")
+
+    intent = await use_case.execute(
+        "a cat in a hat", llm_repository, threshold=1.0, cache=cache
+    )
+
+    assert intent == Intent.VIDEO_GENERATION
+    assert cache.shared_stats.hits == 1
+    llm_repository.completion.assert_not_called()
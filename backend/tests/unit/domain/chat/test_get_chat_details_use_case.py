@@ -0,0 +1,95 @@
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+from uuid_extensions import uuid7
+
+from app.domain.chat import get_chat_details_use_case as use_case
+from app.domain.chat.entities import Chat
+from app.domain.chat.entities import Message
+from app.repository.chat_repository import MAX_SEQUENCE_NUMBER
+from tests.unit import testing_utils
+
+MESSAGE_COUNT = 10_000
+
+
+def _get_chat_repository():
+    chat_id = uuid7()
+    stored = [
+        Message(
+            id=uuid7(),
+            chat_id=chat_id,
+            role="user",
+            content=f"message {i}",
+            attachment_ids=[],
+            sequence_number=i,
+        )
+        for i in range(1, MESSAGE_COUNT + 1)
+    ]
+
+    async def _get_latest_messages(chat_id, limit, before_sequence_number=None):
+        # Same semantics as the keyset query
+        before = before_sequence_number or MAX_SEQUENCE_NUMBER
+        return [m for m in stored if m.sequence_number < before][-limit:]
+
+    repo = AsyncMock()
+    repo.get.return_value = Chat(
+        id=chat_id,
+        configuration_id=None,
+        user_id=uuid7(),
+        title="title",
+        created_at=datetime(2020, 1, 1),
+    )
+    repo.get_latest_messages.side_effect = _get_latest_messages
+    return repo
+
+
+async def test_first_page_is_newest_messages():
+    repo = _get_chat_repository()
+
+    details = await use_case.execute(
+        uuid7(), testing_utils.get_user(), repo, AsyncMock(), limit=50
+    )
+
+    assert [m.sequence_number for m in details.messages] == list(
+        range(MESSAGE_COUNT - 49, MESSAGE_COUNT + 1)
+    )
+    assert details.next_before_sequence_number == MESSAGE_COUNT - 49
+
+
+async def test_pages_cover_whole_chat():
+    repo = _get_chat_repository()
+    sequence_numbers = []
+    before = None
+    while True:
+        details = await use_case.execute(
+            uuid7(), testing_utils.get_user(), repo, AsyncMock(), 300, before
+        )
+        sequence_numbers = [m.sequence_number for m in details.messages] + (
+            sequence_numbers
+        )
+        before = details.next_before_sequence_number
+        if before is None:
+            break
+
+    assert sequence_numbers == list(range(1, MESSAGE_COUNT + 1))
+    # Every page asked for a bounded number of rows, never the whole chat
+    for call in repo.get_latest_messages.call_args_list:
+        assert call.args[1] == 301
+
+
+async def test_without_limit_and_cursor_returns_whole_chat(monkeypatch):
+    monkeypatch.setattr(use_case, "CHAT_HISTORY_MAX_PAGE_SIZE", 500)
+    repo = _get_chat_repository()
+
+    details = await use_case.execute(
+        uuid7(), testing_utils.get_user(), repo, AsyncMock()
+    )
+
+    # Clients that don't page keep getting the full history
+    assert [m.sequence_number for m in details.messages] == list(
+        range(1, MESSAGE_COUNT + 1)
+    )
+    assert details.next_before_sequence_number is None
+    # Still read in bounded pages
+    for call in repo.get_latest_messages.call_args_list:
+        assert call.args[1] == 500
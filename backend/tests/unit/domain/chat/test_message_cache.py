@@ -0,0 +1,69 @@
+from copy import deepcopy
+
+from uuid_extensions import uuid7
+
+from app.domain.chat import chat_use_case
+from app.domain.chat import message_cache
+from app.domain.chat.entities import Message
+from app.domain.chat.entities import ToolCall
+
+CHAT_ID = uuid7()
+
+
+def _get_messages(count: int):
+    return [
+        Message(
+            id=uuid7(),
+            chat_id=CHAT_ID,
+            role="user" if i % 2 else "assistant",
+            content="Hello there, how are you doing today? " * 10,
+            attachment_ids=[uuid7()],
+            tool_calls=[ToolCall(id="call", function={"name": "search"})],
+            sequence_number=i,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def _assemble_with_copies(messages):
+    # How turns were assembled before the cache
+    copies = [deepcopy(m) for m in messages]
+    return [m.to_llm_ready_dict() for m in copies[:-1]] + [
+        copies[-1].to_llm_ready_dict_with_images([])
+    ]
+
+
+def test_llm_ready_dict_is_built_once():
+    message = _get_messages(1)[0]
+
+    llm_dict = message_cache.get_llm_ready_dict(message)
+
+    assert llm_dict == message.to_llm_ready_dict()
+    assert message_cache.get_llm_ready_dict(message) is llm_dict
+
+
+def test_system_message_is_rebuilt():
+    message = _get_messages(1)[0]
+    message.role = "system"
+    message_cache.get_llm_ready_dict(message)
+
+    message.content = "New system prompt"
+
+    llm_dict = message_cache.get_llm_ready_dict(message)
+    assert llm_dict["content"][0]["text"] == "New system prompt"
+
+
+def test_turn_assembly_reuses_cached_dicts(monkeypatch):
+    messages = _get_messages(100)
+    first = chat_use_case._get_messages_to_llm(messages, [])
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("History payload was rebuilt")
+
+    # The history is neither rebuilt nor copied on the next turn
+    monkeypatch.setattr(Message, "to_llm_ready_dict", _fail)
+    second = chat_use_case._get_messages_to_llm(messages, [])
+
+    assert all(a is b for a, b in zip(first[:-1], second[:-1]))
+    monkeypatch.undo()
+    assert second == _assemble_with_copies(messages)
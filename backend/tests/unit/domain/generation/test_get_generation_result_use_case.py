@@ -0,0 +1,131 @@
+import asyncio
+import os
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+import pytest
+from uuid_extensions import uuid7
+
+os.environ["SERPAPI_API_KEY"] = "dummy_serpapi_key"
+os.environ["LLM_API_KEY"] = "dummy_llm_key"
+os.environ["FALLBACK_LLM_API_KEY"] = "dummy_fallback_llm_key"
+os.environ["WAVESPEED_API_KEY"] = "dummy_wavespeed_key"
+
+from app.domain.generation import get_generation_result_use_case as use_case
+from app.domain.generation.entities import GenerationOutput
+from app.domain.generation.entities import GenerationStatus
+from app.domain.generation.entities import GenerationType
+from app.repository.wavespeed_repository import WavespeedGenerationOutput
+
+URL = "https://example.com/cat.png"
+
+
+class _FakeGenerationRepository:
+    def __init__(self):
+        self.status = GenerationStatus.PROCESSING
+        self.update = AsyncMock()
+        self.reopen = AsyncMock()
+
+    async def complete(self, generation_id, url) -> bool:
+        # Mirrors UPDATE ... WHERE status != completed RETURNING id
+        if self.status == GenerationStatus.COMPLETED:
+            return False
+        self.status = GenerationStatus.COMPLETED
+        return True
+
+
+def _get_generation() -> GenerationOutput:
+    return GenerationOutput(
+        id=uuid7(),
+        user_id=uuid7(),
+        chat_id=uuid7(),
+        type=GenerationType.IMAGE,
+        prompt="a cat",
+        status=GenerationStatus.PROCESSING,
+        url=None,
+        data={"wavespeed_id": "wavespeed_id"},
+        created_at=datetime(2020, 1, 1),
+        last_updated_at=datetime(2020, 1, 1),
+    )
+
+
+def _get_wavespeed_repository():
+    async def _get_result(request_id):
+        await asyncio.sleep(0.05)
+        return WavespeedGenerationOutput(id=request_id, status="completed", url=URL)
+
+    repo = AsyncMock()
+    repo.get_result.side_effect = _get_result
+    return repo
+
+
+@pytest.fixture
+def upload(monkeypatch):
+    upload = AsyncMock(return_value=URL)
+    monkeypatch.setattr(use_case, "upload_to_gcp", upload)
+    return upload
+
+
+async def test_concurrent_refreshes_finalize_once(upload):
+    generation = _get_generation()
+    repository = _FakeGenerationRepository()
+    chat_repository = AsyncMock()
+    wavespeed_repository = _get_wavespeed_repository()
+
+    results = await asyncio.gather(
+        *[
+            use_case.refresh(
+                generation,
+                repository,
+                chat_repository,
+                AsyncMock(),
+                wavespeed_repository,
+            )
+            for _ in range(5)
+        ]
+    )
+
+    assert all(r.status == GenerationStatus.COMPLETED for r in results)
+    assert all(r.url == URL for r in results)
+    wavespeed_repository.get_result.assert_called_once()
+    upload.assert_called_once()
+    chat_repository.insert_messages.assert_called_once()
+    assert use_case._in_flight == {}
+
+
+async def test_refresh_in_another_process_does_not_duplicate_message(upload):
+    generation = _get_generation()
+    repository = _FakeGenerationRepository()
+    chat_repository = AsyncMock()
+    wavespeed_repository = _get_wavespeed_repository()
+
+    # Sequential calls don't share an in-flight task, like two workers
+    for _ in range(2):
+        result = await use_case.refresh(
+            generation,
+            repository,
+            chat_repository,
+            AsyncMock(),
+            wavespeed_repository,
+        )
+        assert result.url == URL
+
+    chat_repository.insert_messages.assert_called_once()
+
+
+async def test_failed_message_insert_reopens_generation(upload):
+    generation = _get_generation()
+    repository = _FakeGenerationRepository()
+    chat_repository = AsyncMock()
+    chat_repository.insert_messages.side_effect = Exception("db down")
+
+    with pytest.raises(Exception):
+        await use_case.refresh(
+            generation,
+            repository,
+            chat_repository,
+            AsyncMock(),
+            _get_wavespeed_repository(),
+        )
+
+    repository.reopen.assert_called_once_with(generation.id)
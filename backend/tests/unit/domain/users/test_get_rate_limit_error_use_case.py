@@ -1,7 +1,11 @@
+from datetime import timedelta
 from unittest.mock import AsyncMock
 
 from app.domain.users import get_rate_limit_error_use_case as use_case
+from app.domain.users.entities import MessageCountBucket
 from app.domain.users.entities import User
+from app.repository.chat_repository import get_bucket_start
+from app.repository.utils import utcnow
 from uuid_extensions import uuid7
 
 
@@ -12,15 +16,57 @@ def _get_user() -> User:
     )
 
 
-async def test_no_error():
+def _get_bucket(hours_ago: int, count: int) -> MessageCountBucket:
+    return MessageCountBucket(
+        start=get_bucket_start(utcnow()) - timedelta(hours=hours_ago),
+        count=count,
+    )
+
+
+async def _get_error(used: int):
     repo = AsyncMock()
-    repo.get_message_count_by_user.return_value = 0
-    error = await use_case.execute(_get_user(), repo)
-    assert error is None
+    repo.get_user_message_counts.return_value = [_get_bucket(0, used)] if used else []
+    return use_case.execute(await use_case.get_quotas(_get_user(), repo))
+
+
+async def test_no_error():
+    assert await _get_error(0) is None
 
 
 async def test_free_limit_exceeded():
+    assert await _get_error(1_000_000_000) is not None
+
+
+async def test_limit_itself_is_allowed():
+    # Counts are taken before the current message
+    assert await _get_error(80) is None
+    assert await _get_error(81) is not None
+
+
+async def test_remaining_reaches_zero_when_requests_are_rejected():
     repo = AsyncMock()
-    repo.get_message_count_by_user.return_value = 1_000_000_000
-    error = await use_case.execute(_get_user(), repo)
-    assert error is not None
+    for used, remaining in [(80, 1), (81, 0)]:
+        repo.get_user_message_counts.return_value = [_get_bucket(0, used)]
+
+        quotas = await use_case.get_quotas(_get_user(), repo)
+
+        # The header and the rejection come from the same count
+        assert quotas[0].remaining == remaining
+        assert (use_case.execute(quotas) is not None) == (remaining == 0)
+
+
+async def test_quota_sums_buckets_inside_the_window():
+    repo = AsyncMock()
+    repo.get_user_message_counts.return_value = [
+        # Fell out of the 24 hour window
+        _get_bucket(24, 50),
+        _get_bucket(23, 10),
+        _get_bucket(0, 5),
+    ]
+
+    quotas = await use_case.get_quotas(_get_user(), repo)
+
+    assert len(quotas) == 1
+    assert quotas[0].used == 15
+    assert quotas[0].remaining == quotas[0].limit + 1 - 15
+    assert quotas[0].reset_at == get_bucket_start(utcnow()) + timedelta(hours=1)
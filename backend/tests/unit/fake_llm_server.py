@@ -0,0 +1,107 @@
+import asyncio
+import json
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
+
+class FakeLlmServer:
+    """
+    A local OpenAI-compatible server streaming scripted chat completions:
+
+        async with FakeLlmServer(["Hello", " there"], first_token_delay=2) as s:
+            client = AsyncOpenAI(base_url=s.base_url, api_key="x")
+
+    A chunk is the delta's content, or the whole delta when it's a dict
+    """
+
+    def __init__(
+        self,
+        chunks: List[str | Dict],
+        first_token_delay: float = 0,
+        chunk_delay: float = 0,
+        status_code: int = 200,
+        fail_after_chunks: Optional[int] = None,
+        stall_after_chunks: Optional[int] = None,
+    ):
+        self.chunks = chunks
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.status_code = status_code
+        # Drops the connection after this many chunks
+        self.fail_after_chunks = fail_after_chunks
+        # Keeps the connection open without sending more after this many chunks
+        self.stall_after_chunks = stall_after_chunks
+        self.requests: List[dict] = []
+        self.cancelled = 0
+        self.base_url = ""
+        self._server: Optional[uvicorn.Server] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "FakeLlmServer":
+        app = Starlette(
+            routes=[Route("/v1/chat/completions", self._completions, methods=["POST"])]
+        )
+        config = uvicorn.Config(
+            app, host="127.0.0.1", port=0, log_level="error", lifespan="off"
+        )
+        self._server = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+        port = self._server.servers[0].sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/v1"
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self._server.should_exit = True
+        self._server.force_exit = True
+        await self._task
+
+    async def _completions(self, request: Request):
+        body = await request.json()
+        self.requests.append(body)
+        if self.status_code != 200:
+            return JSONResponse(
+                {"error": {"message": "Scripted failure"}},
+                status_code=self.status_code,
+            )
+        return StreamingResponse(
+            self._stream(body["model"]), media_type="text/event-stream"
+        )
+
+    async def _stream(self, model: str):
+        try:
+            await asyncio.sleep(self.first_token_delay)
+            for i, content in enumerate(self.chunks):
+                if i == self.fail_after_chunks:
+                    raise ConnectionError("Scripted disconnect")
+                if i == self.stall_after_chunks:
+                    await asyncio.sleep(3600)
+                if i:
+                    await asyncio.sleep(self.chunk_delay)
+                delta = content if isinstance(content, dict) else {"content": content}
+                yield _get_event(model, delta, None)
+            yield _get_event(model, {}, "stop")
+            yield "data: [DONE]\n\n"
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def _get_event(model: str, delta: dict, finish_reason: Optional[str]) -> str:
+    chunk = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
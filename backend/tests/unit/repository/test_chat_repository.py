@@ -0,0 +1,232 @@
+import asyncio
+from collections import defaultdict
+from unittest.mock import MagicMock
+from uuid import uuid4
+
+from uuid_extensions import uuid7
+
+from app.cache import TtlLruCache
+from app.domain.chat.entities import Message
+from app.repository import chat_repository
+from app.repository.chat_repository import ChatRepository
+from app.repository.chat_repository import get_history_size
+from database.database import Message as MessageModel
+from tests.unit import testing_utils
+
+
+class _FakeDatabase:
+    """
+    Emulates the parts of Postgres insert_messages relies on, the UPDATE of a
+    chat counter row holds its lock until the transaction ends
+    """
+
+    def __init__(self, latency: float = 0.001):
+        self.latency = latency
+        self.counters = defaultdict(int)
+        self.locks = defaultdict(asyncio.Lock)
+        self.messages = []
+        self.round_trips = 0
+        self.reads = 0
+
+    def session(self):
+        return _FakeSession(self)
+
+
+class _FakeSession:
+    def __init__(self, database: _FakeDatabase):
+        self.database = database
+        self.held_lock = None
+        self.pending = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.pending = []
+        self._release()
+
+    async def execute(self, statement, params):
+        self.database.round_trips += 1
+        await asyncio.sleep(self.database.latency)
+        if "UPDATE chat" in statement.text:
+            lock = self.database.locks[params["chat_id"]]
+            await lock.acquire()
+            self.held_lock = lock
+            self.database.counters[params["chat_id"]] += params["count"]
+            result = MagicMock()
+            result.scalar_one.return_value = self.database.counters[params["chat_id"]]
+            return result
+        if "FROM message" in statement.text:
+            self.database.reads += 1
+            messages = [
+                m
+                for m in self.database.messages
+                if m["chat_id"] == params["chat_id"]
+                and m["sequence_number"] < params["before_sequence_number"]
+            ]
+            messages.sort(key=lambda m: m["sequence_number"])
+            return testing_utils.get_result(messages[-params["limit"] :])
+        self.pending.extend(params)
+
+    async def commit(self):
+        self.database.messages.extend(self.pending)
+        self.pending = []
+        self._release()
+
+    def _release(self):
+        if self.held_lock:
+            self.held_lock.release()
+            self.held_lock = None
+
+
+def _get_repository(database: _FakeDatabase, **kwargs) -> ChatRepository:
+    session_provider = MagicMock()
+    session_provider.get.side_effect = database.session
+    return ChatRepository(session_provider, session_provider, **kwargs)
+
+
+def _get_cached_repository(database: _FakeDatabase) -> ChatRepository:
+    history_cache = TtlLruCache(
+        100, 60, max_bytes=1024 * 1024, size_of=get_history_size
+    )
+    return _get_repository(
+        database, history_cache=history_cache, history_cache_max_messages=10
+    )
+
+
+def _get_messages(chat_id, count: int):
+    return [
+        Message(
+            id=uuid7(),
+            chat_id=chat_id,
+            role="user",
+            content=f"message {i}",
+            attachment_ids=[],
+            tool_call=None,
+            tool_calls=None,
+        )
+        for i in range(count)
+    ]
+
+
+async def test_concurrent_turns_get_unique_sequence_numbers():
+    database = _FakeDatabase()
+    repository = _get_repository(database)
+    chat_id = uuid4()
+
+    await asyncio.gather(
+        *[repository.insert_messages(_get_messages(chat_id, 3)) for _ in range(50)]
+    )
+
+    sequence_numbers = [m["sequence_number"] for m in database.messages]
+    assert sorted(sequence_numbers) == list(range(1, 151))
+    # Every turn got a consecutive block
+    for i in range(0, 150, 3):
+        block = sequence_numbers[i : i + 3]
+        assert block == list(range(block[0], block[0] + 3))
+
+
+async def test_insert_messages_takes_two_round_trips():
+    database = _FakeDatabase()
+    repository = _get_repository(database)
+
+    await repository.insert_messages(_get_messages(uuid4(), 20))
+
+    assert len(database.messages) == 20
+    # Allocation and one executemany, instead of a MAX() query plus N inserts
+    assert database.round_trips == 2
+
+
+def test_sequence_numbers_are_allocated_by_one_increment():
+    statement = " ".join(chat_repository.SQL_ALLOCATE_SEQUENCE_NUMBERS.split())
+
+    # Incremented and returned in one statement, the row lock serializes turns.
+    # Reading the counter first would hand out the same numbers twice
+    assert (
+        "UPDATE chat SET last_sequence_number = last_sequence_number + :count "
+        "WHERE id = :chat_id RETURNING user_profile_id, last_sequence_number"
+    ) in statement
+    assert statement.endswith("SELECT last_sequence_number FROM allocated;")
+
+
+def test_sequence_numbers_are_unique_per_chat():
+    index = next(
+        index
+        for index in MessageModel.__table__.indexes
+        if index.name == "ix_message_chat_id_sequence_number"
+    )
+
+    assert index.unique
+    assert [column.name for column in index.columns] == ["chat_id", "sequence_number"]
+
+
+async def test_inserted_messages_are_read_from_cache():
+    database = _FakeDatabase()
+    repository = _get_cached_repository(database)
+    chat_id = uuid4()
+
+    await repository.insert_messages(_get_messages(chat_id, 2))
+    await repository.insert_messages(_get_messages(chat_id, 2))
+    messages = await repository.get_latest_messages(chat_id, 10)
+
+    # The new chat never had to be read back
+    assert database.reads == 0
+    assert [m.sequence_number for m in messages] == [1, 2, 3, 4]
+    assert [m.content for m in messages] == [m["content"] for m in database.messages]
+
+
+async def test_cache_miss_reads_database_once():
+    database = _FakeDatabase()
+    await _get_repository(database).insert_messages(_get_messages(uuid4(), 1))
+    chat_id = uuid4()
+    await _get_repository(database).insert_messages(_get_messages(chat_id, 30))
+    repository = _get_cached_repository(database)
+
+    first = await repository.get_latest_messages(chat_id, 5)
+    second = await repository.get_latest_messages(chat_id, 5)
+    older = await repository.get_latest_messages(chat_id, 3, 29)
+
+    assert database.reads == 1
+    assert [m.sequence_number for m in second] == [26, 27, 28, 29, 30]
+    assert first == second
+    assert [m.sequence_number for m in older] == [26, 27, 28]
+    # Only the cached newest messages are served, older pages hit the database
+    await repository.get_latest_messages(chat_id, 5, 10)
+    assert database.reads == 2
+
+
+async def test_messages_inserted_elsewhere_invalidate_cache():
+    database = _FakeDatabase()
+    repository = _get_cached_repository(database)
+    other_worker = _get_repository(database)
+    chat_id = uuid4()
+    await repository.insert_messages(_get_messages(chat_id, 2))
+
+    await other_worker.insert_messages(_get_messages(chat_id, 2))
+    await repository.insert_messages(_get_messages(chat_id, 2))
+    messages = await repository.get_latest_messages(chat_id, 10)
+
+    assert database.reads == 1
+    assert [m.sequence_number for m in messages] == list(range(1, 7))
+
+
+async def test_notifications_of_other_workers_invalidate_cache(monkeypatch):
+    callbacks = {}
+
+    async def _listen(conninfo, channel, on_notify, on_connect):
+        callbacks["on_notify"] = on_notify
+
+    monkeypatch.setattr(chat_repository.notifications, "listen", _listen)
+    database = _FakeDatabase()
+    repository = _get_cached_repository(database)
+    chat_id = uuid4()
+    await repository.insert_messages(_get_messages(chat_id, 2))
+    await repository.listen_for_invalidations("")
+
+    callbacks["on_notify"](f"{repository._instance_id} {chat_id}")
+    await repository.get_latest_messages(chat_id, 10)
+    assert database.reads == 0
+
+    callbacks["on_notify"](f"other {chat_id}")
+    await repository.get_latest_messages(chat_id, 10)
+    assert database.reads == 1
@@ -0,0 +1,240 @@
+import base64
+import hashlib
+import json
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import unquote
+
+import google_crc32c
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
+
+from app.repository.cloud_storage_repository import CloudStorageRepository
+from app.repository.cloud_storage_repository import GcsUpload
+
+CHUNK_SIZE = 256 * 1024
+
+
+class _FakeGcsHandler(BaseHTTPRequestHandler):
+    """
+    Just enough of the GCS resumable upload protocol, keeps only a running
+    checksum of every object so the server doesn't add to the memory peak
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if "uploadType=multipart" in self.path:
+            return self._multipart_upload(body)
+        if self.path.split("?")[0].endswith("/compose"):
+            return self._compose(json.loads(body))
+        body = json.loads(body)
+        upload_id = str(len(self.server.uploads))
+        self.server.uploads[upload_id] = {
+            "name": body["name"],
+            "content_type": self.headers.get("X-Upload-Content-Type"),
+            "crc32c": google_crc32c.Checksum(),
+            "md5": hashlib.md5(),
+            "size": 0,
+            "requests": 0,
+            "cancelled": False,
+        }
+        self.send_response(200)
+        self.send_header(
+            "Location",
+            f"http://{self.headers['Host']}/upload/resumable?upload_id={upload_id}",
+        )
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_PUT(self):
+        upload = self.server.uploads[self.path.split("upload_id=")[-1]]
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        upload["crc32c"].update(data)
+        upload["md5"].update(data)
+        upload["size"] += len(data)
+        upload["requests"] += 1
+        total = self.headers["Content-Range"].split("/")[-1]
+        if total == "*":
+            self.send_response(308)
+            self.send_header("Range", f"bytes=0-{upload['size'] - 1}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        response = json.dumps(
+            {
+                "name": upload["name"],
+                "bucket": "bucket",
+                "size": str(upload["size"]),
+                "contentType": upload["content_type"],
+                "crc32c": base64.b64encode(upload["crc32c"].digest()).decode(),
+                "md5Hash": base64.b64encode(upload["md5"].digest()).decode(),
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def do_DELETE(self):
+        if "upload_id=" in self.path:
+            self.server.uploads[self.path.split("upload_id=")[-1]]["cancelled"] = True
+            self.send_response(499)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        name = unquote(self.path.split("/o/")[-1].split("?")[0])
+        self.send_response(204 if self.server.objects.pop(name, None) else 404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _multipart_upload(self, body: bytes):
+        boundary = self.headers["Content-Type"].split("boundary=")[-1].strip('"')
+        _, metadata, media, _ = body.split(b"--" + boundary.encode())
+        metadata = json.loads(metadata.split(b"\r\n\r\n", 1)[1])
+        headers, data = media.split(b"\r\n\r\n", 1)
+        content_type = headers.decode().split("content-type: ")[-1]
+        self._store(metadata["name"], data[: -len(b"\r\n")], content_type)
+
+    def _compose(self, body: dict):
+        name = unquote(self.path.split("/o/")[-1].split("/compose")[0])
+        data = b"".join(
+            self.server.objects[source["name"]]["data"]
+            for source in body["sourceObjects"]
+        )
+        self._store(name, data, body["destination"].get("contentType"))
+
+    def _store(self, name: str, data: bytes, content_type):
+        self.server.objects[name] = {"data": data, "content_type": content_type}
+        response = json.dumps(
+            {
+                "name": name,
+                "bucket": "bucket",
+                "size": str(len(data)),
+                "contentType": content_type,
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_gcs():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeGcsHandler)
+    server.uploads = {}
+    server.objects = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _get_repository(server, **kwargs) -> CloudStorageRepository:
+    client = storage.Client(
+        project="test",
+        credentials=AnonymousCredentials(),
+        client_options={"api_endpoint": f"http://127.0.0.1:{server.server_port}"},
+    )
+    return CloudStorageRepository(
+        "bucket", "", upload_chunk_size=CHUNK_SIZE, storage_client=client, **kwargs
+    )
+
+
+async def _stream(total_size: int, piece_size: int = 64 * 1024):
+    piece = b"x" * piece_size
+    for _ in range(total_size // piece_size):
+        yield piece
+
+
+async def test_upload_stream(fake_gcs):
+    repository = _get_repository(fake_gcs)
+    total_size = 10 * CHUNK_SIZE + 128 * 1024
+
+    url = await repository.upload_stream_to_gcs(
+        _stream(total_size), "images/cat.png", "image/png"
+    )
+
+    assert url == "https://storage.googleapis.com/bucket/images/cat.png"
+    upload = fake_gcs.uploads["0"]
+    assert upload["name"] == "images/cat.png"
+    assert upload["content_type"] == "image/png"
+    assert upload["size"] == total_size
+    # Sent in chunks, not as one request
+    assert upload["requests"] == 11
+
+
+async def test_upload_stream_memory_is_bounded(fake_gcs):
+    repository = _get_repository(fake_gcs)
+    total_size = 64 * CHUNK_SIZE
+
+    tracemalloc.start()
+    await repository.upload_stream_to_gcs(
+        _stream(total_size), "videos/cat.mp4", "video/mp4"
+    )
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert fake_gcs.uploads["0"]["size"] == total_size
+    # 16 MiB uploaded, peak stays at a handful of chunks
+    assert peak < 8 * CHUNK_SIZE
+
+
+async def test_failed_upload_stream_cancels_session(fake_gcs):
+    repository = _get_repository(fake_gcs)
+
+    async def _failing_stream():
+        async for piece in _stream(2 * CHUNK_SIZE):
+            yield piece
+        raise ConnectionError("Download failed")
+
+    with pytest.raises(ConnectionError):
+        await repository.upload_stream_to_gcs(
+            _failing_stream(), "images/cat.png", "image/png"
+        )
+
+    upload = fake_gcs.uploads["0"]
+    assert upload["size"] == 2 * CHUNK_SIZE
+    assert upload["cancelled"]
+
+
+async def test_upload_blobs(fake_gcs):
+    repository = _get_repository(fake_gcs, max_upload_workers=2)
+    uploads = [
+        GcsUpload(f"image {i}".encode(), f"images/{i}.png", "image/png")
+        for i in range(5)
+    ]
+
+    urls = await repository.upload_blobs_to_gcs(uploads)
+    await repository.close()
+
+    assert urls == [
+        f"https://storage.googleapis.com/bucket/images/{i}.png" for i in range(5)
+    ]
+    assert fake_gcs.objects["images/3.png"] == {
+        "data": b"image 3",
+        "content_type": "image/png",
+    }
+
+
+async def test_upload_big_blob_is_composed(fake_gcs):
+    repository = _get_repository(fake_gcs, composite_upload_threshold=CHUNK_SIZE)
+    data = bytes(range(256)) * 4 * 1024 * 3
+
+    url = await repository.upload_blob_to_gcs(data, "videos/cat.mp4", "video/mp4")
+    await repository.close()
+
+    assert url == "https://storage.googleapis.com/bucket/videos/cat.mp4"
+    # Temporary parts are cleaned up, only the composed object is left
+    assert list(fake_gcs.objects) == ["videos/cat.mp4"]
+    assert fake_gcs.objects["videos/cat.mp4"]["data"] == data
+    assert fake_gcs.objects["videos/cat.mp4"]["content_type"] == "video/mp4"
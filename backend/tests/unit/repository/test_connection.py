@@ -0,0 +1,180 @@
+import asyncio
+from unittest.mock import MagicMock
+from uuid import uuid4
+
+import pytest
+import sqlalchemy
+from sqlalchemy.util import greenlet_spawn
+
+from app.repository import connection
+from app.repository.connection import MeteredPool
+from app.repository.connection import ReadYourWritesRouter
+from app.service.metrics import get_database_metrics_service
+
+
+class _FakeServer:
+    """
+    A Postgres server reporting a fixed WAL position, the primary's grows with
+    every commit
+    """
+
+    def __init__(self, lsn):
+        self.lsn = lsn
+        self.sessions = 0
+        self.session_maker = None
+        self.closed_sessions = 0
+        # Raised by the next statement
+        self.error = None
+
+    def get(self):
+        self.sessions += 1
+        return _FakeSession(self)
+
+
+class _FakeSession:
+    def __init__(self, server: _FakeServer):
+        self.server = server
+        self.info = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.server.closed_sessions += 1
+
+    async def commit(self):
+        self.server.lsn += 100
+        self.info["committed"] = True
+
+    async def execute(self, statement, params=None):
+        if self.server.error is not None:
+            raise self.server.error
+        result = MagicMock()
+        result.scalar_one.return_value = self.server.lsn
+        return result
+
+
+def _get_router(primary_lsn=1000, replica_lsn=1000):
+    primary = _FakeServer(primary_lsn)
+    replica = _FakeServer(replica_lsn)
+    router = ReadYourWritesRouter(primary, replica, 100, 30)
+    return router, primary, replica
+
+
+async def _write(router: ReadYourWritesRouter) -> None:
+    async with router.write_provider.get() as session:
+        await session.commit()
+
+
+async def _read(router: ReadYourWritesRouter) -> _FakeServer:
+    async with router.read_provider.get() as session:
+        return session.server
+
+
+async def test_reads_without_writes_go_to_replica():
+    router, primary, replica = _get_router()
+    connection.consistency_key.set(uuid4())
+
+    assert await _read(router) is replica
+    assert router.stats.replay_lsn_checks == 0
+
+
+async def test_reads_go_to_primary_until_replica_catches_up():
+    router, primary, replica = _get_router()
+    connection.consistency_key.set(uuid4())
+    await _write(router)
+
+    assert await _read(router) is primary
+    assert await _read(router) is primary
+
+    replica.lsn = primary.lsn
+    assert await _read(router) is replica
+    # The write is forgotten once the replica has it
+    assert await _read(router) is replica
+    assert router.stats.primary_reads == 2
+    assert router.stats.replica_reads == 2
+    assert router.stats.replay_lsn_checks == 3
+
+
+async def test_other_users_read_from_replica():
+    router, primary, replica = _get_router()
+    connection.consistency_key.set(uuid4())
+    await _write(router)
+
+    connection.consistency_key.set(uuid4())
+
+    assert await _read(router) is replica
+
+
+async def test_uncommitted_sessions_are_not_tracked():
+    router, primary, replica = _get_router()
+    connection.consistency_key.set(uuid4())
+    async with router.write_provider.get():
+        pass
+
+    assert await _read(router) is replica
+    assert router.stats.tracked_writes == 0
+
+
+async def test_read_database_that_is_not_a_standby_sees_writes():
+    router, primary, replica = _get_router(replica_lsn=None)
+    connection.consistency_key.set(uuid4())
+    await _write(router)
+
+    assert await _read(router) is replica
+
+
+async def test_failed_write_tracking_keeps_commit():
+    router, primary, replica = _get_router()
+    connection.consistency_key.set(uuid4())
+    primary.error = sqlalchemy.exc.OperationalError("SELECT", {}, Exception())
+
+    await _write(router)
+
+    assert primary.closed_sessions == 1
+    assert router.stats.tracked_writes == 0
+
+
+async def test_cancelled_write_tracking_propagates():
+    router, primary, replica = _get_router()
+    connection.consistency_key.set(uuid4())
+    primary.error = asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        await _write(router)
+
+    assert primary.closed_sessions == 1
+
+
+def test_pool_size_is_split_between_workers():
+    assert connection.get_pool_size(100, 4, 5, None) == 20
+    assert connection.get_pool_size(10, 20, 0, None) == 1
+    assert connection.get_pool_size(100, 4, 0, 7) == 7
+    assert connection.get_pool_size(100, 4, 0, None, reserved=12) == 22
+
+
+def test_reserved_connections_cover_cron_and_listeners():
+    reserved = connection.get_reserved_connections(
+        workers=4, listeners=2, cron_pool_size=3, pool_overflow=1
+    )
+    assert reserved == 12
+
+    pool_size = connection.get_pool_size(100, 4, 1, None, reserved)
+    # Every worker pool with its overflow and listeners, plus the cron pool
+    assert 4 * (pool_size + 1 + 2) + 3 + 1 <= 100
+
+
+async def test_pool_counts_checkout_timeouts():
+    pool = MeteredPool(MagicMock, pool_size=1, max_overflow=0, timeout=0.01)
+    held = await greenlet_spawn(pool.connect)
+
+    with pytest.raises(sqlalchemy.exc.TimeoutError):
+        await greenlet_spawn(pool.connect)
+
+    metrics = get_database_metrics_service._get_pool_metrics(pool)
+    assert metrics.checked_out == 1
+    assert metrics.checkouts == 2
+    assert metrics.timeouts == 1
+    assert metrics.max_checkout_wait_ms >= 10
+    held.close()
+    assert get_database_metrics_service._get_pool_metrics(pool).idle == 1
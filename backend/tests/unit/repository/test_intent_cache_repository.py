@@ -0,0 +1,42 @@
+from unittest.mock import MagicMock
+
+from app.repository import intent_cache_repository
+from app.repository.intent_cache_repository import IntentCacheRepository
+
+
+class _FakeSession:
+    def __init__(self, expired: list):
+        self.expired = expired
+        self.commits = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def execute(self, statement, params):
+        assert "DELETE FROM intent_cache" in statement.text
+        deleted = self.expired[: params["limit"]]
+        del self.expired[: params["limit"]]
+        result = MagicMock()
+        result.rowcount = len(deleted)
+        return result
+
+    async def commit(self):
+        self.commits += 1
+
+
+async def test_expired_entries_are_deleted_in_batches(monkeypatch):
+    monkeypatch.setattr(intent_cache_repository, "DELETE_BATCH_SIZE", 10)
+    session = _FakeSession(expired=list(range(25)))
+    session_provider = MagicMock()
+    session_provider.get.return_value = session
+    repository = IntentCacheRepository(session_provider, session_provider)
+
+    deleted = await repository.delete_expired(60)
+
+    assert deleted == 25
+    assert session.expired == []
+    # Every batch is its own transaction
+    assert session.commits == 3
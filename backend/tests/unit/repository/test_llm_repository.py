@@ -0,0 +1,276 @@
+import asyncio
+from typing import Optional
+
+import pytest
+
+import settings
+from app.domain.chat.entities import ChunkOutput
+from app.domain.chat.entities import Model
+from app.domain.chat.entities import ModelConfig
+from app.domain.chat.entities import ModelSpec
+from app.domain.chat.entities import ToolOutput
+from app.exceptions import LlmError
+from app.repository.llm_hedging import HedgePolicy
+from app.repository.llm_repository import LlmRepository
+from app.repository.llm_router import ProviderRouter
+from app.service.admin import get_llm_providers_service
+from tests.unit.fake_llm_server import FakeLlmServer
+
+MODEL = ModelSpec(type=Model.DEFAULT_MODEL, config=ModelConfig())
+MESSAGES = [{"role": "user", "content": "Hi"}]
+# Stalled fake servers never answer, finishing at all proves they were
+# abandoned. This only keeps a regression from hanging the suite
+HANG_TIMEOUT = 30
+
+
+def _get_policy(budget: float = 0.5) -> HedgePolicy:
+    return HedgePolicy(
+        percentile=95, budget=budget, initial_delay=0.2, min_delay=0.05, max_delay=20
+    )
+
+
+def _get_repository(
+    primary: FakeLlmServer,
+    fallback: FakeLlmServer,
+    policy: Optional[HedgePolicy] = None,
+    **kwargs,
+) -> LlmRepository:
+    return LlmRepository(
+        api_key="key",
+        search_api_key="key",
+        base_url=primary.base_url,
+        fallback_api_key="key",
+        fallback_base_url=fallback.base_url,
+        hedge_policies={Model.DEFAULT_MODEL: policy} if policy else None,
+        **kwargs,
+    )
+
+
+def _set_timeouts(monkeypatch, **timeouts) -> None:
+    for name, seconds in timeouts.items():
+        monkeypatch.setitem(settings.SUPPORTED_MODELS["default"], name, seconds)
+
+
+async def _complete(repository: LlmRepository, close: bool = True) -> str:
+    content = ""
+    async for output in repository.completion(MESSAGES, MODEL, False):
+        if isinstance(output, ChunkOutput):
+            content += output.content
+    if close:
+        await repository.close()
+    return content
+
+
+async def _wait_for_cancel(server: FakeLlmServer) -> None:
+    for _ in range(100):
+        if server.cancelled:
+            return
+        await asyncio.sleep(0.01)
+
+
+async def test_fast_primary_is_not_hedged():
+    policy = _get_policy()
+    async with FakeLlmServer(["Hello", " there"]) as primary:
+        async with FakeLlmServer(["Fallback"]) as fallback:
+            content = await _complete(_get_repository(primary, fallback, policy))
+
+    assert content == "Hello there"
+    assert fallback.requests == []
+    assert policy.stats.requests == 1
+    assert policy.stats.hedged == 0
+
+
+async def test_stalled_primary_loses_to_fallback():
+    policy = _get_policy()
+    async with FakeLlmServer(["Primary"], first_token_delay=3600) as primary:
+        async with FakeLlmServer(["Hello", " there"]) as fallback:
+            content = await asyncio.wait_for(
+                _complete(_get_repository(primary, fallback, policy)), HANG_TIMEOUT
+            )
+            await _wait_for_cancel(primary)
+
+    assert content == "Hello there"
+    assert primary.cancelled == 1
+    assert policy.stats.hedged == 1
+    assert policy.stats.fallback_wins == 1
+    assert fallback.requests[0]["model"] == Model.DEFAULT_MODEL.fallback_model
+
+
+async def test_slow_primary_wins_over_slower_fallback():
+    policy = _get_policy()
+    async with FakeLlmServer(["Hello"], first_token_delay=0.5) as primary:
+        async with FakeLlmServer(["Fallback"], first_token_delay=10) as fallback:
+            content = await _complete(_get_repository(primary, fallback, policy))
+            await _wait_for_cancel(fallback)
+
+    assert content == "Hello"
+    assert fallback.cancelled == 1
+    assert policy.stats.hedged == 1
+    assert policy.stats.primary_wins == 1
+
+
+async def test_hedges_stay_within_budget():
+    policy = _get_policy(budget=0)
+    async with FakeLlmServer(["Hello"], first_token_delay=0.5) as primary:
+        async with FakeLlmServer(["Fallback"]) as fallback:
+            content = await _complete(_get_repository(primary, fallback, policy))
+
+    assert content == "Hello"
+    assert fallback.requests == []
+    assert policy.stats.over_budget == 1
+
+
+def test_hedge_delay_follows_first_token_percentile():
+    policy = _get_policy()
+    assert policy.get_delay() == 0.2
+
+    for i in range(1, 101):
+        policy.record_first_token(i / 100)
+
+    assert policy.get_delay() == 0.95
+
+
+async def test_open_circuit_skips_failing_primary():
+    async with FakeLlmServer([], status_code=404) as primary:
+        async with FakeLlmServer(["Hello"]) as fallback:
+            # Never demoted, so every request tries the primary until its
+            # circuit opens
+            router = ProviderRouter(min_calls=3, degraded_threshold=2)
+            repository = _get_repository(primary, fallback, router=router)
+            contents = [await _complete(repository, close=False) for _ in range(5)]
+            providers = await get_llm_providers_service.execute(repository)
+            await repository.close()
+
+    assert contents == ["Hello"] * 5
+    # The circuit opened after the third failure
+    assert len(primary.requests) == 3
+    states = {p.provider: p for p in providers.providers}
+    assert states["primary"].state == "open"
+    assert states["primary"].open_remaining_seconds > 0
+    assert states["fallback"].state == "closed"
+    assert states["fallback"].requests == 5
+
+
+async def test_extra_providers_are_tried_in_order(monkeypatch):
+    monkeypatch.setitem(
+        settings.SUPPORTED_MODELS["default"],
+        "extra_providers",
+        [("backup", "backup-model")],
+    )
+    async with FakeLlmServer([], status_code=404) as primary:
+        async with FakeLlmServer([], status_code=404) as fallback:
+            async with FakeLlmServer(["Hello"]) as backup:
+                repository = _get_repository(
+                    primary,
+                    fallback,
+                    extra_providers={
+                        "backup": {"base_url": backup.base_url, "api_key": "key"}
+                    },
+                )
+                content = await _complete(repository)
+
+    assert content == "Hello"
+    assert backup.requests[0]["model"] == "backup-model"
+
+
+async def test_dropped_stream_is_continued_by_fallback():
+    chunks = ["Hello", " there", " friend"]
+    async with FakeLlmServer(chunks, fail_after_chunks=2) as primary:
+        async with FakeLlmServer([" friend"]) as fallback:
+            content = await _complete(_get_repository(primary, fallback))
+
+    assert content == "Hello there friend"
+    assert fallback.requests[0]["messages"] == MESSAGES + [
+        {"role": "assistant", "content": "Hello there"}
+    ]
+
+
+async def test_restarted_fallback_does_not_repeat_streamed_text():
+    chunks = ["Hello", " there", " friend"]
+    async with FakeLlmServer(chunks, fail_after_chunks=2) as primary:
+        async with FakeLlmServer(["Hel", "lo th", "ere fr", "iend"]) as fallback:
+            content = await _complete(_get_repository(primary, fallback))
+
+    assert content == "Hello there friend"
+
+
+async def test_dropped_stream_after_tool_call_is_not_continued():
+    tool_call = {
+        "tool_calls": [
+            {
+                "index": 0,
+                "id": "call_1",
+                "type": "function",
+                "function": {"name": "web_search", "arguments": "{}"},
+            }
+        ]
+    }
+    chunks = ["Searching", tool_call, " more"]
+    async with FakeLlmServer(chunks, fail_after_chunks=2) as primary:
+        async with FakeLlmServer([" friend"]) as fallback:
+            repository = _get_repository(primary, fallback)
+            outputs = []
+            with pytest.raises(LlmError):
+                async for output in repository.completion(MESSAGES, MODEL, True):
+                    outputs.append(output)
+            await repository.close()
+
+    assert [type(o) for o in outputs] == [ChunkOutput, ToolOutput]
+    assert outputs[1].tool_call_id == "call_1"
+    assert not fallback.requests
+
+
+async def test_dropped_hedged_stream_is_continued():
+    policy = _get_policy()
+    chunks = ["Hello", " there", " friend"]
+    async with FakeLlmServer(chunks, fail_after_chunks=1) as primary:
+        async with FakeLlmServer([" there friend"]) as fallback:
+            content = await _complete(_get_repository(primary, fallback, policy))
+
+    assert content == "Hello there friend"
+    assert policy.stats.hedged == 0
+    assert fallback.requests[0]["messages"][-1]["content"] == "Hello"
+
+
+async def test_missing_first_token_falls_back(monkeypatch):
+    _set_timeouts(monkeypatch, first_token_timeout=0.2)
+    async with FakeLlmServer(["Primary"], first_token_delay=3600) as primary:
+        async with FakeLlmServer(["Hello"]) as fallback:
+            content = await asyncio.wait_for(
+                _complete(_get_repository(primary, fallback)), HANG_TIMEOUT
+            )
+            await _wait_for_cancel(primary)
+
+    assert content == "Hello"
+    assert primary.cancelled == 1
+
+
+async def test_stalled_stream_is_continued_by_fallback(monkeypatch):
+    _set_timeouts(monkeypatch, idle_timeout=0.2)
+    chunks = ["Hello", " there", " friend"]
+    async with FakeLlmServer(chunks, stall_after_chunks=2) as primary:
+        async with FakeLlmServer([" friend"]) as fallback:
+            content = await asyncio.wait_for(
+                _complete(_get_repository(primary, fallback)), HANG_TIMEOUT
+            )
+            await _wait_for_cancel(primary)
+
+    assert content == "Hello there friend"
+    assert primary.cancelled == 1
+    assert fallback.requests[0]["messages"][-1]["content"] == "Hello there"
+
+
+async def test_total_timeout_covers_all_providers(monkeypatch):
+    # Only the total timeout can end the pause after the first chunk
+    _set_timeouts(monkeypatch, total_timeout=0.3, idle_timeout=3600)
+    async with FakeLlmServer(["Hello", " there"], chunk_delay=3600) as primary:
+        async with FakeLlmServer(["Hello"]) as fallback:
+            repository = _get_repository(primary, fallback)
+            with pytest.raises(LlmError, match="timed out"):
+                await asyncio.wait_for(_complete(repository), HANG_TIMEOUT)
+            await repository.close()
+            await _wait_for_cancel(primary)
+
+    assert primary.cancelled == 1
+    # No time was left to try it
+    assert fallback.requests == []
@@ -0,0 +1,68 @@
+from app.domain.chat.entities import Model
+from app.repository import llm_router
+from app.repository.llm_router import CircuitState
+from app.repository.llm_router import ProviderRouter
+from app.repository.llm_router import ProviderTarget
+
+PRIMARY = ProviderTarget("primary", Model.DEFAULT_MODEL.primary_model)
+FALLBACK = ProviderTarget("fallback", Model.DEFAULT_MODEL.fallback_model)
+
+
+def _fail(router: ProviderRouter, target: ProviderTarget, count: int) -> None:
+    for _ in range(count):
+        router.record_failure(target, is_timeout=True)
+
+
+def test_circuit_opens_after_errors():
+    router = ProviderRouter(min_calls=5)
+    _fail(router, PRIMARY, 4)
+    assert list(router.get_route(Model.DEFAULT_MODEL))[0] == FALLBACK
+
+    _fail(router, PRIMARY, 1)
+
+    assert router.get_health(PRIMARY).state == CircuitState.OPEN
+    assert list(router.get_route(Model.DEFAULT_MODEL)) == [FALLBACK]
+
+
+def test_half_open_trial_closes_circuit(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(llm_router.time, "monotonic", lambda: now)
+    router = ProviderRouter(min_calls=5, open_seconds=30)
+    _fail(router, PRIMARY, 5)
+
+    now += 31
+    # A single trial request at a time
+    assert list(router.get_route(Model.DEFAULT_MODEL)) == [FALLBACK, PRIMARY]
+    assert list(router.get_route(Model.DEFAULT_MODEL)) == [FALLBACK]
+
+    router.record_success(PRIMARY, 0.5)
+
+    assert router.get_health(PRIMARY).state == CircuitState.CLOSED
+    assert list(router.get_route(Model.DEFAULT_MODEL)) == [PRIMARY, FALLBACK]
+
+
+def test_failed_trial_reopens_circuit(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(llm_router.time, "monotonic", lambda: now)
+    router = ProviderRouter(min_calls=5, open_seconds=30)
+    _fail(router, PRIMARY, 5)
+    now += 31
+    assert router.acquire(PRIMARY)
+
+    _fail(router, PRIMARY, 1)
+
+    assert router.get_health(PRIMARY).state == CircuitState.OPEN
+    assert not router.acquire(PRIMARY)
+    assert router.get_health(PRIMARY).times_opened == 2
+
+
+def test_demoted_provider_recovers_after_window(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(llm_router.time, "monotonic", lambda: now)
+    router = ProviderRouter(window_seconds=60)
+    _fail(router, PRIMARY, 1)
+    assert list(router.get_route(Model.DEFAULT_MODEL))[0] == FALLBACK
+
+    now += 61
+
+    assert list(router.get_route(Model.DEFAULT_MODEL))[0] == PRIMARY
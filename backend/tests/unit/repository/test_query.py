@@ -0,0 +1,115 @@
+import json
+
+from uuid_extensions import uuid7
+
+from app.domain.chat.entities import Message
+from app.domain.chat.entities import ToolCall
+from app.repository import chat_repository
+from app.repository import query
+from app.repository.file_repository import FILE_MAPPER
+from tests.unit import testing_utils
+
+CHAT_ID = uuid7()
+TOOL_CALLS = json.dumps([{"id": "call", "function": {"name": "search"}}])
+
+
+def _get_message_rows(count: int):
+    return [
+        {
+            "id": uuid7(),
+            "chat_id": CHAT_ID,
+            "role": "assistant",
+            "content": "Hello there, how are you doing today? " * 10,
+            "image_url": None,
+            "model": "default",
+            "tool_call_id": None,
+            "tool_name": None,
+            # Like in a chat, only some messages call tools
+            "tool_calls": TOOL_CALLS if i % 10 == 0 else None,
+            "sequence_number": i,
+            "attachment_ids": [],
+            "created_at": None,
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def _to_message_by_name(row) -> Message:
+    # How rows were mapped before RowMapper
+    tool_calls = None
+    if row.tool_calls:
+        tool_calls = [
+            ToolCall(id=tc["id"], function=tc["function"])
+            for tc in json.loads(row.tool_calls)
+        ]
+    tool_call = None
+    if row.tool_call_id and row.tool_name:
+        tool_call = ToolCall(id=row.tool_call_id, function={"name": row.tool_name})
+    return Message(
+        id=row.id,
+        chat_id=row.chat_id,
+        role=row.role,
+        content=row.content,
+        image_url=row.image_url,
+        model=row.model,
+        tool_call=tool_call,
+        tool_calls=tool_calls,
+        attachment_ids=row.attachment_ids,
+        sequence_number=row.sequence_number,
+    )
+
+
+def test_statements_are_built_once():
+    assert query.text("SELECT 1") is query.text("SELECT 1")
+
+
+def test_mapper_follows_column_positions():
+    rows = [
+        {
+            "size": 10,
+            "id": uuid7(),
+            "deleted": False,
+            "content_type": "image/png",
+            "full_path": "storage/a.png",
+            "filename": "a.png",
+            "user_profile_id": uuid7(),
+        }
+    ]
+
+    file = FILE_MAPPER.first(testing_utils.get_result(rows))
+
+    assert file.uid == rows[0]["id"]
+    assert file.user_id == rows[0]["user_profile_id"]
+    assert file.size == 10
+    assert FILE_MAPPER.first(testing_utils.get_result([])) is None
+
+
+class _PositionalResult:
+    """
+    Rows are plain tuples, reading a column by name fails
+    """
+
+    def __init__(self, rows):
+        self._keys = list(rows[0])
+        self._rows = [tuple(row.values()) for row in rows]
+
+    def keys(self):
+        return self._keys
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+def test_message_rows_are_read_by_position():
+    rows = _get_message_rows(100)
+    mapper = chat_repository.MESSAGE_MAPPER
+
+    messages = mapper.all(_PositionalResult(rows))
+    getters = len(mapper._getters)
+    mapper.all(_PositionalResult(rows))
+
+    assert messages == [
+        _to_message_by_name(row) for row in testing_utils.get_result(rows)
+    ]
+    # Column names are resolved once per result shape, not per result
+    assert len(mapper._getters) == getters
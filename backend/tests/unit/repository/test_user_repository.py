@@ -7,8 +7,29 @@ os.environ["SERPAPI_API_KEY"] = "dummy_serpapi_key"
 os.environ["LLM_API_KEY"] = "dummy_llm_key"
 os.environ["WAVESPEED_API_KEY"] = "dummy_wavespeed_key"
 
+from app.cache import TtlLruCache
 from app.repository.user_repository import UserRepository
 from app.domain.users.entities import User
+from tests.unit import testing_utils
+
+
+def _get_user_result(user_id, email):
+    return testing_utils.get_result(
+        [
+            {
+                "id": user_id,
+                "email": email,
+                "name": None,
+                "profile_picture": None,
+                "auth_provider": "google",
+                "provider_id": "123",
+                "is_email_verified": True,
+                "created_at": None,
+                "last_updated_at": None,
+                "last_login_at": None,
+            }
+        ]
+    )
 
 
 @pytest.fixture
@@ -35,14 +56,8 @@ async def test_get_by_id_user_found(user_repository, mock_session_providers):
     user_id = uuid4()
     expected_email = "test@example.com"
 
-    mock_row = MagicMock()
-    mock_row.id = user_id
-    mock_row.email = expected_email
-
     mock_session = AsyncMock()
-    mock_result = MagicMock()
-    mock_result.first.return_value = mock_row
-    mock_session.execute.return_value = mock_result
+    mock_session.execute.return_value = _get_user_result(user_id, expected_email)
 
     # Mock session provider context manager
     async_context_manager = AsyncMock()
@@ -113,3 +128,41 @@ async def test_insert_user_success(user_repository, mock_session_providers):
     # Assert
     mock_session.execute.assert_called_once()
     mock_session.commit.assert_called_once()
+
+
+async def test_get_by_id_cached_user_skips_database(mock_session_providers):
+    """Test get_by_id only queries the database once when a cache is set."""
+    # Arrange
+    mock_session_provider, mock_session_provider_read = mock_session_providers
+    user_repository = UserRepository(
+        session_provider=mock_session_provider,
+        session_provider_read=mock_session_provider_read,
+        cache=TtlLruCache(max_size=10, ttl_seconds=60),
+    )
+    user_id = uuid4()
+
+    mock_session = AsyncMock()
+    mock_session.execute.side_effect = lambda *_: _get_user_result(
+        user_id, "test@example.com"
+    )
+
+    async_context_manager = AsyncMock()
+    async_context_manager.__aenter__.return_value = mock_session
+    async_context_manager.__aexit__.return_value = None
+    mock_session_provider_read.get.return_value = async_context_manager
+    mock_session_provider.get.return_value = async_context_manager
+
+    # Act
+    first = await user_repository.get_by_id(user_id)
+    second = await user_repository.get_by_id(user_id)
+
+    # Assert
+    assert first == second
+    assert mock_session.execute.call_count == 1
+
+    # Act - an update invalidates the cached user
+    await user_repository.update(User(uid=user_id, name="New name"))
+    await user_repository.get_by_id(user_id)
+
+    # Assert - update and the reload both hit the database
+    assert mock_session.execute.call_count == 3
@@ -0,0 +1,117 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.repository.wavespeed_repository import WavespeedClientConfig
+from app.repository.wavespeed_repository import WavespeedRepository
+
+
+def _get_repository(handler) -> WavespeedRepository:
+    return WavespeedRepository(
+        "api_key",
+        WavespeedClientConfig(backoff_base=0.001),
+        transport=httpx.MockTransport(handler),
+    )
+
+
+def _result(request_id: str, status: str = "completed") -> httpx.Response:
+    return httpx.Response(
+        200,
+        json={
+            "data": {
+                "id": request_id,
+                "status": status,
+                "outputs": ["https://example.com/image.png"],
+            }
+        },
+    )
+
+
+async def test_concurrent_polls_do_not_serialize():
+    polls = 20
+    in_flight = []
+    all_started = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        in_flight.append(request)
+        if len(in_flight) == polls:
+            all_started.set()
+        # Serialized polls would never get the last one started
+        await asyncio.wait_for(all_started.wait(), timeout=5)
+        return _result(request.url.path.split("/")[-2])
+
+    repository = _get_repository(handler)
+    results = await asyncio.gather(
+        *[repository.get_result(f"job-{i}") for i in range(polls)]
+    )
+    await repository.close()
+
+    assert [r.id for r in results] == [f"job-{i}" for i in range(polls)]
+    assert all(r.status == "completed" for r in results)
+
+
+async def test_get_result_retries_transient_errors():
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return _result("job")
+
+    repository = _get_repository(handler)
+    result = await repository.get_result("job")
+    await repository.close()
+
+    assert result.status == "completed"
+    assert len(calls) == 3
+    assert calls[0].headers["Authorization"] == "Bearer api_key"
+
+
+async def test_get_result_gives_up_after_max_retries():
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(503)
+
+    repository = _get_repository(handler)
+    with pytest.raises(httpx.HTTPStatusError):
+        await repository.get_result("job")
+    await repository.close()
+
+    assert len(calls) == repository.config.max_retries + 1
+
+
+async def test_generate_image_is_not_retried_on_server_error():
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(500)
+
+    repository = _get_repository(handler)
+    with pytest.raises(httpx.HTTPStatusError):
+        await repository.generate_image("a cat")
+    await repository.close()
+
+    assert len(calls) == 1
+
+
+async def test_output_is_streamed_without_api_key():
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(
+            200, content=b"image", headers={"content-type": "image/png"}
+        )
+
+    repository = _get_repository(handler)
+    async with repository.stream_output("https://cdn.example.com/image.png") as r:
+        content = b"".join([chunk async for chunk in r.aiter_bytes()])
+    await repository.close()
+
+    assert content == b"image"
+    assert "Authorization" not in requests[0].headers
@@ -0,0 +1,26 @@
+import pytest
+from fastapi import HTTPException
+
+import settings
+from app.service.auth import authentication
+
+
+@pytest.mark.parametrize(
+    "validate,setting",
+    [
+        (authentication.validate_metrics_token, "METRICS_TOKEN"),
+        (authentication.validate_admin_token, "ADMIN_TOKEN"),
+    ],
+)
+async def test_token_is_checked(validate, setting, monkeypatch):
+    monkeypatch.setattr(settings, setting, "")
+    with pytest.raises(HTTPException) as e:
+        await validate("secret")
+    assert e.value.status_code == 404
+
+    monkeypatch.setattr(settings, setting, "secret")
+    for token in (None, "wrong"):
+        with pytest.raises(HTTPException) as e:
+            await validate(token)
+        assert e.value.status_code == 401
+    assert await validate("secret") is None
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import socket
+import time
+from typing import List
+
+import pytest
+
+from app.domain.chat.entities import ChatOutputChunk
+from app.domain.chat.entities import ChunkOutput
+from app.domain.chat.entities import ToolOutput
+from app.service.chat import chat_stream
+from app.service.chat.chat_stream import StreamFormat
+
+TOOL = ToolOutput(tool_call_id="call", name="search", arguments="{}", result="")
+
+
+async def _stream(chunks: List, delay: float = 0):
+    for chunk in chunks:
+        await asyncio.sleep(delay)
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield chunk
+
+
+async def _coalesce(chunks, window_seconds=0.02, window_bytes=256, delay=0):
+    return [
+        chunk
+        async for chunk in chat_stream.coalesce(
+            _stream(chunks, delay), window_seconds, window_bytes
+        )
+    ]
+
+
+async def test_deltas_are_coalesced_up_to_the_byte_window():
+    deltas = [ChunkOutput(content="token ") for _ in range(100)]
+
+    chunks = await _coalesce(deltas, window_seconds=10, window_bytes=60)
+
+    assert "".join(c.content for c in chunks) == "token " * 100
+    assert [len(c.content) for c in chunks] == [60] * 10
+
+
+async def test_other_chunks_flush_held_content():
+    chunks = await _coalesce(
+        [ChunkOutput("a"), ChunkOutput("b"), TOOL, ChunkOutput("c")], window_seconds=10
+    )
+
+    assert chunks == [ChunkOutput("ab"), TOOL, ChunkOutput("c")]
+
+
+async def test_held_content_is_written_after_the_time_window():
+    received = []
+
+    async def _slow():
+        yield ChunkOutput("a")
+        await asyncio.sleep(0.5)
+        yield ChunkOutput("b")
+
+    start = time.monotonic()
+    async for chunk in chat_stream.coalesce(_slow(), 0.02, 256):
+        received.append((chunk.content, time.monotonic() - start))
+
+    assert [content for content, _ in received] == ["a", "b"]
+    assert received[0][1] < 0.25
+
+
+async def test_errors_are_raised_after_held_content():
+    chunks = []
+    with pytest.raises(ValueError):
+        async for chunk in chat_stream.coalesce(
+            _stream([ChunkOutput("a"), ValueError()]), 10, 256
+        ):
+            chunks.append(chunk)
+
+    assert chunks == [ChunkOutput("a")]
+
+
+def test_sse_is_negotiated_by_accept_header():
+    assert chat_stream.get_format(None) == StreamFormat.NDJSON
+    assert chat_stream.get_format("*/*") == StreamFormat.NDJSON
+    assert chat_stream.get_format("text/event-stream") == StreamFormat.SSE
+    assert (
+        chat_stream.encode({"content": "é"}, StreamFormat.SSE)
+        == 'data: {"content":"é"}\n\n'.encode()
+    )
+    assert chat_stream.encode({"content": "é"}, StreamFormat.NDJSON) == (
+        '{"content":"é"}\n'.encode()
+    )
+
+
+async def _measure(encoded) -> dict:
+    """
+    Writes every piece to a socket like the server would
+    """
+    writer, reader = socket.socketpair()
+    reader.setblocking(False)
+    writes = 0
+    sent = 0
+    start = time.process_time()
+    async for piece in encoded:
+        data = piece if isinstance(piece, bytes) else piece.encode()
+        writer.sendall(data)
+        writes += 1
+        sent += len(data)
+        try:
+            while reader.recv(65536):
+                pass
+        except BlockingIOError:
+            pass
+    cpu = time.process_time() - start
+    writer.close()
+    reader.close()
+    return {"writes": writes, "bytes": sent, "cpu_ms": cpu * 1000}
+
+
+def _get_cpu(measurement: dict) -> float:
+    return measurement["cpu_ms"]
+
+
+def _get_deltas() -> List[ChatOutputChunk]:
+    # Mostly one or two tokens, like the deltas of a streamed completion
+    words = ["Hello", " there", ",", " ça", " va", "?", " The", " answer", " is"]
+    return [ChunkOutput(content=words[i % len(words)]) for i in range(4000)]
+
+
+async def test_stream_bytes_writes_and_cpu_per_response():
+    deltas = _get_deltas()
+
+    async def _before():
+        async for chunk in _stream(deltas):
+            yield json.dumps(chunk.to_serializable_dict()) + "\n"
+
+    async def _after():
+        async for chunk in chat_stream.coalesce(_stream(deltas), 0.02, 256):
+            yield chat_stream.encode(chunk.to_serializable_dict(), StreamFormat.NDJSON)
+
+    # The fastest of a few runs, the others measured noise
+    before = min([await _measure(_before()) for _ in range(3)], key=_get_cpu)
+    after = min([await _measure(_after()) for _ in range(3)], key=_get_cpu)
+
+    print(f"\nper response before: {before}\nper response after: {after}")
+    assert after["writes"] * 10 < before["writes"]
+    assert after["bytes"] * 2 < before["bytes"]
+    assert after["cpu_ms"] < before["cpu_ms"]
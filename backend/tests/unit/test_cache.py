@@ -0,0 +1,36 @@
+import time
+
+from app.cache import TtlLruCache
+
+
+def test_evicts_least_recently_used():
+    cache = TtlLruCache(max_size=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_expired_entry_is_a_miss():
+    cache = TtlLruCache(max_size=2, ttl_seconds=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats.misses == 1
+    assert len(cache) == 0
+
+
+def test_evicts_by_size():
+    cache = TtlLruCache(max_size=100, ttl_seconds=60, max_bytes=10, size_of=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    cache.set("a", "xxx")
+    assert cache.bytes == 7
+    cache.set("c", "xxxxx")
+    # b was the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == "xxx"
+    assert cache.bytes == 8
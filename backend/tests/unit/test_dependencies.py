@@ -0,0 +1,30 @@
+from unittest.mock import patch
+
+from app import dependencies
+
+
+async def test_llm_repository_is_built_once():
+    await dependencies.close()
+    with patch(
+        "app.dependencies.LlmRepository", wraps=dependencies.LlmRepository
+    ) as llm_repository:
+        repository = dependencies.get_llm_repository()
+        repositories = [dependencies.get_llm_repository() for _ in range(1000)]
+
+    assert llm_repository.call_count == 1
+    assert all(r is repository for r in repositories)
+    await dependencies.close()
+
+
+async def test_close_shuts_down_clients():
+    await dependencies.close()
+    llm_repository = dependencies.get_llm_repository()
+    wavespeed_repository = dependencies.get_wavespeed_repository()
+
+    await dependencies.close()
+
+    assert llm_repository.client.is_closed()
+    assert llm_repository.fallback_client.is_closed()
+    assert wavespeed_repository.client.is_closed
+    assert dependencies.get_llm_repository() is not llm_repository
+    await dependencies.close()
@@ -1,5 +1,11 @@
+from typing import Dict
+from typing import List
 from uuid import UUID
 
+from sqlalchemy import Result
+from sqlalchemy.engine.result import IteratorResult
+from sqlalchemy.engine.result import SimpleResultMetaData
+
 from app.domain.users.entities import User
 from uuid_extensions import uuid7
 
@@ -12,3 +18,13 @@ def get_user(
         uid=uid,
         email=email,
     )
+
+
+def get_result(rows: List[Dict]) -> Result:
+    """
+    A SQLAlchemy result holding rows given as column name to value dicts
+    """
+    keys = list(rows[0]) if rows else []
+    return IteratorResult(
+        SimpleResultMetaData(keys), iter([tuple(row.values()) for row in rows])
+    )
@@ -5,3 +5,10 @@ function format {
 function unit-test {
   python -m pytest tests
 }
+
+function download-tokenizers {
+  # Token counting runs offline from these files, see SUPPORTED_MODELS
+  mkdir -p tokenizers
+  python -c 'from tokenizers import Tokenizer; Tokenizer.from_pretrained("deepseek-ai/DeepSeek-V3").save("tokenizers/deepseek-v3.json")'
+  python -c 'from tokenizers import Tokenizer; Tokenizer.from_pretrained("Qwen/Qwen2.5-VL-32B-Instruct").save("tokenizers/qwen2.5-vl.json")'
+}